@@ -0,0 +1,247 @@
+# analytics.py
+# Час у статусах і конверсія по маклерах. Інтервали статусів рахуються з
+# status_events віконними функціями (LEAD по пропозиції), підсумок на
+# пропозицію лежить в offer_analytics і оновлюється інкрементно: між
+# викликами refresh() перераховуються лише пропозиції з новими подіями
+# (водяний знак — meta.analytics_event_id), пачками з короткими
+# транзакціями запису. Медіана і p90 — теж вікнами
+# (ROW_NUMBER / COUNT у розрізі маклера), nearest-rank.
+#
+# Початок життя пропозиції (start_ts) — перший "active", інакше створення.
+
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+WATERMARK_KEY = "analytics_event_id"
+# "<top>:<останній offer_id>" — недобудований прохід до події top
+PENDING_KEY = "analytics_pending"
+# пропозицій на одну транзакцію запису
+REFRESH_BATCH = 500
+
+
+def init(cur: sqlite3.Cursor):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS offer_analytics (
+            offer_id INTEGER PRIMARY KEY,
+            start_ts INTEGER,
+            first_active_ts INTEGER,
+            first_reserve_ts INTEGER,
+            first_closed_ts INTEGER,
+            first_removed_ts INTEGER,
+            active_seconds INTEGER NOT NULL DEFAULT 0,
+            reserve_seconds INTEGER NOT NULL DEFAULT 0,
+            events INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offer_analytics_start ON offer_analytics(start_ts);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offer_analytics_closed ON offer_analytics(first_closed_ts);")
+
+
+# Підсумок по пропозиціях пачки (IN-список) за подіями з id <= top.
+# Інтервал статусу — від події до наступної події тієї ж пропозиції;
+# останній (поточний) статус ще не завершився і в суми не входить.
+_AGG_SQL = """
+WITH ev AS (
+    SELECT e.offer_id, e.status, e.at_ts,
+           LEAD(e.at_ts) OVER (PARTITION BY e.offer_id ORDER BY e.at_ts, e.id) AS next_ts
+    FROM status_events e
+    WHERE e.offer_id IN ({marks}) AND e.id <= ? AND e.at_ts IS NOT NULL
+),
+agg AS (
+    SELECT offer_id,
+           MIN(at_ts) AS first_ts,
+           MIN(CASE WHEN status = 'active' THEN at_ts END) AS first_active_ts,
+           MIN(CASE WHEN status = 'reserve' THEN at_ts END) AS first_reserve_ts,
+           MIN(CASE WHEN status = 'closed' THEN at_ts END) AS first_closed_ts,
+           MIN(CASE WHEN status = 'removed' THEN at_ts END) AS first_removed_ts,
+           SUM(CASE WHEN status = 'active' AND next_ts IS NOT NULL THEN next_ts - at_ts ELSE 0 END) AS active_seconds,
+           SUM(CASE WHEN status = 'reserve' AND next_ts IS NOT NULL THEN next_ts - at_ts ELSE 0 END) AS reserve_seconds,
+           COUNT(*) AS events
+    FROM ev
+    GROUP BY offer_id
+)
+SELECT a.offer_id, COALESCE(a.first_active_ts, o.created_ts, a.first_ts), a.first_active_ts,
+       a.first_reserve_ts, a.first_closed_ts, a.first_removed_ts, a.active_seconds, a.reserve_seconds, a.events
+FROM agg a
+LEFT JOIN offers o ON o.id = a.offer_id;
+"""
+
+_UPSERT_SQL = """
+INSERT INTO offer_analytics (offer_id, start_ts, first_active_ts, first_reserve_ts, first_closed_ts,
+                             first_removed_ts, active_seconds, reserve_seconds, events)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(offer_id) DO UPDATE SET
+    start_ts = excluded.start_ts,
+    first_active_ts = excluded.first_active_ts,
+    first_reserve_ts = excluded.first_reserve_ts,
+    first_closed_ts = excluded.first_closed_ts,
+    first_removed_ts = excluded.first_removed_ts,
+    active_seconds = excluded.active_seconds,
+    reserve_seconds = excluded.reserve_seconds,
+    events = excluded.events;
+"""
+
+_META_SET_SQL = "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value;"
+
+
+def _meta(cur: sqlite3.Cursor, key: str) -> Optional[str]:
+    cur.execute("SELECT value FROM meta WHERE key = ?;", (key,))
+    r = cur.fetchone()
+    return r[0] if r else None
+
+
+def refresh(con: sqlite3.Connection, batch: int = REFRESH_BATCH) -> int:
+    """
+    Доганяє offer_analytics до status_events. Повертає кількість перерахованих пропозицій.
+
+    Підсумки пачки рахуються в транзакції лише на читання (у WAL не
+    заважає записувачу), а пишуться короткою BEGIN IMMEDIATE разом з
+    прогресом: перша побудова на мільйоні подій не тримає блокування запису
+    секундами, а перерваний прохід продовжується з останньої пачки.
+    """
+    cur = con.cursor()
+    wm = int(_meta(cur, WATERMARK_KEY) or 0)
+    pending = _meta(cur, PENDING_KEY)
+    if pending:
+        top, after = (int(x) for x in pending.split(":"))
+    else:
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM status_events;")
+        top, after = int(cur.fetchone()[0]), 0
+        if top <= wm:
+            return 0
+
+    cur.execute(
+        "SELECT DISTINCT offer_id FROM status_events WHERE id > ? AND id <= ? AND offer_id > ? ORDER BY offer_id;",
+        (wm, top, after),
+    )
+    touched = [int(r[0]) for r in cur.fetchall()]
+
+    n = 0
+    for i in range(0, len(touched), batch) or [0]:
+        ids = touched[i:i + batch]
+        rows = []
+        if ids:
+            cur.execute("BEGIN;")
+            try:
+                cur.execute(_AGG_SQL.format(marks=", ".join("?" * len(ids))), (*ids, top))
+                rows = [tuple(r) for r in cur.fetchall()]
+            finally:
+                con.rollback()
+
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            cur.executemany(_UPSERT_SQL, rows)
+            if i + batch >= len(touched):
+                # паралельний прохід міг уже піти далі — назад не відкочуємо
+                if int(_meta(cur, WATERMARK_KEY) or 0) < top:
+                    cur.execute(_META_SET_SQL, (WATERMARK_KEY, str(top)))
+                cur.execute("DELETE FROM meta WHERE key = ?;", (PENDING_KEY,))
+            else:
+                cur.execute(_META_SET_SQL, (PENDING_KEY, f"{top}:{ids[-1]}"))
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        n += len(rows)
+    return n
+
+
+def forget(cur: sqlite3.Cursor, offer_id: int):
+    cur.execute("DELETE FROM offer_analytics WHERE offer_id = ?;", (offer_id,))
+
+
+# Воронка: когорта — пропозиції, що почались у періоді; час до угоди —
+# по угодах, закритих у періоді. broker NULL — підсумок по всіх.
+_FUNNEL_SQL = """
+WITH c AS (
+    SELECT COALESCE(o.broker_username, '') AS broker, a.*
+    FROM offer_analytics a
+    JOIN offers o ON o.id = a.offer_id
+    WHERE a.start_ts >= :start AND a.start_ts < :end
+),
+b AS (
+    SELECT broker, first_reserve_ts, first_closed_ts, first_removed_ts, active_seconds FROM c
+    UNION ALL
+    SELECT NULL, first_reserve_ts, first_closed_ts, first_removed_ts, active_seconds FROM c
+)
+SELECT broker,
+       COUNT(*) AS started,
+       COUNT(first_reserve_ts) AS reserved,
+       COUNT(first_closed_ts) AS closed,
+       COUNT(first_removed_ts) AS removed,
+       AVG(CASE WHEN active_seconds > 0 THEN active_seconds END) AS avg_active_s
+FROM b
+GROUP BY broker;
+"""
+
+_TIME_TO_CLOSE_SQL = """
+WITH d AS (
+    SELECT COALESCE(o.broker_username, '') AS broker, a.first_closed_ts - a.start_ts AS secs
+    FROM offer_analytics a
+    JOIN offers o ON o.id = a.offer_id
+    WHERE a.first_closed_ts >= :start AND a.first_closed_ts < :end AND a.first_closed_ts >= a.start_ts
+),
+b AS (
+    SELECT broker, secs FROM d
+    UNION ALL
+    SELECT NULL, secs FROM d
+),
+r AS (
+    SELECT broker, secs,
+           ROW_NUMBER() OVER (PARTITION BY broker ORDER BY secs) AS rn,
+           COUNT(*) OVER (PARTITION BY broker) AS n
+    FROM b
+)
+SELECT broker, MAX(n) AS deals,
+       MIN(CASE WHEN rn >= 0.5 * n THEN secs END) AS median_s,
+       MIN(CASE WHEN rn >= 0.9 * n THEN secs END) AS p90_s
+FROM r
+GROUP BY broker;
+"""
+
+
+def report(con: sqlite3.Connection, start_ts: int, end_ts: int) -> List[Dict[str, Any]]:
+    """
+    Рядок на маклера (+ підсумок з broker=None першим): started / reserved /
+    closed / removed для когорти періоду, close_rate, deals, median_s, p90_s
+    часу до угоди і avg_active_s — середній час в "active".
+    """
+    params = {"start": start_ts, "end": end_ts}
+    out: Dict[Optional[str], Dict[str, Any]] = {}
+
+    for r in con.execute(_FUNNEL_SQL, params):
+        d = out.setdefault(r["broker"], _empty_row(r["broker"]))
+        for k in ("started", "reserved", "closed", "removed"):
+            d[k] = int(r[k])
+        d["avg_active_s"] = r["avg_active_s"]
+    for r in con.execute(_TIME_TO_CLOSE_SQL, params):
+        d = out.setdefault(r["broker"], _empty_row(r["broker"]))
+        d["deals"] = int(r["deals"])
+        d["median_s"] = r["median_s"]
+        d["p90_s"] = r["p90_s"]
+
+    total = out.pop(None, None) or _empty_row(None)
+    rows = [total] + sorted(out.values(), key=lambda d: (-d["deals"], -d["started"], d["broker"]))
+    for d in rows:
+        d["close_rate"] = d["closed"] / d["started"] if d["started"] else None
+    return rows
+
+
+def _empty_row(broker: Optional[str]) -> Dict[str, Any]:
+    return {
+        "broker": broker, "started": 0, "reserved": 0, "closed": 0, "removed": 0,
+        "avg_active_s": None, "deals": 0, "median_s": None, "p90_s": None,
+    }
+
+
+def fmt_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    if seconds >= 86400:
+        return f"{seconds / 86400:.1f} д"
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} год"
+    return f"{max(seconds, 0) // 60} хв"
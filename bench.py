@@ -0,0 +1,542 @@
+# bench.py
+# Офлайн-бенчмарк бота: справжні router + Dispatcher з bot.py, фейкова
+# Telegram-сесія (мережі немає), синтетичні потоки Update.
+#
+#   python bench.py                          # усі сценарії, порівняння з bench_baseline.json
+#   python bench.py -s wizard -s stats_100k  # вибрані сценарії
+#   python bench.py --save-baseline          # записати поточні цифри як базу
+#   python bench.py --columnar 1000000       # daily_stats з сирих подій: SQL vs NumPy
+#   python bench.py --api-base http://127.0.0.1:8081   # через справжній AiohttpSession
+#                                                       # до fake_api.py (429 / затримки)
+#
+# Кожен сценарій запускається в окремому процесі (чистий peak RSS і свіжий
+# DATA_DIR). Час прогону (updates/s) включає дочікування фонових задач
+# (drain_s). Якщо updates/s або p95 гірші за базу більше ніж на --tolerance
+# чи сценарію немає в базі — код 1; файлу бази немає — код 3.
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+BENCH_GROUP_ID = -1000000000001
+BENCH_TOKEN = "123456789:BENCHbenchBENCHbenchBENCHbenchBENCH"
+
+STATUSES = ["active", "reserve", "removed", "closed"]
+
+
+# =========================
+# FAKE SESSION
+# =========================
+def _load_bot_module(data_dir: str):
+    # bot.py читає ENV при імпорті — виставляємо до import
+    os.environ["BOT_TOKEN"] = BENCH_TOKEN
+    os.environ["GROUP_CHAT_ID"] = str(BENCH_GROUP_ID)
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["DB_PATH"] = os.path.join(data_dir, "database.db")
+    os.environ["ALLOWED_USER_IDS"] = ""
+    os.environ["ADMIN_USER_IDS"] = ""
+    # ліміти Telegram (ratelimit.py) міряли б тут лише сон у лімітері;
+    # справжні бюджети — у сценарії status_burst_limited
+    os.environ.setdefault("TG_GLOBAL_PER_SEC", "100000")
+    os.environ.setdefault("TG_GROUP_PER_MIN", "6000000")
+    # кеш /stats сховав би вартість запиту за повторами сценарію
+    os.environ.setdefault("STATS_CACHE_TTL", "0")
+    sys.path.insert(0, HERE)
+    import bot  # noqa: E402
+
+    return bot
+
+
+def make_fake_session(latency: float = 0.0):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message, User
+
+    class FakeSession(BaseSession):
+        """Відповідає на будь-який метод Bot API правдоподібним результатом, без мережі."""
+
+        def __init__(self):
+            super().__init__()
+            self.latency = latency
+            self.calls: Dict[str, int] = {}
+            self._message_id = 1000
+
+        def _message(self, chat_id) -> Message:
+            self._message_id += 1
+            cid = int(chat_id) if isinstance(chat_id, (int, str)) and str(chat_id).lstrip("-").isdigit() else 1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=cid, type="supergroup" if cid < 0 else "private"),
+            )
+
+        async def make_request(self, bot, method, timeout=None):
+            name = type(method).__name__
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            chat_id = getattr(method, "chat_id", None)
+            if name == "SendMediaGroup":
+                return [self._message(chat_id) for _ in method.media]
+            if name.startswith("Send") or name.startswith("Edit") or name in ("CopyMessage", "ForwardMessage"):
+                return self._message(chat_id)
+            if name == "GetMe":
+                return User(id=int(BENCH_TOKEN.split(":")[0]), is_bot=True, first_name="bench")
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return FakeSession()
+
+
+# =========================
+# SYNTHETIC UPDATES
+# =========================
+class UpdateFactory:
+    def __init__(self):
+        self._update_id = 0
+        self._message_id = 0
+
+    def _ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    @staticmethod
+    def user(uid: int) -> Dict[str, Any]:
+        return {"id": uid, "is_bot": False, "first_name": f"Broker{uid}", "username": f"broker{uid}"}
+
+    def message(self, uid: int, text: Optional[str] = None, photo_id: Optional[str] = None,
+                chat_id: Optional[int] = None) -> Dict[str, Any]:
+        update_id, message_id = self._ids()
+        msg: Dict[str, Any] = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id or uid, "type": "private" if not chat_id else "supergroup"},
+            "from": self.user(uid),
+        }
+        if text is not None:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo_id is not None:
+            msg["photo"] = [
+                {"file_id": f"{photo_id}_s", "file_unique_id": f"{photo_id}_us", "width": 90, "height": 60},
+                {"file_id": photo_id, "file_unique_id": f"u{photo_id}", "width": 1280, "height": 853},
+            ]
+        return {"update_id": update_id, "message": msg}
+
+    def callback(self, uid: int, data: str, chat_id: Optional[int] = None) -> Dict[str, Any]:
+        update_id, message_id = self._ids()
+        chat = chat_id or uid
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self.user(uid),
+                "chat_instance": str(chat),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat, "type": "private" if chat > 0 else "supergroup"},
+                    "text": "…",
+                },
+            },
+        }
+
+    def wizard(self, uid: int, photos: int) -> List[Dict[str, Any]]:
+        """Повний /new → публікація, як його проходить маклер."""
+        ups = [
+            self.message(uid, "/new"),
+            self.callback(uid, "cat:Оренда"),
+            self.callback(uid, "ht:2-кімн."),
+            self.message(uid, f"Obchodná {uid % 97}"),
+            self.message(uid, "Bratislava"),
+            self.message(uid, "Staré Mesto"),
+            self.message(uid, "балкон, ремонт"),
+            self.message(uid, f"{600 + uid % 400}€"),
+            self.message(uid, "1000€"),
+            self.message(uid, "50%"),
+            self.callback(uid, "park:Є"),
+            self.message(uid, "вже"),
+            self.message(uid, "завтра"),
+        ]
+        for i in range(photos):
+            ups.append(self.message(uid, photo_id=f"photo_{uid}_{i}"))
+        ups.append(self.message(uid, "/done"))
+        ups.append(self.callback(uid, "pub"))
+        return ups
+
+
+# =========================
+# SEEDING
+# =========================
+def seed_events(bot, n_events: int, n_brokers: int = 40, days: int = 365, seed: int = 42):
+    """Наповнює поточну БД бота n_events подіями (~4 події на пропозицію)."""
+    import sqlite3
+
+    rnd = random.Random(seed)
+    bot.init_db()
+    con = sqlite3.connect(bot.DB_PATH)
+    cur = con.cursor()
+    now = int(time.time())
+    start = now - days * 86400
+    n_offers = max(1, n_events // 4)
+
+    brokers = [rnd.randrange(n_brokers) for _ in range(n_offers)]
+    created = [rnd.randrange(start, now) for _ in range(n_offers)]
+
+    # генератори, а не списки: на 1M подій не роздуваємо peak RSS сценарію
+    def offers():
+        for i in range(1, n_offers + 1):
+            b = brokers[i - 1]
+            ts = created[i - 1]
+            yield (
+                i, bot.ts_to_iso(ts), ts, "Оренда", "2-кімн.", f"Street {i % 500}", "Bratislava",
+                "Staré Mesto", "", "700€", "700€", "50%", "Є", "вже", "вже",
+                f"@broker{b}", 10_000 + b, "[]", "unknown", 1, BENCH_GROUP_ID, i,
+            )
+
+    def events():
+        for i in range(1, n_offers + 1):
+            b = brokers[i - 1]
+            yield (i, bot.ts_to_iso(created[i - 1]), created[i - 1], "unknown", f"@broker{b}", 10_000 + b)
+        for _ in range(n_events - n_offers):
+            oid = rnd.randrange(1, n_offers + 1)
+            b = brokers[oid - 1]
+            at = rnd.randrange(created[oid - 1], now + 1)
+            yield (oid, bot.ts_to_iso(at), at, rnd.choice(STATUSES), f"@broker{b}", 10_000 + b)
+
+    cur.executemany(
+        """
+        INSERT INTO offers (
+            seq, created_at, created_ts, category, housing_type, street, city, district, advantages,
+            rent, deposit, commission, parking, move_in_from, viewings_from,
+            broker_username, broker_user_id, photos_json, current_status, is_published,
+            published_chat_id, published_message_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """,
+        offers(),
+    )
+    cur.executemany(
+        "INSERT INTO status_events (offer_id, at, at_ts, status, username, user_id) VALUES (?, ?, ?, ?, ?, ?);",
+        events(),
+    )
+    con.commit()
+    con.close()
+    # повторний init_db — міграції / похідні таблиці над уже наповненою БД
+    bot.init_db()
+    return n_offers
+
+
+# =========================
+# RUNNER
+# =========================
+class Harness:
+    def __init__(self, data_dir: str, latency: float = 0.0, api_base: str = ""):
+        if api_base:
+            os.environ["TELEGRAM_API_BASE"] = api_base
+        self.bot_mod = _load_bot_module(data_dir)
+        self.bot_mod.init_db()
+        # з api_base — справжній стек aiogram-сесії (build_bot сам візьме TELEGRAM_API_BASE)
+        self.session = None if api_base else make_fake_session(latency)
+        self.bot = self.bot_mod.build_bot(session=self.session)
+        self.dp = self.bot_mod.build_dispatcher()
+        self.factory = UpdateFactory()
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    async def feed(self, update: Dict[str, Any]):
+        t0 = time.perf_counter()
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception:
+            # TelegramRetryAfter / 5xx від fake_api — рахуємо як помилку, але міряємо
+            self.errors += 1
+        self.latencies.append(time.perf_counter() - t0)
+
+    async def feed_sequential(self, updates: List[Dict[str, Any]]):
+        for u in updates:
+            await self.feed(u)
+
+    async def feed_concurrent(self, streams: List[List[Dict[str, Any]]]):
+        # кожен потік (користувач) — послідовно, потоки між собою — паралельно,
+        # як при start_polling(handle_as_tasks=True)
+        await asyncio.gather(*(self.feed_sequential(s) for s in streams))
+
+    async def drain(self):
+        # фонові задачі хендлерів (синхронізація карток, черга публікацій) — до кінця;
+        # publish-worker живе вічно, для нього чекаємо порожньої черги
+        while True:
+            queue = self.bot_mod._PUBLISH_QUEUE
+            if queue is not None:
+                await queue.join()
+            pending = [t for t in self.bot_mod._BACKGROUND_TASKS
+                       if not t.done() and t.get_name() != "publish-worker"]
+            if not pending and (queue is None or queue.empty()):
+                return
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _scenario_wizard(h: Harness, users: int = 50, photos: int = 6):
+    streams = [h.factory.wizard(20_000 + u, photos) for u in range(users)]
+    await h.feed_concurrent(streams)
+
+
+async def _scenario_status_burst(h: Harness, offers: int = 200, taps: int = 2000):
+    seed_events(h.bot_mod, offers * 4)
+    uid = 10_000
+    rnd = random.Random(7)
+    updates = [
+        h.factory.callback(uid, f"st:{rnd.randrange(1, offers + 1)}:{rnd.choice(STATUSES)}", chat_id=BENCH_GROUP_ID)
+        for _ in range(taps)
+    ]
+    await h.feed_concurrent([updates[i::20] for i in range(20)])
+
+
+async def _scenario_status_burst_limited(h: Harness, offers: int = 3, taps: int = 200, drain_s: float = 180):
+    # ліміти як у проді (типові TG_GLOBAL_PER_SEC / TG_GROUP_PER_MIN бота): натискання
+    # відповідають одразу, редагування карток чекають у лімітері у фоні; wall_s
+    # включає дочікування останнього редагування
+    h.bot_mod.LIMITER = h.bot_mod.ratelimit.TelegramLimiter(global_per_sec=25, group_per_min=18)
+    await _scenario_status_burst(h, offers=offers, taps=taps)
+    deadline = time.monotonic() + drain_s
+    while h.bot_mod._CARD_SYNC_DIRTY and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if h.bot_mod._CARD_SYNC_DIRTY:
+        h.errors += len(h.bot_mod._CARD_SYNC_DIRTY)
+
+
+async def _scenario_album_reorder(h: Harness, albums: int = 40, photos: int = 25):
+    # send_album проти fake_api.py у цьому ж процесі: джитер затримки розставляє
+    # паралельні медіагрупи не по порядку, бот видаляє хвіст (deleteMessages) і
+    # дошле його. Помилка — якщо в чаті лишились зайві фото, порядок зламаний
+    # або шлях перевпорядкування жодного разу не спрацював
+    from aiohttp import web
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    import fake_api
+
+    fake = fake_api.FakeTelegram(fake_api.FaultConfig(latency_ms=2, jitter_ms=20), seed=7)
+    runner = web.AppRunner(fake.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    bot = h.bot_mod.build_bot(session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")))
+    try:
+        for a in range(albums):
+            chat_id = BENCH_GROUP_ID - a
+            t0 = time.perf_counter()
+            ids = await h.bot_mod.send_album(bot, chat_id, [f"p{a}_{i}" for i in range(photos)])
+            h.latencies.append(time.perf_counter() - t0)
+            if len(ids) != photos or ids != sorted(ids) or fake.messages[chat_id] != set(ids):
+                h.errors += 1
+        if not fake.calls.get("deleteMessages"):
+            h.errors += 1
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+
+async def _scenario_stats(h: Harness, events: int, repeats: int = 20):
+    seed_events(h.bot_mod, events)
+    await h.feed_sequential([h.factory.message(10_000, "/stats") for _ in range(repeats)])
+
+
+async def _scenario_export(h: Harness, events: int, repeats: int = 3):
+    seed_events(h.bot_mod, events)
+    await h.feed_sequential([h.factory.message(10_000, "/export all") for _ in range(repeats)])
+
+
+SCENARIOS = {
+    "wizard": lambda h: _scenario_wizard(h),
+    "status_burst": lambda h: _scenario_status_burst(h),
+    "status_burst_limited": lambda h: _scenario_status_burst_limited(h),
+    "album_reorder": lambda h: _scenario_album_reorder(h),
+    "stats_10k": lambda h: _scenario_stats(h, 10_000),
+    "stats_100k": lambda h: _scenario_stats(h, 100_000),
+    "stats_1m": lambda h: _scenario_stats(h, 1_000_000, repeats=5),
+    "export_all_10k": lambda h: _scenario_export(h, 10_000),
+    "export_all_100k": lambda h: _scenario_export(h, 100_000, repeats=1),
+}
+DEFAULT_SCENARIOS = ["wizard", "status_burst", "status_burst_limited", "album_reorder", "stats_10k", "stats_100k", "stats_1m", "export_all_10k"]
+
+
+def compare_daily_paths(events: int) -> Dict[str, Any]:
+    """Перерахунок daily_stats з events подій двома шляхами бота; результати мають збігтися."""
+    import sqlite3
+
+    with tempfile.TemporaryDirectory(prefix="bench_columnar_") as data_dir:
+        bot = _load_bot_module(data_dir)
+        seed_events(bot, events)
+        con = sqlite3.connect(bot.DB_PATH)
+        con.row_factory = sqlite3.Row
+        try:
+            t0 = time.perf_counter()
+            sql_rows = bot._daily_rows_sql(con.cursor())
+            sql_s = time.perf_counter() - t0
+            out = {"events": events, "rows": len(sql_rows), "sql_s": round(sql_s, 3)}
+            if bot.columnar.available():
+                t0 = time.perf_counter()
+                np_rows = bot._daily_rows_columnar(con)
+                np_s = time.perf_counter() - t0
+                out.update(numpy_s=round(np_s, 3), speedup=round(sql_s / np_s, 2),
+                           identical=sorted(sql_rows) == sorted(np_rows))
+        finally:
+            con.close()
+    out["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    return out
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KiB, macOS: байти
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(name: str, latency: float, api_base: str = "") -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as data_dir:
+        h = Harness(data_dir, latency=latency, api_base=api_base)
+
+        async def go():
+            t0 = time.perf_counter()
+            await SCENARIOS[name](h)
+            fed = time.perf_counter()
+            # фонова робота апдейтів (картки, черга публікацій) — теж частина прогону
+            await h.drain()
+            end = time.perf_counter()
+            await h.bot.session.close()
+            return end - t0, end - fed
+
+        wall, drain = asyncio.run(go())
+        lat = sorted(h.latencies)
+        return {
+            "scenario": name,
+            "updates": len(lat),
+            "wall_s": round(wall, 3),
+            "drain_s": round(drain, 3),
+            "ups": round(len(lat) / wall, 1) if wall else 0.0,
+            "p50_ms": round(_percentile(lat, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(lat, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(lat, 0.99) * 1000, 2),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "api_calls": sum(h.session.calls.values()) if h.session is not None else None,
+            "errors": h.errors,
+        }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    failures = []
+    for r in results:
+        base = baseline.get(r["scenario"])
+        if not base:
+            failures.append(f"{r['scenario']}: no baseline (run with --save-baseline)")
+            continue
+        if base.get("ups") and r["ups"] < base["ups"] * (1 - tolerance):
+            failures.append(f"{r['scenario']}: updates/s {r['ups']} < baseline {base['ups']}")
+        if base.get("p95_ms") and r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            failures.append(f"{r['scenario']}: p95 {r['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        if base.get("peak_rss_mb") and r["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            failures.append(f"{r['scenario']}: peak RSS {r['peak_rss_mb']} MB > baseline {base['peak_rss_mb']} MB")
+    return failures
+
+
+def _print_table(results: List[Dict[str, Any]]):
+    cols = ["scenario", "updates", "ups", "drain_s", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "api_calls", "errors"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Offline dispatcher benchmark")
+    ap.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="can repeat")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed regression fraction")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="fake Bot API latency per call")
+    ap.add_argument("--api-base", default="", help="use the real aiohttp session against this Bot API base URL")
+    ap.add_argument("--columnar", type=int, metavar="EVENTS", help="only compare SQL vs NumPy daily_stats rebuild")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.columnar:
+        print(json.dumps(compare_daily_paths(args.columnar)))
+        return 0
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.latency_ms / 1000, args.api_base)))
+        return 0
+
+    names = args.scenario or DEFAULT_SCENARIOS
+    results = []
+    for name in names:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name,
+             "--latency-ms", str(args.latency_ms), "--api-base", args.api_base],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            print(f"!! scenario {name} crashed", file=sys.stderr)
+            return 2
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    _print_table(results)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update({r["scenario"]: r for r in results})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline saved: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n!!! NO BASELINE at {args.baseline}; run with --save-baseline", file=sys.stderr)
+        return 3
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    failures = compare(results, baseline, args.tolerance)
+    if failures:
+        print("\n!!! PERFORMANCE REGRESSION !!!", file=sys.stderr)
+        for line in failures:
+            print("  " + line, file=sys.stderr)
+        return 1
+    print("OK: within tolerance of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,27 +12,57 @@
 # 2) Паркінг: можна обрати кнопкою або вписати текстом
 
 import os
+import csv
 import json
+import time
 import asyncio
+import logging
 import sqlite3
+import re
+import shlex
+import hashlib
+import functools
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, List, Iterator, Iterable, Callable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from aiogram import Bot, Dispatcher, Router, F, types
+from aiogram import Bot, Dispatcher, Router, F, types, BaseMiddleware
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.state import StatesGroup, State
 
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError, TelegramBadRequest
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.types import FSInputFile
 
+import metrics
+import analytics
+import columnar
+import models
+import dedup
+import suggest
+import snapshot
+from models import Offer, StatusEvent
+import loopwatch
+import profiling
+import recorder
+import ratelimit
+import tenants
+
 try:
-    from openpyxl import Workbook
+    from openpyxl import Workbook, load_workbook
 except ImportError:
     Workbook = None
+    load_workbook = None
+
+log = logging.getLogger("bot")
 
 
 # =========================
@@ -44,15 +74,138 @@ GROUP_CHAT_ID_RAW = (os.getenv("GROUP_CHAT_ID") or os.getenv("GROUP_ID") or "").
 DATA_DIR = os.getenv("DATA_DIR", "data")
 DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "database.db"))
 
-ALLOWED_USER_IDS_RAW = (os.getenv("ALLOWED_USER_IDS") or "").strip()
-ALLOWED_USER_IDS = set()
-if ALLOWED_USER_IDS_RAW:
-    for part in ALLOWED_USER_IDS_RAW.split(","):
+
+def _parse_id_set(raw: str) -> set:
+    out = set()
+    for part in (raw or "").split(","):
         part = part.strip()
         if part.isdigit():
-            ALLOWED_USER_IDS.add(int(part))
+            out.add(int(part))
+    return out
+
+
+ALLOWED_USER_IDS_RAW = (os.getenv("ALLOWED_USER_IDS") or "").strip()
+ALLOWED_USER_IDS = _parse_id_set(ALLOWED_USER_IDS_RAW)
+
+# Адміни (/admin_metrics). Якщо не задано — адмінами вважаються всі дозволені.
+ADMIN_USER_IDS = _parse_id_set(os.getenv("ADMIN_USER_IDS") or "")
+
+LOG_LEVEL = (os.getenv("LOG_LEVEL") or "INFO").strip().upper()
+
+# Інший Bot API сервер (локальний telegram-bot-api або fake_api.py для тестів)
+TELEGRAM_API_BASE = (os.getenv("TELEGRAM_API_BASE") or "").strip().rstrip("/")
+
+# Prometheus-ендпоінт: METRICS_PORT=0 — вимкнено
+METRICS_HOST = (os.getenv("METRICS_HOST") or "127.0.0.1").strip()
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "0")
+
+# Сторож event loop: поріг лагу, після якого знімаємо стек хендлера
+LOOP_WATCHDOG = (os.getenv("LOOP_WATCHDOG") or "1").strip() != "0"
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS") or "250")
+LOOP_LAG_INTERVAL_MS = int(os.getenv("LOOP_LAG_INTERVAL_MS") or "100")
+DIAG_LOG_PATH = os.getenv("DIAG_LOG_PATH", os.path.join(DATA_DIR, "diagnostics.log"))
+
+# cProfile для частки апдейтів / повільних апдейтів (вмикається і через /profile)
+PROFILE_ENABLED = (os.getenv("PROFILE_ENABLED") or "0").strip() == "1"
+PROFILE_RATE = float(os.getenv("PROFILE_RATE") or "0.01")
+PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS") or "0")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# Запис апдейтів для replay.py (персональні дані псевдонімізуються)
+RECORD_UPDATES = (os.getenv("RECORD_UPDATES") or "0").strip() == "1"
+RECORD_PATH = os.getenv("RECORD_PATH", os.path.join(DATA_DIR, "updates.log.gz"))
+RECORD_SALT = (os.getenv("RECORD_SALT") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()).strip()
+RECORD_SCRUB_TEXT = (os.getenv("RECORD_SCRUB_TEXT") or "0").strip() == "1"
+
+# Ліміти вихідних повідомлень (див. ratelimit.py)
+TG_GLOBAL_PER_SEC = float(os.getenv("TG_GLOBAL_PER_SEC") or "25")
+TG_GROUP_PER_MIN = float(os.getenv("TG_GROUP_PER_MIN") or "18")
+
+# Застарілі пропозиції: статус не мінявся STALE_AFTER_DAYS днів (0 — вимкнено,
+# за замовчуванням). STALE_AUTO_REMOVE_DAYS > 0 — якщо маклер не відповів
+# стільки днів після запиту, знімаємо автоматично.
+STALE_AFTER_DAYS = int(os.getenv("STALE_AFTER_DAYS") or "0")
+STALE_STATUSES = [s.strip() for s in (os.getenv("STALE_STATUSES") or "active").split(",") if s.strip()]
+STALE_SWEEP_INTERVAL_MIN = int(os.getenv("STALE_SWEEP_INTERVAL_MIN") or "5")
+STALE_BATCH = int(os.getenv("STALE_BATCH") or "200")
+STALE_AUTO_REMOVE_DAYS = int(os.getenv("STALE_AUTO_REMOVE_DAYS") or "0")
+
+# Неопубліковані чернетки без правок довше DRAFT_TTL_HOURS видаляються (0 — ніколи)
+DRAFT_TTL_HOURS = float(os.getenv("DRAFT_TTL_HOURS") or "48")
+DRAFT_GC_INTERVAL_MIN = int(os.getenv("DRAFT_GC_INTERVAL_MIN") or "60")
+DRAFT_GC_BATCH = int(os.getenv("DRAFT_GC_BATCH") or "200")
+
+# Ранковий дайджест у групу за вчора, локальний час APP_TZ "HH:MM" (порожньо — вимкнено)
+DIGEST_TIME = (os.getenv("DIGEST_TIME") or "").strip()
+
+# Правки опублікованих пропозицій: пауза, за яку зливаємо кілька правок в одне редагування картки
+CARD_SYNC_DELAY = float(os.getenv("CARD_SYNC_DELAY") or "1.5")
+
+# Альбоми: скільки медіагруп (по ≤10 фото) відправляти паралельно
+ALBUM_CONCURRENCY = int(os.getenv("ALBUM_CONCURRENCY") or "3")
+
+# /stats: скільки секунд тримати пораховану статистику періоду
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL") or "60")
+
+# Дублі: крім точного відбитка адреси і ціни шукати і за "кістяком" вулиці (dedup.fuzzy_key)
+DUPLICATE_FUZZY = (os.getenv("DUPLICATE_FUZZY") or "0").strip() == "1"
+
+# Підказки вулиці / міста / району в майстрі: скільки кнопок показувати
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT") or "6")
+
+# Узгоджені копії БД (snapshot.py) для експорту і резервних копій:
+# сторінок за крок і пауза між кроками, щоб не тримати записувача
+SNAPSHOT_PAGES = int(os.getenv("SNAPSHOT_PAGES") or "256")
+SNAPSHOT_PAUSE_MS = float(os.getenv("SNAPSHOT_PAUSE_MS") or "5")
+
+# Резервні копії: кожні BACKUP_INTERVAL_HOURS (0 — вимкнено), лишаємо BACKUP_KEEP останніх
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(DATA_DIR, "backups"))
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS") or "24")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP") or "7")
+
+# /import: рядків в одній транзакції
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK") or "500")
+
+# IANA-зона для "сьогодні / цей місяць / цей рік" у статистиці та експорті
+APP_TZ_NAME = (os.getenv("APP_TZ") or "Europe/Bratislava").strip()
+try:
+    APP_TZ = ZoneInfo(APP_TZ_NAME)
+except (ZoneInfoNotFoundError, ValueError):
+    APP_TZ = timezone.utc
+
+
+# Ролі користувачів (таблиця users): як часто перевіряти версію списку в БД
+USERS_CACHE_TTL = float(os.getenv("USERS_CACHE_TTL") or "30")
+
+# Кілька агенцій: tenants.json (див. tenants.py). Без файлу — одна агенція з ENV вище.
+TENANTS_FILE = os.getenv("TENANTS_FILE", os.path.join(DATA_DIR, "tenants.json"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or "32")
+DB_POOL_IDLE_S = float(os.getenv("DB_POOL_IDLE_S") or "300")
+# скільки Offer на агенцію тримати в пам'яті (перевірка по offers.version)
+OFFER_CACHE_SIZE = int(os.getenv("OFFER_CACHE_SIZE") or "512")
+
 
-APP_TZ = timezone.utc  # за потреби можна змінити
+def _load_tenant_registry() -> tenants.TenantRegistry:
+    if os.path.exists(TENANTS_FILE):
+        items = tenants.load_tenants(
+            TENANTS_FILE, DATA_DIR,
+            defaults={"digest_time": DIGEST_TIME, "stale_after_days": STALE_AFTER_DAYS},
+        )
+        return tenants.TenantRegistry(items)
+    try:
+        group_id = int(GROUP_CHAT_ID_RAW)
+    except ValueError:
+        group_id = None
+    default = tenants.Tenant(
+        "default", DB_PATH, group_chat_id=group_id,
+        allowed_user_ids=ALLOWED_USER_IDS, admin_user_ids=ADMIN_USER_IDS,
+        digest_time=DIGEST_TIME, stale_after_days=STALE_AFTER_DAYS,
+    )
+    return tenants.TenantRegistry([default], single=True)
+
+
+TENANTS = _load_tenant_registry()
+DB_POOL = tenants.ConnectionPool(max_open=DB_POOL_SIZE, idle_seconds=DB_POOL_IDLE_S)
 
 
 STATUS = {
@@ -65,24 +218,85 @@ STATUS = {
 STATUS_ORDER = ["unknown", "active", "reserve", "removed", "closed"]
 
 
+# =========================
+# METRICS
+# =========================
+HANDLER_SECONDS = metrics.Histogram("bot_handler_seconds", "Handler latency", ("handler",))
+HANDLER_ERRORS = metrics.Counter("bot_handler_errors_total", "Handler exceptions", ("handler",))
+DB_SECONDS = metrics.Histogram("bot_db_seconds", "DB call latency", ("call",))
+API_SECONDS = metrics.Histogram("bot_api_seconds", "Telegram Bot API call latency", ("method",))
+API_ERRORS = metrics.Counter("bot_api_errors_total", "Telegram Bot API call errors", ("method", "error"))
+FSM_TRANSITIONS = metrics.Counter("bot_fsm_transitions_total", "FSM state transitions", ("from_state", "to_state"))
+LOOP_LAG_SECONDS = metrics.Histogram(
+    "bot_loop_lag_seconds", "Event loop wake-up lag",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS = metrics.Counter("bot_loop_stalls_total", "Event loop stalls over threshold", ("handler",))
+CARD_SYNCS = metrics.Counter("bot_card_syncs_total", "Group card re-renders", ("result",))
+STALE_OFFERS = metrics.Counter("bot_stale_offers_total", "Stale offers handled by the sweeper", ("action",))
+STATS_CACHE = metrics.Counter("bot_stats_cache_total", "Period stats cache lookups", ("result",))
+DRAFTS_GC = metrics.Counter("bot_drafts_gc_total", "Rows / FSM states reclaimed by the draft collector", ("what",))
+SNAPSHOTS = metrics.Counter("bot_snapshots_total", "Consistent DB copies (export / backup)", ("kind", "result"))
+
+
+def db_timed(fn):
+    timed = metrics.timed(DB_SECONDS, fn.__name__)(fn)
+
+    # хелпер, що впав до con.close(), не лишає з'єднання пулу "зайнятим"
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with DB_POOL.scope():
+            return timed(*args, **kwargs)
+
+    return wrapper
+
+
+LIMITER = ratelimit.TelegramLimiter(global_per_sec=TG_GLOBAL_PER_SEC, group_per_min=TG_GROUP_PER_MIN)
+
+PROFILER = profiling.UpdateProfiler(PROFILE_DIR, rate=PROFILE_RATE, slow_ms=PROFILE_SLOW_MS, enabled=PROFILE_ENABLED)
+
+
 # =========================
 # DB
 # =========================
+# пропозиції, видимі в /list і /my: опубліковані або імпортовані (не чернетки).
+# Текст має збігатися з WHERE часткових індексів — інакше SQLite їх не візьме
+LISTED_SQL = "is_published = 1 OR source IS NOT NULL"
+
+
 def ensure_dirs():
     os.makedirs(DATA_DIR, exist_ok=True)
 
 
+def current_tenant() -> tenants.Tenant:
+    t = TENANTS.current()
+    if t is None:
+        raise RuntimeError("no tenant in context")
+    return t
+
+
 def db_conn() -> sqlite3.Connection:
-    ensure_dirs()
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    # з'єднання з БД поточної агенції з пулу; close() повертає його в пул
+    return DB_POOL.get(current_tenant().db_path)
+
+
+def db_snapshot():
+    """Копія БД агенції на цей момент для важких читань (див. snapshot.py); викликати в потоці."""
+    return snapshot.opened(current_tenant().db_path, DATA_DIR, pages=SNAPSHOT_PAGES, pause=SNAPSHOT_PAUSE_MS / 1000)
 
 
+@db_timed
 def init_db():
+    ensure_dirs()
+    folder = os.path.dirname(current_tenant().db_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
     con = db_conn()
     cur = con.cursor()
 
+    # WAL: читачі (копії для експорту / бекапу, звіти в потоках) не блокують записувача
+    cur.execute("PRAGMA journal_mode=WAL;")
+
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS offers (
@@ -125,131 +339,1150 @@ def init_db():
         """
     )
 
+    _migrate_epoch_columns(cur)
+
+    # звідки пропозиція: NULL — майстер /new, 'import' — /import
+    _ensure_column(cur, "offers", "source", "TEXT")
+
+    _migrate_status_changed(cur)
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        """
+    )
+    _migrate_daily_stats(cur)
+
+    # ролі користувачів (ROLES); ENV-списки лишаються як запасний варіант
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            role TEXT NOT NULL,
+            added_by INTEGER,
+            added_ts INTEGER
+        );
+        """
+    )
+
+    # хеш тексту + кнопок картки, яку востаннє відправили в групу
+    _ensure_column(cur, "offers", "published_hash", "TEXT")
+    # +1 на кожен UPDATE рядка — для OfferCache (models.py)
+    _ensure_column(cur, "offers", "version", "INTEGER NOT NULL DEFAULT 0")
+    # час останньої правки — з нього рахується вік чернетки для збирача
+    _ensure_column(cur, "offers", "updated_ts", "INTEGER")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_offers_drafts ON offers(COALESCE(updated_ts, created_ts)) "
+        "WHERE is_published = 0 AND source IS NULL;"
+    )
+
+    _migrate_fingerprints(cur)
+
+    # усі повідомлення опублікованої пропозиції: фото альбому (position —
+    # номер фото) і картка; rendered_hash — для картки
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS offer_messages (
+            offer_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            rendered_hash TEXT,
+            PRIMARY KEY (chat_id, message_id)
+        );
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offer_messages_offer ON offer_messages(offer_id, chat_id);")
+
+    # маршрути публікації: правило (місто, категорія, тип житла) -> чат;
+    # NULL у полі правила — будь-яке значення
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publish_routes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT,
+            category TEXT,
+            housing_type TEXT,
+            chat_id INTEGER NOT NULL
+        );
+        """
+    )
+
+    # /analytics: підсумки по пропозиціях, див. analytics.py
+    analytics.init(cur)
+
+    # /list [status] і /my: keyset-пагінація по seq; часткові індекси — лише
+    # видимі у списку пропозиції (предикат той самий, що в LISTED_SQL)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offers_status_seq ON offers(current_status, seq);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offers_broker_seq ON offers(broker_user_id, seq);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_offers_listed_seq ON offers(seq) WHERE {LISTED_SQL};")
+    cur.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_offers_listed_status_seq ON offers(current_status, seq) WHERE {LISTED_SQL};"
+    )
+
     con.commit()
     con.close()
 
 
-def now_iso() -> str:
-    return datetime.now(tz=APP_TZ).isoformat(timespec="seconds")
+def _table_columns(cur: sqlite3.Cursor, table: str) -> set:
+    cur.execute(f"PRAGMA table_info({table});")
+    return {r["name"] for r in cur.fetchall()}
+
+
+def _ensure_column(cur: sqlite3.Cursor, table: str, column: str, decl: str):
+    if column not in _table_columns(cur, table):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
+
+def _migrate_epoch_columns(cur: sqlite3.Cursor):
+    # Цілі epoch-секунди (UTC) поруч з ISO-рядками: діапазонні запити
+    # по індексу замість порівняння тексту, і межі періодів не залежать від
+    # того, з яким зсувом записано ISO-рядок.
+    _ensure_column(cur, "offers", "created_ts", "INTEGER")
+    _ensure_column(cur, "status_events", "at_ts", "INTEGER")
+
+    # backfill старих рядків (strftime('%s') враховує зсув +HH:MM в ISO)
+    cur.execute(
+        "UPDATE offers SET created_ts = CAST(strftime('%s', created_at) AS INTEGER) "
+        "WHERE created_ts IS NULL AND created_at IS NOT NULL AND created_at != '';"
+    )
+    cur.execute(
+        "UPDATE status_events SET at_ts = CAST(strftime('%s', at) AS INTEGER) "
+        "WHERE at_ts IS NULL AND at IS NOT NULL AND at != '';"
+    )
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offers_created_ts ON offers(created_ts);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_status_events_at_ts ON status_events(at_ts);")
+
+
+def _migrate_status_changed(cur: sqlite3.Cursor):
+    # Час останньої зміни статусу прямо в offers: sweeper застарілих
+    # пропозицій ходить по індексу, а не агрегує status_events.
+    _ensure_column(cur, "offers", "status_changed_ts", "INTEGER")
+    # коли маклеру надіслано запит "ще актуально?" (NULL — не надсилали)
+    _ensure_column(cur, "offers", "stale_notified_ts", "INTEGER")
+    # остання невдала спроба запиту (маклер не запускав бота / заблокував)
+    _ensure_column(cur, "offers", "stale_failed_ts", "INTEGER")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_status_events_offer ON status_events(offer_id);")
+    cur.execute(
+        "UPDATE offers SET status_changed_ts = COALESCE("
+        "(SELECT MAX(e.at_ts) FROM status_events e WHERE e.offer_id = offers.id), created_ts) "
+        "WHERE status_changed_ts IS NULL;"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_offers_stale "
+        "ON offers(current_status, stale_notified_ts, status_changed_ts);"
+    )
+    # кандидати для запиту маклеру: лише ті, кого ще не питали і є кого питати;
+    # решта (старі пропозиції без маклера) в індекс не потрапляє і не сканується.
+    # stale_failed_ts IS NULL — ще не пробували, інакше діапазон лише прострочених повторів
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_offers_stale_due "
+        "ON offers(current_status, stale_failed_ts, status_changed_ts) "
+        "WHERE stale_notified_ts IS NULL AND broker_user_id > 0;"
+    )
+    # раніше позначались і пропозиції без маклера — їх ніхто не питав
+    cur.execute("UPDATE offers SET stale_notified_ts = NULL WHERE stale_notified_ts IS NOT NULL AND NOT broker_user_id > 0;")
+
+
+def _migrate_fingerprints(cur: sqlite3.Cursor):
+    # Пошук дублів (dedup.py): відбитки адреси + ціни і фото за file_unique_id
+    _ensure_column(cur, "offers", "fingerprint", "TEXT")
+    _ensure_column(cur, "offers", "fuzzy_key", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offers_fingerprint ON offers(fingerprint) WHERE fingerprint IS NOT NULL;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offers_fuzzy_key ON offers(fuzzy_key) WHERE fuzzy_key IS NOT NULL;")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS offer_photos (
+            file_unique_id TEXT NOT NULL,
+            offer_id INTEGER NOT NULL,
+            PRIMARY KEY (file_unique_id, offer_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_offer_photos_offer ON offer_photos(offer_id);")
+
+    # backfill один раз на версію ключів (у старих photos_json немає file_unique_id — фото не порівнюємо)
+    cur.execute("SELECT value FROM meta WHERE key = 'fingerprints';")
+    row = cur.fetchone()
+    if row and row["value"] == str(dedup.VERSION):
+        return
+    cur.execute("SELECT id, street, city, district, housing_type, rent FROM offers;")
+    keys = [
+        (dedup.fingerprint(r["street"], r["city"], r["district"], r["housing_type"], r["rent"]),
+         dedup.fuzzy_key(r["street"], r["city"], r["rent"]), r["id"])
+        for r in cur.fetchall()
+    ]
+    # ключі старої версії теж перезаписуємо (і скидаємо в NULL, де тепер None)
+    cur.executemany("UPDATE offers SET fingerprint = ?, fuzzy_key = ? WHERE id = ?;",
+                    [k for k in keys if k[0] or k[1] or row])
+    cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprints', ?);", (str(dedup.VERSION),))
+
+
+def _migrate_daily_stats(cur: sqlite3.Cursor):
+    # Денні агрегати (локальна доба APP_TZ) для /stats і дайджесту:
+    # kind — статус події або 'new' (створена пропозиція). Ведуться
+    # інкрементно разом із записом status_events / offers.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT NOT NULL,
+            username TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            cnt INTEGER NOT NULL,
+            PRIMARY KEY (day, username, kind)
+        ) WITHOUT ROWID;
+        """
+    )
+    cur.execute("SELECT EXISTS (SELECT 1 FROM daily_stats) AS built, EXISTS (SELECT 1 FROM status_events) AS has_events;")
+    r = cur.fetchone()
+    if r["built"] or not r["has_events"]:
+        return
+    _fill_daily_stats(cur)
+
+
+def _daily_rows_sql(cur: sqlite3.Cursor) -> List[Tuple[str, str, str, int]]:
+    # 15-хвилинні кошики в SQL (усі зсуви зон кратні 15 хв),
+    # кошик -> локальна доба вже в Python
+    cur.execute(
+        "SELECT at_ts / 900 AS b, COALESCE(username, '') AS u, status AS k, COUNT(*) AS c "
+        "FROM status_events WHERE at_ts IS NOT NULL GROUP BY b, u, k;"
+    )
+    items = [(int(x["b"]) * 900, x["u"], x["k"], int(x["c"])) for x in cur.fetchall()]
+    cur.execute(
+        "SELECT created_ts / 900 AS b, COALESCE(broker_username, '') AS u, COUNT(*) AS c "
+        "FROM offers WHERE created_ts IS NOT NULL GROUP BY b, u;"
+    )
+    items += [(int(x["b"]) * 900, x["u"], "new", int(x["c"])) for x in cur.fetchall()]
+    return [(*k, v) for k, v in _fold_daily(items).items() if v]
+
+
+def _daily_rows_columnar(con: sqlite3.Connection) -> List[Tuple[str, str, str, int]]:
+    # те саме колонками NumPy: один прохід курсора замість GROUP BY по тексту
+    cols = columnar.concat(columnar.load_status_events(con), columnar.load_created_offers(con))
+    return columnar.daily_counts(cols, local_day)
+
+
+def _fill_daily_stats(cur: sqlite3.Cursor):
+    """Перерахунок daily_stats з сирих подій (таблиця вже має бути порожня)."""
+    if columnar.available():
+        rows = _daily_rows_columnar(cur.connection)
+    else:
+        rows = _daily_rows_sql(cur)
+    cur.executemany(
+        "INSERT INTO daily_stats (day, username, kind, cnt) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (day, username, kind) DO UPDATE SET cnt = cnt + excluded.cnt;",
+        rows,
+    )
+
+
+def local_day(ts: int) -> str:
+    return datetime.fromtimestamp(int(ts), tz=APP_TZ).strftime("%Y-%m-%d")
+
+
+def _fold_daily(items: Iterable[Tuple[int, Optional[str], str, int]]) -> Dict[Tuple[str, str, str], int]:
+    # items: (ts, username, kind, delta) -> {(day, username, kind): сума}
+    acc: Dict[Tuple[str, str, str], int] = {}
+    days: Dict[int, str] = {}  # 15-хв кошик -> доба, зсуви і переходи зон кратні 15 хв
+    for ts, username, kind, delta in items:
+        b = int(ts) // 900
+        day = days.get(b)
+        if day is None:
+            day = days[b] = local_day(b * 900)
+        key = (day, username or "", kind)
+        acc[key] = acc.get(key, 0) + delta
+    return acc
+
+
+def _bump_daily(cur: sqlite3.Cursor, items: Iterable[Tuple[int, Optional[str], str, int]]):
+    # згортаємо локально, далі один UPSERT на ключ
+    acc = _fold_daily(items)
+    cur.executemany(
+        "INSERT INTO daily_stats (day, username, kind, cnt) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (day, username, kind) DO UPDATE SET cnt = cnt + excluded.cnt;",
+        [(*k, v) for k, v in acc.items() if v],
+    )
+
+
+def _unbump_offer(cur: sqlite3.Cursor, offer_id: int, with_new: bool):
+    _unbump_offers(cur, [offer_id], with_new)
+
+
+def _unbump_offers(cur: sqlite3.Cursor, offer_ids: List[int], with_new: bool):
+    # перед видаленням подій / пропозицій — віднімаємо їх з daily_stats
+    marks = ", ".join("?" * len(offer_ids))
+    cur.execute(f"SELECT at_ts, username, status FROM status_events WHERE offer_id IN ({marks}) AND at_ts IS NOT NULL;",
+                offer_ids)
+    items = [(int(r["at_ts"]), r["username"], r["status"], -1) for r in cur.fetchall()]
+    if with_new:
+        cur.execute(
+            "SELECT created_ts, broker_username FROM offers "
+            f"WHERE id IN ({marks}) AND COALESCE(is_published, 0) = 0 AND created_ts IS NOT NULL;",
+            offer_ids,
+        )
+        items += [(int(r["created_ts"]), r["broker_username"], "new", -1) for r in cur.fetchall()]
+    _bump_daily(cur, items)
+
+
+def now_ts() -> int:
+    return int(datetime.now(tz=timezone.utc).timestamp())
+
 
+def ts_to_iso(ts: Optional[int]) -> str:
+    if ts is None:
+        return ""
+    return datetime.fromtimestamp(int(ts), tz=APP_TZ).isoformat(timespec="seconds")
 
-def next_seq() -> int:
+
+@db_timed
+def rebuild_daily_stats() -> int:
     con = db_conn()
     cur = con.cursor()
-    cur.execute("SELECT COALESCE(MAX(seq), 0) + 1 AS next_seq FROM offers;")
-    row = cur.fetchone()
+    cur.execute("BEGIN IMMEDIATE;")
+    try:
+        cur.execute("DELETE FROM daily_stats;")
+        _fill_daily_stats(cur)
+        cur.execute("SELECT COUNT(*) AS n FROM daily_stats;")
+        n = int(cur.fetchone()["n"])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return n
+
+
+@db_timed
+def daily_stats_between(day_from: str, day_to: str) -> List[sqlite3.Row]:
+    """Суми daily_stats за [day_from, day_to) по (username, kind) — діапазон по первинному ключу."""
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(
+        "SELECT username, kind, SUM(cnt) AS cnt FROM daily_stats "
+        "WHERE day >= ? AND day < ? GROUP BY username, kind HAVING SUM(cnt) > 0 ORDER BY username ASC;",
+        (day_from, day_to),
+    )
+    rows = cur.fetchall()
     con.close()
-    return int(row["next_seq"])
+    return rows
 
 
-def update_offer(offer_id: int, **fields):
-    if not fields:
-        return
-    keys = list(fields.keys())
-    vals = [fields[k] for k in keys]
-    sets = ", ".join([f"{k} = ?" for k in keys])
+def meta_get(key: str) -> Optional[str]:
     con = db_conn()
     cur = con.cursor()
-    cur.execute(f"UPDATE offers SET {sets} WHERE id = ?;", (*vals, offer_id))
+    cur.execute("SELECT value FROM meta WHERE key = ?;", (key,))
+    row = cur.fetchone()
+    con.close()
+    return row["value"] if row else None
+
+
+def meta_set(key: str, value: str):
+    con = db_conn()
+    con.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value;",
+        (key, value),
+    )
     con.commit()
     con.close()
 
 
-def get_offer(offer_id: int) -> Optional[sqlite3.Row]:
+@db_timed
+def load_user_roles() -> Tuple[Dict[int, str], str]:
+    """Усі ролі + версія списку (meta.users_version) — одним читанням."""
     con = db_conn()
     cur = con.cursor()
-    cur.execute("SELECT * FROM offers WHERE id = ?;", (offer_id,))
+    cur.execute("SELECT user_id, role FROM users;")
+    roles = {int(r["user_id"]): r["role"] for r in cur.fetchall()}
+    cur.execute("SELECT value FROM meta WHERE key = 'users_version';")
     row = cur.fetchone()
     con.close()
-    return row
+    return roles, (row["value"] if row else "0")
 
 
-def set_status(offer_id: int, status: str, username: str, user_id: int):
-    if status not in STATUS:
-        return
+@db_timed
+def list_users() -> List[sqlite3.Row]:
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute("SELECT user_id, username, role, added_by, added_ts FROM users ORDER BY role, user_id;")
+    rows = cur.fetchall()
+    con.close()
+    return rows
+
+
+def _bump_users_version(cur: sqlite3.Cursor):
+    cur.execute(
+        "INSERT INTO meta (key, value) VALUES ('users_version', '1') "
+        "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;"
+    )
 
-    update_offer(offer_id, current_status=status)
 
+@db_timed
+def set_user_role(user_id: int, role: str, username: str, added_by: int):
     con = db_conn()
     cur = con.cursor()
     cur.execute(
-        "INSERT INTO status_events (offer_id, at, status, username, user_id) VALUES (?, ?, ?, ?, ?);",
-        (offer_id, now_iso(), status, username, user_id),
+        "INSERT INTO users (user_id, username, role, added_by, added_ts) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET role = excluded.role, "
+        "username = COALESCE(NULLIF(excluded.username, ''), users.username);",
+        (user_id, username, role, added_by, now_ts()),
     )
+    _bump_users_version(cur)
     con.commit()
     con.close()
 
 
-def create_offer(broker_username: str, broker_user_id: int) -> int:
-    """
-    Створює пропозицію зі статусом ❔ Невідома
-    і одразу записує подію в status_events (для статистики).
-    """
-    seq = next_seq()
-    created = now_iso()
-
+@db_timed
+def delete_user(user_id: int) -> bool:
     con = db_conn()
     cur = con.cursor()
-    cur.execute(
-        """
-        INSERT INTO offers (
-            seq, created_at, category, housing_type, street, city, district, advantages,
-            rent, deposit, commission, parking, move_in_from, viewings_from,
-            broker_username, broker_user_id, photos_json, current_status, is_published
-        ) VALUES (?, ?, '', '', '', '', '', '', '', '', '', '', '', '', ?, ?, '[]', ?, 0);
-        """,
-        (seq, created, broker_username, broker_user_id, "unknown"),
-    )
+    cur.execute("DELETE FROM users WHERE user_id = ?;", (user_id,))
+    deleted = cur.rowcount > 0
+    if deleted:
+        _bump_users_version(cur)
     con.commit()
-    offer_id = cur.lastrowid
     con.close()
+    return deleted
 
-    # ✅ одразу рахуємо як "Невідома" в статистику
-    set_status(offer_id, "unknown", username=broker_username, user_id=broker_user_id)
 
-    return offer_id
+@db_timed
+def update_offer(offer_id: int, **fields):
+    if not fields:
+        return
+    keys = list(fields.keys())
+    vals = [fields[k] for k in keys]
+    sets = ", ".join([f"{k} = ?" for k in keys])
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(f"UPDATE offers SET {sets}, version = version + 1, updated_ts = ? WHERE id = ?;",
+                (*vals, now_ts(), offer_id))
+    con.commit()
+    con.close()
 
 
-def add_photo(offer_id: int, file_id: str):
-    offer = get_offer(offer_id)
-    if not offer:
-        return
-    try:
-        photos = json.loads(offer["photos_json"] or "[]")
-    except Exception:
-        photos = []
-    photos.append(file_id)
-    update_offer(offer_id, photos_json=json.dumps(photos, ensure_ascii=False))
+# ---------- OFFERS REPOSITORY ----------
+# Запити — незмінні рядки: sqlite3 тримає їх підготовленими в кеші
+# з'єднання, а з'єднання живуть у пулі, тож повторний розбір SQL не
+# потрібен. Offer з кешу віддаємо, якщо offers.version не змінилась.
+_OFFER_BY_ID_SQL = "SELECT * FROM offers WHERE id = ?;"
+_OFFER_VERSION_BY_ID_SQL = "SELECT id, version FROM offers WHERE id = ?;"
+_OFFER_VERSION_BY_SEQ_SQL = "SELECT id, version FROM offers WHERE seq = ?;"
+
+_OFFER_CACHES: Dict[str, models.OfferCache] = {}
+
+
+def _offer_cache() -> models.OfferCache:
+    tid = current_tenant().id
+    c = _OFFER_CACHES.get(tid)
+    if c is None:
+        c = _OFFER_CACHES[tid] = models.OfferCache(OFFER_CACHE_SIZE)
+    return c
+
+
+def _load_offer(cur: sqlite3.Cursor, version_sql: str, key: int) -> Optional[Offer]:
+    cache = _offer_cache()
+    cur.execute(version_sql, (key,))
+    r = cur.fetchone()
+    if r is None:
+        return None
+    offer_id = int(r["id"])
+    hit = cache.get(offer_id)
+    if hit is not None and hit.version == int(r["version"]):
+        cache.hits += 1
+        return hit
+    cache.misses += 1
+    cur.execute(_OFFER_BY_ID_SQL, (offer_id,))
+    row = cur.fetchone()
+    if row is None:
+        cache.drop(offer_id)
+        return None
+    offer = Offer.from_row(row)
+    cache.put(offer)
+    return offer
 
 
-# =========================
-# HELPERS
-# =========================
-def is_allowed(user_id: int) -> bool:
-    if not ALLOWED_USER_IDS:
-        return True
-    return user_id in ALLOWED_USER_IDS
+@db_timed
+def get_offer(offer_id: int) -> Optional[Offer]:
+    con = db_conn()
+    try:
+        return _load_offer(con.cursor(), _OFFER_VERSION_BY_ID_SQL, offer_id)
+    finally:
+        con.close()
 
 
-def esc(s: str) -> str:
-    return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+@db_timed
+def get_offer_by_seq(seq: int) -> Optional[Offer]:
+    con = db_conn()
+    try:
+        return _load_offer(con.cursor(), _OFFER_VERSION_BY_SEQ_SQL, seq)
+    finally:
+        con.close()
 
 
-def offer_title(seq: int) -> str:
-    return f"🏡 <b>ПРОПОЗИЦІЯ #{seq:04d}</b>"
+def iter_status_events(start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+                       con: Optional[sqlite3.Connection] = None) -> Iterator[StatusEvent]:
+    """Події (з seq пропозиції) у хронологічному порядку — для експорту; con — напр. копія з db_snapshot()."""
+    sql = "SELECT se.*, o.seq AS offer_seq FROM status_events se LEFT JOIN offers o ON o.id = se.offer_id"
+    params: Tuple = ()
+    if start_ts is not None:
+        sql += " WHERE se.at_ts >= ? AND se.at_ts < ?"
+        params = (start_ts, end_ts)
+    own = con is None
+    if own:
+        con = db_conn()
+    try:
+        cur = con.cursor()
+        cur.execute(sql + " ORDER BY se.at_ts ASC, se.id ASC;", params)
+        for row in cur:
+            yield StatusEvent.from_row(row)
+    finally:
+        if own:
+            con.close()
 
 
-def offer_text(offer: sqlite3.Row) -> str:
-    seq = int(offer["seq"])
-    status = (offer["current_status"] or "unknown").strip()
-    st = STATUS.get(status, "❔ Невідома")
+@db_timed
+def set_status(offer_id: int, status: str, username: str, user_id: int):
+    if status not in STATUS:
+        return
 
-    def line(emoji: str, label: str, key: str):
-        val = offer[key] or "—"
-        return f"{emoji} <b>{label}:</b> {esc(str(val))}"
+    ts = now_ts()
+    update_offer(offer_id, current_status=status, status_changed_ts=ts, stale_notified_ts=None, stale_failed_ts=None)
 
-    broker = offer["broker_username"] or "—"
-    if broker and not broker.startswith("@"):
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(
+        "INSERT INTO status_events (offer_id, at, at_ts, status, username, user_id) VALUES (?, ?, ?, ?, ?, ?);",
+        (offer_id, ts_to_iso(ts), ts, status, username, user_id),
+    )
+    _bump_daily(cur, [(ts, username, status, 1)])
+    con.commit()
+    con.close()
+
+
+def _apply_status(cur: sqlite3.Cursor, ids: List[int], status: str, username: str, user_id: int, ts: int):
+    # всередині вже відкритої транзакції
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        marks = ",".join("?" * len(part))
+        cur.execute(
+            f"UPDATE offers SET current_status = ?, status_changed_ts = ?, stale_notified_ts = NULL, "
+            f"stale_failed_ts = NULL, version = version + 1 WHERE id IN ({marks});",
+            (status, ts, *part),
+        )
+    at = ts_to_iso(ts)
+    cur.executemany(
+        "INSERT INTO status_events (offer_id, at, at_ts, status, username, user_id) VALUES (?, ?, ?, ?, ?, ?);",
+        [(oid, at, ts, status, username, user_id) for oid in ids],
+    )
+    _bump_daily(cur, [(ts, username, status, len(ids))])
+
+
+@db_timed
+def set_status_many(seqs: List[int], status: str, username: str, user_id: int) -> Dict[str, Any]:
+    """
+    Масова зміна статусу за seq: усі UPDATE і status_events — в одній
+    транзакції. Пропозиції, що вже мають цей статус, не чіпаємо.
+    """
+    if status not in STATUS:
+        raise ValueError("Bad status")
+
+    ts = now_ts()
+    con = db_conn()
+    cur = con.cursor()
+    found: List[models.OfferBrief] = []
+    try:
+        cur.execute("BEGIN IMMEDIATE;")
+        for i in range(0, len(seqs), 500):
+            part = seqs[i:i + 500]
+            marks = ",".join("?" * len(part))
+            cur.execute(f"SELECT {models.OFFER_BRIEF_COLUMNS} FROM offers WHERE seq IN ({marks});", part)
+            found.extend(models.OfferBrief.from_row(r) for r in cur.fetchall())
+
+        changed = [o for o in found if o.current_status != status]
+        _apply_status(cur, [o.id for o in changed], status, username, user_id, ts)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+    found_seqs = {o.seq for o in found}
+    return {
+        "changed": changed,
+        "unchanged": len(found) - len(changed),
+        "missing": [s for s in seqs if s not in found_seqs],
+    }
+
+
+@db_timed
+def create_offer(broker_username: str, broker_user_id: int) -> int:
+    """
+    Створює пропозицію зі статусом ❔ Невідома
+    і одразу записує подію в status_events (для статистики).
+    """
+    created_ts = now_ts()
+
+    con = db_conn()
+    cur = con.cursor()
+    try:
+        # seq — у тій самій транзакції запису, що й INSERT: імпорт роздає блоки
+        # seq під BEGIN IMMEDIATE, і MAX(seq) поза транзакцією міг би їх зачепити
+        cur.execute("BEGIN IMMEDIATE;")
+        cur.execute(
+            """
+            INSERT INTO offers (
+                seq, created_at, created_ts, category, housing_type, street, city, district, advantages,
+                rent, deposit, commission, parking, move_in_from, viewings_from,
+                broker_username, broker_user_id, photos_json, current_status, is_published
+            )
+            SELECT COALESCE(MAX(seq), 0) + 1, ?, ?, '', '', '', '', '', '', '', '', '', '', '', '', ?, ?, '[]', ?, 0
+            FROM offers;
+            """,
+            (ts_to_iso(created_ts), created_ts, broker_username, broker_user_id, "unknown"),
+        )
+        offer_id = cur.lastrowid
+        _bump_daily(cur, [(created_ts, broker_username, "new", 1)])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+    # ✅ одразу рахуємо як "Невідома" в статистику
+    set_status(offer_id, "unknown", username=broker_username, user_id=broker_user_id)
+
+    return offer_id
+
+
+@db_timed
+def add_photo(offer_id: int, file_id: str, file_unique_id: Optional[str] = None) -> int:
+    """Повертає кількість фото після додавання (0 — пропозиції немає)."""
+    offer = get_offer(offer_id)
+    if not offer:
+        return 0
+    photos = [*offer.photos, file_id]
+    update_offer(offer_id, photos_json=json.dumps(photos, ensure_ascii=False))
+    if file_unique_id:
+        # file_id різний у різних ботів / чатів, file_unique_id — той самий файл
+        con = db_conn()
+        con.execute("INSERT OR IGNORE INTO offer_photos (file_unique_id, offer_id) VALUES (?, ?);",
+                    (file_unique_id, offer_id))
+        con.commit()
+        con.close()
+    return len(photos)
+
+
+def refresh_fingerprint(offer: Offer) -> Tuple[Optional[str], Optional[str], bool]:
+    """Перераховує відбитки за поточними полями; пише в БД, лише якщо змінились (третє значення)."""
+    fp = dedup.fingerprint(offer.street, offer.city, offer.district, offer.housing_type, offer.rent)
+    fk = dedup.fuzzy_key(offer.street, offer.city, offer.rent)
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute("SELECT fingerprint, fuzzy_key FROM offers WHERE id = ?;", (offer.id,))
+    r = cur.fetchone()
+    con.close()
+    changed = r is not None and (r["fingerprint"], r["fuzzy_key"]) != (fp, fk)
+    if changed:
+        update_offer(offer.id, fingerprint=fp, fuzzy_key=fk)
+    return fp, fk, changed
+
+
+# ---------- SUGGESTIONS ----------
+# Вулиці / міста / райони опублікованих та імпортованих пропозицій з
+# частотами (suggest.PrefixIndex). Будуються один раз на агенцію при
+# старті, далі доповнюються в пам'яті при публікації і правках.
+SUGGEST_FIELDS = ("street", "city", "district")
+
+_SUGGEST: Dict[str, Dict[str, suggest.PrefixIndex]] = {}
+
+
+@db_timed
+def load_suggest_indexes() -> Dict[str, suggest.PrefixIndex]:
+    con = db_conn()
+    cur = con.cursor()
+    out = {}
+    for field in SUGGEST_FIELDS:
+        idx = out[field] = suggest.PrefixIndex()
+        cur.execute(
+            f"SELECT {field} AS value, COUNT(*) AS n FROM offers "
+            f"WHERE (is_published = 1 OR source IS NOT NULL) AND {field} != '' GROUP BY {field};"
+        )
+        for r in cur.fetchall():
+            idx.add(r["value"], int(r["n"]))
+    con.close()
+    return out
+
+
+def suggest_index(field: str) -> suggest.PrefixIndex:
+    tid = current_tenant().id
+    indexes = _SUGGEST.get(tid)
+    if indexes is None:
+        indexes = _SUGGEST[tid] = load_suggest_indexes()
+    return indexes[field]
+
+
+def suggest_track(offer: Offer, field: Optional[str] = None, new_value: Optional[str] = None):
+    """Нова пропозиція в обігу (field=None) або правка її поля: старе значення -1, нове +1."""
+    if field is None:
+        for f in SUGGEST_FIELDS:
+            suggest_index(f).add(getattr(offer, f))
+        return
+    idx = suggest_index(field)
+    idx.remove(getattr(offer, field))
+    idx.add(new_value)
+
+
+# тільки пропозиції "в обігу": опубліковані або імпортовані, не зняті й не закриті
+_DUP_FILTER = "o.id != ? AND (o.is_published = 1 OR o.source IS NOT NULL) AND o.current_status NOT IN ('removed', 'closed')"
+
+
+@db_timed
+def find_duplicates(offer_id: int, fp: Optional[str], fk: Optional[str], limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Можливі дублі: той самий відбиток адреси і ціни, спільні фото
+    (file_unique_id) і, з DUPLICATE_FUZZY, схожа адреса. Усе — по індексах.
+    """
+    cols = "o.id, o.seq, o.broker_username, o.published_chat_id, o.published_message_id"
+    parts, params = [], []
+    if fp:
+        parts.append(f"SELECT {cols}, 'address' AS reason FROM offers o WHERE o.fingerprint = ? AND {_DUP_FILTER}")
+        params += [fp, offer_id]
+    parts.append(
+        f"SELECT {cols}, 'photos' AS reason FROM offer_photos p JOIN offers o ON o.id = p.offer_id "
+        f"WHERE p.file_unique_id IN (SELECT file_unique_id FROM offer_photos WHERE offer_id = ?) AND {_DUP_FILTER}"
+    )
+    params += [offer_id, offer_id]
+    if DUPLICATE_FUZZY and fk:
+        parts.append(f"SELECT {cols}, 'fuzzy' AS reason FROM offers o WHERE o.fuzzy_key = ? AND {_DUP_FILTER}")
+        params += [fk, offer_id]
+
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(" UNION ALL ".join(parts) + ";", params)
+    rows = cur.fetchall()
+    con.close()
+
+    out: Dict[int, Dict[str, Any]] = {}
+    for r in rows:
+        d = out.setdefault(int(r["id"]), {k: r[k] for k in r.keys() if k != "reason"} | {"reasons": []})
+        if r["reason"] not in d["reasons"]:
+            d["reasons"].append(r["reason"])
+    return sorted(out.values(), key=lambda d: -d["seq"])[:limit]
+
+
+@db_timed
+def add_offer_messages(offer_id: int, chat_id: int, rows: List[Tuple[int, str, int, Optional[str]]]):
+    """rows: (message_id, kind, position, rendered_hash)."""
+    con = db_conn()
+    con.executemany(
+        "INSERT OR REPLACE INTO offer_messages (offer_id, chat_id, message_id, kind, position, rendered_hash) "
+        "VALUES (?, ?, ?, ?, ?, ?);",
+        [(offer_id, chat_id, *r) for r in rows],
+    )
+    con.commit()
+    con.close()
+
+
+@db_timed
+def get_offer_messages(offer_id: int) -> List[sqlite3.Row]:
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(
+        "SELECT chat_id, message_id, kind, position, rendered_hash FROM offer_messages "
+        "WHERE offer_id = ? ORDER BY chat_id, kind, position;",
+        (offer_id,),
+    )
+    rows = cur.fetchall()
+    con.close()
+    return rows
+
+
+@db_timed
+def set_offer_message_hash(chat_id: int, message_id: int, rendered_hash: str):
+    con = db_conn()
+    con.execute(
+        "UPDATE offer_messages SET rendered_hash = ? WHERE chat_id = ? AND message_id = ?;",
+        (rendered_hash, chat_id, message_id),
+    )
+    con.commit()
+    con.close()
+
+
+@db_timed
+def list_routes() -> List[sqlite3.Row]:
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute("SELECT id, city, category, housing_type, chat_id FROM publish_routes ORDER BY id;")
+    rows = cur.fetchall()
+    con.close()
+    return rows
+
+
+@db_timed
+def add_route(chat_id: int, city: Optional[str], category: Optional[str], housing_type: Optional[str]) -> int:
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(
+        "INSERT INTO publish_routes (city, category, housing_type, chat_id) VALUES (?, ?, ?, ?);",
+        (city or None, category or None, housing_type or None, chat_id),
+    )
+    con.commit()
+    route_id = cur.lastrowid
+    con.close()
+    return route_id
+
+
+@db_timed
+def delete_route(route_id: int) -> bool:
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute("DELETE FROM publish_routes WHERE id = ?;", (route_id,))
+    con.commit()
+    deleted = cur.rowcount > 0
+    con.close()
+    return deleted
+
+
+@db_timed
+def delete_draft(offer_id: int) -> bool:
+    """
+    Скасовано до публікації — прибираємо і offer, і status_events. Перевірка
+    і видалення — в одній транзакції запису: якщо паралельно встигла пройти
+    публікація, нічого не чіпаємо. Повертає, чи чернетку видалено.
+    """
+    con = db_conn()
+    cur = con.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE;")
+        cur.execute("SELECT is_published FROM offers WHERE id = ?;", (offer_id,))
+        row = cur.fetchone()
+        if row is None or int(row["is_published"] or 0) != 0:
+            con.rollback()
+            return False
+        _unbump_offer(cur, offer_id, with_new=True)
+        analytics.forget(cur, offer_id)
+        cur.execute("DELETE FROM offer_photos WHERE offer_id = ?;", (offer_id,))
+        cur.execute("DELETE FROM status_events WHERE offer_id = ?;", (offer_id,))
+        cur.execute("DELETE FROM offers WHERE id = ?;", (offer_id,))
+        con.commit()
+        return True
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+# =========================
+# HELPERS
+# =========================
+ROLES = {
+    "broker": {"use"},
+    "manager": {"use", "export", "bulk_status", "import", "analytics"},
+    "admin": {"use", "export", "bulk_status", "import", "analytics", "admin_metrics", "admin"},
+}
+ROLE_LABELS = {"broker": "маклер", "manager": "менеджер", "admin": "адмін"}
+
+
+class RoleCache:
+    """Ролі агенції в пам'яті; перечитуються, лише коли змінилась meta.users_version."""
+
+    def __init__(self):
+        self.roles: Dict[int, str] = {}
+        self.version: Optional[str] = None
+        self.checked = 0.0
+
+
+_ROLE_CACHES: Dict[str, RoleCache] = {}
+
+
+def _role_cache(t: tenants.Tenant) -> RoleCache:
+    c = _ROLE_CACHES.get(t.id)
+    if c is None:
+        c = _ROLE_CACHES[t.id] = RoleCache()
+    now = time.monotonic()
+    # у БД ходимо не частіше за USERS_CACHE_TTL (зміни з цього процесу — одразу, див. invalidate_roles)
+    if c.version is None or now - c.checked >= USERS_CACHE_TTL:
+        c.checked = now
+        roles, version = load_user_roles()
+        if version != c.version:
+            c.roles, c.version = roles, version
+    return c
+
+
+def invalidate_roles():
+    c = _ROLE_CACHES.get(current_tenant().id)
+    if c is not None:
+        c.version = None
+
+
+def user_role(user_id: int) -> Optional[str]:
+    t = TENANTS.current()
+    if t is None:
+        return None
+    if user_id in t.admin_user_ids:
+        return "admin"
+    cache = _role_cache(t)
+    role = cache.roles.get(user_id)
+    if role in ROLES:
+        return role
+    # ENV-списки як раніше: дозволені без окремих адмінів — адміни, інакше менеджери
+    if user_id in t.allowed_user_ids:
+        return "manager" if t.admin_user_ids else "admin"
+    if not t.allowed_user_ids and not t.admin_user_ids and not cache.roles:
+        # нічого не налаштовано — відкритий режим, як до ролей
+        return "admin"
+    return None
+
+
+def has_perm(user_id: int, perm: str) -> bool:
+    role = user_role(user_id)
+    return role is not None and perm in ROLES[role]
+
+
+def is_allowed(user_id: int) -> bool:
+    return has_perm(user_id, "use")
+
+
+def is_admin(user_id: int) -> bool:
+    return has_perm(user_id, "admin")
+
+
+async def require_perm(message: types.Message, perm: str) -> bool:
+    # чужим — мовчки, як і раніше; своїм без права — пояснюємо
+    if has_perm(message.from_user.id, perm):
+        return True
+    if is_allowed(message.from_user.id):
+        await message.answer("⛔️ Недостатньо прав для цієї команди.")
+    return False
+
+
+def resolve_group_id() -> Optional[int]:
+    t = TENANTS.current()
+    return t.group_chat_id if t is not None else None
+
+
+def _route_key(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).casefold()
+
+
+def publish_targets(offer: Offer) -> List[int]:
+    """Чати для публікації за publish_routes; без маршрутів — GROUP_CHAT_ID."""
+    routes = list_routes()
+    if not routes:
+        group_id = resolve_group_id()
+        return [group_id] if group_id is not None else []
+
+    out: List[int] = []
+    for r in routes:
+        if all(
+            r[field] is None or _route_key(r[field]) == _route_key(getattr(offer, field))
+            for field in ("city", "category", "housing_type")
+        ):
+            if int(r["chat_id"]) not in out:
+                out.append(int(r["chat_id"]))
+    return out
+
+
+def norm_username(username: str) -> str:
+    username = (username or "").strip()
+    if username and not username.startswith("@"):
+        username = f"@{username}"
+    return username
+
+
+async def tg_call(chat_id: Optional[int], factory: Callable, attempts: int = 5):
+    """
+    Виклик Bot API через LIMITER з повтором: 429 — чекаємо retry_after
+    (і блокуємо чат у лімітері), мережа / 5xx — експоненційна пауза.
+    factory — функція без аргументів, що повертає нову корутину.
+    """
+    delay = 1.0
+    for attempt in range(1, attempts + 1):
+        await LIMITER.acquire(chat_id)
+        try:
+            return await factory()
+        except TelegramRetryAfter as e:
+            LIMITER.penalize(chat_id, e.retry_after)
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError):
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+_BACKGROUND_TASKS: set = set()
+
+
+def spawn(coro, name: str) -> asyncio.Task:
+    # тримаємо посилання, інакше задачу може прибрати GC
+    task = asyncio.create_task(coro, name=name)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+def split_album(photos: List[str], size: int = 10) -> List[List[str]]:
+    # рівні частини, а не 10+10+1: одиночне фото не "відвалюється" від альбому
+    if not photos:
+        return []
+    n = -(-len(photos) // size)
+    base, extra = divmod(len(photos), n)
+    out, i = [], 0
+    for k in range(n):
+        step = base + (1 if k < extra else 0)
+        out.append(photos[i:i + step])
+        i += step
+    return out
+
+
+async def send_album(bot: Bot, chat_id: int, photos: List[str], concurrency: int = ALBUM_CONCURRENCY) -> List[int]:
+    """
+    Фото будь-якої кількості: медіагрупи по ≤10, кілька паралельно через LIMITER.
+    Паралельні групи можуть лягти в чат не в тому порядку — тоді хвіст,
+    що вибився з порядку, видаляємо і дошлемо послідовно. Повертає
+    message_id для кожного фото в порядку photos.
+    """
+    chunks = split_album(photos)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def send(chunk: List[str]) -> List[int]:
+        async with sem:
+            if len(chunk) == 1:
+                m = await tg_call(chat_id, lambda: bot.send_photo(chat_id=chat_id, photo=chunk[0]))
+                return [m.message_id]
+            msgs = await tg_call(chat_id, lambda: bot.send_media_group(
+                chat_id=chat_id, media=[types.InputMediaPhoto(media=p) for p in chunk],
+            ))
+            return [m.message_id for m in msgs]
+
+    sent = list(await asyncio.gather(*(send(c) for c in chunks)))
+
+    # порядок у чаті = порядок message_id; лишаємо найдовший правильний префікс
+    keep, last = 0, 0
+    while keep < len(sent) and min(sent[keep]) > last:
+        last = max(sent[keep])
+        keep += 1
+    if keep < len(sent):
+        stray = [mid for ids in sent[keep:] for mid in ids]
+        for i in range(0, len(stray), 100):
+            part = stray[i:i + 100]
+            try:
+                await tg_call(chat_id, lambda: bot.delete_messages(chat_id=chat_id, message_ids=part))
+            except Exception:
+                log.warning("album: cannot delete out-of-order chunk in %s", chat_id, exc_info=True)
+        for k in range(keep, len(sent)):
+            sent[k] = await send(chunks[k])
+    return [mid for ids in sent for mid in ids]
+
+
+def esc(s: str) -> str:
+    return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def message_link(chat_id: Optional[int], message_id: Optional[int]) -> Optional[str]:
+    """t.me/c/... працює лише для супергруп і каналів (id -100...)."""
+    if not chat_id or not message_id or not str(chat_id).startswith("-100"):
+        return None
+    return f"https://t.me/c/{str(chat_id)[4:]}/{message_id}"
+
+
+TG_TEXT_LIMIT = 4096
+_HTML_ATOM_RE = re.compile(r"(<[^>]*>|&#?\w+;)")
+_HTML_TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def _cut_html_line(line: str, size: int) -> List[str]:
+    # задовгий рядок ріжемо між тегами / сутностями, не всередині них
+    if len(line) <= size:
+        return [line]
+    out, cur = [], ""
+    for atom in _HTML_ATOM_RE.split(line):
+        while atom:
+            if len(cur) + len(atom) <= size:
+                cur += atom
+                break
+            if cur:
+                out.append(cur)
+                cur = ""
+                continue
+            if _HTML_ATOM_RE.fullmatch(atom):
+                cur = atom
+                break
+            cur, atom = atom[:size], atom[size:]
+    if cur:
+        out.append(cur)
+    return out
+
+
+def split_html(text: str, limit: int = TG_TEXT_LIMIT) -> List[str]:
+    """
+    Ділить HTML-текст на повідомлення ≤ limit символів, по можливості по
+    межах рядків. Теги, відкриті на межі частин, закриваються в кінці
+    частини і відкриваються знову на початку наступної.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    items: List[Tuple[str, str]] = []
+    for i, line in enumerate(text.split("\n")):
+        pieces = _cut_html_line(line, limit // 2)
+        items.append(("\n" if i else "", pieces[0]))
+        items.extend(("", p) for p in pieces[1:])
+
+    chunks: List[str] = []
+    stack: List[Tuple[str, str]] = []   # (ім'я, відкриваючий тег)
+    cur = ""
+
+    def closing(st: List[Tuple[str, str]]) -> str:
+        return "".join(f"</{name}>" for name, _ in reversed(st))
+
+    for sep, piece in items:
+        after = list(stack)
+        for m in _HTML_TAG_RE.finditer(piece):
+            if m.group(1):
+                for k in range(len(after) - 1, -1, -1):
+                    if after[k][0] == m.group(2).lower():
+                        del after[k]
+                        break
+            else:
+                after.append((m.group(2).lower(), m.group(0)))
+        if cur.strip() and len(cur) + len(sep) + len(piece) + len(closing(after)) > limit:
+            chunks.append(cur + closing(stack))
+            cur = "".join(tag for _, tag in stack) + piece
+        else:
+            cur += sep + piece
+        stack = after
+    if cur.strip():
+        chunks.append(cur + closing(stack))
+    return chunks
+
+
+def offer_title(seq: int) -> str:
+    return f"🏡 <b>ПРОПОЗИЦІЯ #{seq:04d}</b>"
+
+
+def offer_text(offer: Offer) -> str:
+    seq = offer.seq
+    st = STATUS.get(offer.current_status, "❔ Невідома")
+
+    def line(emoji: str, label: str, key: str):
+        val = getattr(offer, key) or "—"
+        return f"{emoji} <b>{label}:</b> {esc(str(val))}"
+
+    broker = offer.broker_username or "—"
+    if broker and not broker.startswith("@"):
         broker = f"@{broker}"
 
     parts = [
@@ -337,6 +1570,17 @@ def kb_preview_actions() -> InlineKeyboardMarkup:
     )
 
 
+def kb_published_edit_actions() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✏️ Редагувати ще", callback_data="edit"),
+                InlineKeyboardButton(text="✅ Готово", callback_data="edit_done"),
+            ],
+        ]
+    )
+
+
 def kb_status_buttons(offer_id: int) -> InlineKeyboardMarkup:
     # статус "Невідома" не робимо кнопкою — це стартовий стан,
     # далі маклер переводить у потрібний статус
@@ -421,10 +1665,18 @@ async def cmd_start(message: types.Message):
         "👋 Привіт!\n\n"
         "Команди:\n"
         "• /new — створити пропозицію\n"
-        "• /stats — статистика (день/місяць/рік)\n"
-        "• /export [all|day|month|year] — Excel\n\n"
+        "• /stats [@маклер] — статистика (день/місяць/рік)\n"
+        "• /export [all|day|month|year] — Excel\n"
+        "• /import [publish] — імпорт пропозицій з Excel / CSV\n"
+        "• /status 120-180,195 removed — масова зміна статусу\n"
+        "• /digest [today] — підсумок за вчора / сьогодні\n"
+        "• /analytics [day|month|year|all] — час до угоди і конверсія\n"
+        "• /list [статус], /my — перегляд пропозицій\n"
+        "• /edit 120 — змінити пропозицію (і картку в групі)\n\n"
         "Підказка: фото додавай у кінці, заверши кнопкою ✅ Готово або /done."
     )
+    if is_admin(message.from_user.id):
+        txt += "\n\nАдмін: /users, /user_set, /user_del, /routes, /stats_rebuild, /backup, /gc"
     await message.answer(txt)
 
 
@@ -452,6 +1704,10 @@ async def cb_category(call: types.CallbackQuery, state: FSMContext):
 
     category = call.data.split(":", 1)[1].strip()
     update_offer(offer_id, category=category)
+    if _editing(data, "category"):
+        await _finish_field_edit(call.message, state, offer_id)
+        await call.answer()
+        return
 
     await state.set_state(OfferFSM.HOUSING_TYPE)
     await call.message.answer("Обери тип житла:", reply_markup=kb_housing_type())
@@ -466,6 +1722,10 @@ async def cb_housing_type(call: types.CallbackQuery, state: FSMContext):
 
     ht = call.data.split(":", 1)[1].strip()
     update_offer(offer_id, housing_type=ht)
+    if _editing(data, "housing_type"):
+        await _finish_field_edit(call.message, state, offer_id)
+        await call.answer()
+        return
 
     await state.set_state(OfferFSM.STREET)
     await call.message.answer("📍 Напиши <b>вулицю</b> (або адресу коротко):")
@@ -490,6 +1750,9 @@ async def msg_housing_type_other(message: types.Message, state: FSMContext):
         return
 
     update_offer(offer_id, housing_type=ht)
+    if _editing(data, "housing_type"):
+        await _finish_field_edit(message, state, offer_id)
+        return
     await state.set_state(OfferFSM.STREET)
     await message.answer("📍 Напиши <b>вулицю</b> (або адресу коротко):")
 
@@ -504,19 +1767,72 @@ async def _save_and_next_text(message: types.Message, state: FSMContext, field:
     await message.answer(prompt)
 
 
+# ---------- STREET / CITY / DISTRICT (з підказками) ----------
+def kb_suggest(values: List[str]) -> Optional[ReplyKeyboardMarkup]:
+    if not values:
+        return None
+    rows = [[KeyboardButton(text=v) for v in values[i:i + 2]] for i in range(0, len(values), 2)]
+    return ReplyKeyboardMarkup(
+        keyboard=rows, resize_keyboard=True, one_time_keyboard=True,
+        input_field_placeholder="Обери або напиши своє",
+    )
+
+
+def suggest_markup(field: Optional[str]):
+    """Найчастіші значення поля кнопками; інакше прибираємо попередню клавіатуру."""
+    if field is None:
+        return ReplyKeyboardRemove()
+    return kb_suggest(suggest_index(field).complete("", SUGGEST_LIMIT)) or ReplyKeyboardRemove()
+
+
+async def _suggested_value(message: types.Message, state: FSMContext, field: str) -> Optional[str]:
+    """
+    Значення поля з урахуванням підказок: відоме значення — у найчастішому
+    написанні; початок відомих — показуємо їх кнопками і повертаємо None
+    (повтор того самого тексту — лишаємо як є).
+    """
+    val = (message.text or "").strip()
+    idx = suggest_index(field)
+    canon = idx.canonical(val)
+    if canon:
+        return canon
+    data = await state.get_data()
+    matches = idx.complete(val, SUGGEST_LIMIT) if val else []
+    if not matches or data.get("suggest_pending") == val:
+        return val
+    await state.update_data({"suggest_pending": val})
+    await message.answer(
+        f"🔎 Є схожі значення — обери кнопкою або надішли «{esc(val)}» ще раз, щоб залишити як є.",
+        reply_markup=kb_suggest(matches + [val]),
+    )
+    return None
+
+
+async def _save_suggested(message: types.Message, state: FSMContext, field: str, next_state: State,
+                          prompt: str, next_field: Optional[str] = None):
+    val = await _suggested_value(message, state, field)
+    if val is None:
+        return
+    data = await state.get_data()
+    update_offer(data["offer_id"], **{field: val})
+    await state.update_data({"suggest_pending": None})
+    await state.set_state(next_state)
+    await message.answer(prompt, reply_markup=suggest_markup(next_field))
+
+
 @router.message(OfferFSM.STREET)
 async def msg_street(message: types.Message, state: FSMContext):
-    await _save_and_next_text(message, state, "street", OfferFSM.CITY, "🏙️ Напиши <b>місто</b>:")
+    await _save_suggested(message, state, "street", OfferFSM.CITY, "🏙️ Напиши <b>місто</b>:", "city")
 
 
 @router.message(OfferFSM.CITY)
 async def msg_city(message: types.Message, state: FSMContext):
-    await _save_and_next_text(message, state, "city", OfferFSM.DISTRICT, "🗺️ Напиши <b>район</b>:")
+    await _save_suggested(message, state, "city", OfferFSM.DISTRICT, "🗺️ Напиши <b>район</b>:", "district")
 
 
 @router.message(OfferFSM.DISTRICT)
 async def msg_district(message: types.Message, state: FSMContext):
-    await _save_and_next_text(message, state, "district", OfferFSM.ADVANTAGES, "✨ Напиши <b>переваги</b> (коротко):")
+    await _save_suggested(message, state, "district", OfferFSM.ADVANTAGES, "✨ Напиши <b>переваги</b> (коротко):")
 
 
 @router.message(OfferFSM.ADVANTAGES)
@@ -553,6 +1869,10 @@ async def cb_parking(call: types.CallbackQuery, state: FSMContext):
     offer_id = data["offer_id"]
     parking = call.data.split(":", 1)[1].strip()
     update_offer(offer_id, parking=parking)
+    if _editing(data, "parking"):
+        await _finish_field_edit(call.message, state, offer_id)
+        await call.answer()
+        return
 
     await state.set_state(OfferFSM.MOVE_IN_FROM)
     await call.message.answer("📦 Напиши <b>заселення від</b> (наприклад 'вже' або дата):")
@@ -570,6 +1890,9 @@ async def msg_parking_text(message: types.Message, state: FSMContext):
         return
 
     update_offer(offer_id, parking=parking)
+    if _editing(data, "parking"):
+        await _finish_field_edit(message, state, offer_id)
+        return
     await state.set_state(OfferFSM.MOVE_IN_FROM)
     await message.answer("📦 Напиши <b>заселення від</b> (наприклад 'вже' або дата):")
 
@@ -595,15 +1918,9 @@ async def msg_photo(message: types.Message, state: FSMContext):
     data = await state.get_data()
     offer_id = data["offer_id"]
 
-    file_id = message.photo[-1].file_id
-    add_photo(offer_id, file_id)
-
-    offer = get_offer(offer_id)
-    try:
-        photos = json.loads(offer["photos_json"] or "[]")
-    except Exception:
-        photos = []
-    await message.answer(f"📸 Фото додано ({len(photos)}). Натисни ✅ Готово або /done.", reply_markup=kb_photos_done())
+    photo = message.photo[-1]
+    count = add_photo(offer_id, photo.file_id, photo.file_unique_id)
+    await message.answer(f"📸 Фото додано ({count}). Натисни ✅ Готово або /done.", reply_markup=kb_photos_done())
 
 
 @router.message(OfferFSM.PHOTOS, Command("done"))
@@ -626,6 +1943,32 @@ async def msg_photos_other(message: types.Message, state: FSMContext):
     await message.answer("📸 Надішли фото або натисни ✅ Готово (/done).", reply_markup=kb_photos_done())
 
 
+_DUP_REASONS = {"address": "та сама адреса і ціна", "photos": "ті самі фото", "fuzzy": "схожа адреса"}
+
+
+def duplicates_text(dups: List[Dict[str, Any]]) -> str:
+    lines = ["⚠️ <b>Схоже на дубль:</b>"]
+    for d in dups:
+        num = f"#{d['seq']:04d}"
+        link = message_link(d["published_chat_id"], d["published_message_id"])
+        if link:
+            num = f'<a href="{link}">{num}</a>'
+        who = esc(d["broker_username"] or "")
+        reasons = " / ".join(_DUP_REASONS[r] for r in d["reasons"])
+        lines.append(f"• {num} {who} — {reasons}")
+    lines.append("Перевір перед публікацією.")
+    return "\n".join(lines)
+
+
+async def warn_duplicates(message: types.Message, offer: Offer, only_if_changed: bool = False):
+    fp, fk, changed = refresh_fingerprint(offer)
+    if only_if_changed and not changed:
+        return
+    dups = find_duplicates(offer.id, fp, fk)
+    if dups:
+        await message.answer(duplicates_text(dups), disable_web_page_preview=True)
+
+
 async def finish_photos_and_preview(message: types.Message, state: FSMContext):
     data = await state.get_data()
     offer_id = data["offer_id"]
@@ -637,15 +1980,11 @@ async def finish_photos_and_preview(message: types.Message, state: FSMContext):
 
     await state.set_state(OfferFSM.PREVIEW)
 
-    try:
-        photos = json.loads(offer["photos_json"] or "[]")
-    except Exception:
-        photos = []
-
-    if photos:
-        media = [types.InputMediaPhoto(media=p) for p in photos[:10]]
-        await message.answer_media_group(media=media)
+    if offer.photos:
+        # в приватному чаті ліміт 1 повідомлення/с — паралельність нічого не дасть
+        await send_album(message.bot, message.chat.id, list(offer.photos), concurrency=1)
 
+    await warn_duplicates(message, offer)
     await message.answer(offer_text(offer), reply_markup=kb_preview_actions())
     await message.answer("👉 Це фінальний вигляд. Обери дію:", reply_markup=kb_preview_actions())
 
@@ -657,14 +1996,8 @@ async def cb_cancel(call: types.CallbackQuery, state: FSMContext):
     offer_id = data.get("offer_id")
     offer = get_offer(offer_id) if offer_id else None
 
-    if offer and int(offer["is_published"] or 0) == 0:
-        # якщо скасовано до публікації — прибираємо і offer, і status_events
-        con = db_conn()
-        cur = con.cursor()
-        cur.execute("DELETE FROM status_events WHERE offer_id = ?;", (offer_id,))
-        cur.execute("DELETE FROM offers WHERE id = ?;", (offer_id,))
-        con.commit()
-        con.close()
+    if offer and not offer.is_published:
+        delete_draft(offer_id)
 
     await state.clear()
     await call.message.answer("❌ Скасовано.")
@@ -683,24 +2016,178 @@ async def cb_edit(call: types.CallbackQuery, state: FSMContext):
         return
 
     await state.set_state(OfferFSM.EDIT_CHOOSE)
-    await call.message.answer(edit_list_text(int(offer["seq"])))
+    await call.message.answer(edit_list_text(offer.seq))
     await call.answer()
 
 
-@router.callback_query(OfferFSM.PREVIEW, F.data == "pub")
-async def cb_publish(call: types.CallbackQuery, state: FSMContext):
-    if not GROUP_CHAT_ID_RAW:
-        await call.message.answer("❗️Не задано GROUP_CHAT_ID / GROUP_ID в Railway (Variables).")
-        await call.answer()
-        return
+# ---------- GROUP CARD SYNC ----------
+def render_card(offer: Offer) -> Tuple[str, InlineKeyboardMarkup]:
+    return offer_text(offer), kb_status_buttons(offer.id)
+
+
+def card_hash(text: str, markup: InlineKeyboardMarkup) -> str:
+    raw = text + "\x00" + markup.model_dump_json(exclude_none=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
 
+async def edit_card(bot: Bot, offer: Offer, chat_id: int, message_id: int,
+                    prev_hash: Optional[str]) -> bool:
+    """
+    Перемальовує одну копію картки; якщо рендер збігається з prev_hash — без
+    виклику API. Повертає True, якщо картку справді редагували.
+    """
+    text, markup = render_card(offer)
+    h = card_hash(text, markup)
+    if h == prev_hash:
+        CARD_SYNCS.inc("unchanged")
+        return False
     try:
-        group_id = int(GROUP_CHAT_ID_RAW)
-    except Exception:
-        await call.message.answer("❗️GROUP_CHAT_ID має бути числом (наприклад -1001234567890).")
-        await call.answer()
+        await tg_call(chat_id, lambda: bot.edit_message_text(
+            chat_id=chat_id, message_id=message_id, text=text, reply_markup=markup,
+        ))
+    except TelegramBadRequest as e:
+        # хеш ще не записаний (стара картка / рестарт), а текст той самий
+        if "not modified" not in str(e):
+            raise
+    set_offer_message_hash(chat_id, message_id, h)
+    if chat_id == offer.published_chat_id and message_id == offer.published_message_id:
+        update_offer(offer.id, published_hash=h)
+    CARD_SYNCS.inc("edited")
+    return True
+
+
+def card_copies(offer: Offer) -> List[Tuple[int, int, Optional[str]]]:
+    """(chat_id, message_id, rendered_hash) усіх копій картки."""
+    copies = [
+        (int(r["chat_id"]), int(r["message_id"]), r["rendered_hash"])
+        for r in get_offer_messages(offer.id) if r["kind"] == "card"
+    ]
+    if not copies and offer.published_message_id:
+        # опубліковано до offer_messages
+        copies = [(offer.published_chat_id, offer.published_message_id, offer.published_hash)]
+    return copies
+
+
+async def sync_group_card(bot: Bot, offer_id: int) -> bool:
+    """Оновлює всі копії картки паралельно (ліміти — окремо для кожного чату)."""
+    offer = get_offer(offer_id)
+    if not offer or not offer.is_published:
+        return False
+    results = await asyncio.gather(
+        *(edit_card(bot, offer, chat_id, mid, h) for chat_id, mid, h in card_copies(offer)),
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, Exception):
+            log.warning("card sync failed for offer %s: %r", offer_id, r)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors and len(errors) == len(results):
+        raise errors[0]
+    return any(r is True for r in results)
+
+
+# (агенція, offer_id) -> "є нові правки"; наявність ключа = воркер для цієї картки вже є
+_CARD_SYNC_DIRTY: Dict[Tuple[str, int], bool] = {}
+
+
+def schedule_card_sync(bot: Bot, offer_id: int, delay: Optional[float] = None):
+    """
+    Відкладене оновлення картки: правки за CARD_SYNC_DELAY зливаються в одне
+    редагування. delay — пауза перед першим проходом (0 — одразу).
+    """
+    key = (current_tenant().id, offer_id)
+    if key in _CARD_SYNC_DIRTY:
+        _CARD_SYNC_DIRTY[key] = True
+        CARD_SYNCS.inc("coalesced")
         return
+    _CARD_SYNC_DIRTY[key] = True
+    # задача успадковує contextvar агенції
+    spawn(_card_sync_worker(bot, key, CARD_SYNC_DELAY if delay is None else delay),
+          f"card-sync-{key[0]}-{offer_id}")
 
+
+async def _card_sync_worker(bot: Bot, key: Tuple[str, int], delay: float):
+    try:
+        while _CARD_SYNC_DIRTY.get(key):
+            await asyncio.sleep(delay)
+            delay = CARD_SYNC_DELAY
+            # правки, що прийдуть під час редагування, дадуть ще один прохід
+            _CARD_SYNC_DIRTY[key] = False
+            try:
+                await sync_group_card(bot, key[1])
+            except Exception:
+                log.warning("card sync failed for offer %s", key[1], exc_info=True)
+                CARD_SYNCS.inc("failed")
+    finally:
+        _CARD_SYNC_DIRTY.pop(key, None)
+
+
+async def _publish_copy(bot: Bot, offer: Offer, photos: List[str], chat_id: int) -> Tuple[int, int, str]:
+    """Альбом + картка в один чат; записує всі message_id в offer_messages."""
+    photo_ids = await send_album(bot, chat_id, photos) if photos else []
+
+    text, markup = render_card(offer)
+    msg = await tg_call(
+        chat_id,
+        lambda: bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            reply_markup=markup,
+        ),
+    )
+
+    h = card_hash(text, markup)
+    add_offer_messages(
+        offer.id, chat_id,
+        [(mid, "photo", i, None) for i, mid in enumerate(photo_ids)] + [(msg.message_id, "card", 0, h)],
+    )
+    return chat_id, msg.message_id, h
+
+
+async def publish_offer(bot: Bot, offer_id: int, chat_ids: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+    """
+    Публікує пропозицію в усі чати маршруту паралельно (у кожного чату свій
+    ліміт у LIMITER). Повертає [(chat_id, message_id картки)] вдалих копій.
+    """
+    offer = get_offer(offer_id)
+    if not offer or offer.is_published:
+        return []
+
+    if chat_ids is None:
+        chat_ids = publish_targets(offer)
+    if not chat_ids:
+        raise RuntimeError("no target chats")
+
+    photos = list(offer.photos)
+
+    results = await asyncio.gather(
+        *(_publish_copy(bot, offer, photos, chat_id) for chat_id in chat_ids),
+        return_exceptions=True,
+    )
+    done = [r for r in results if not isinstance(r, Exception)]
+    for chat_id, r in zip(chat_ids, results):
+        if isinstance(r, Exception):
+            log.warning("publish of offer %s to %s failed: %r", offer_id, chat_id, r)
+    if not done:
+        raise results[0]
+
+    # перша вдала копія — "основна" (published_* для сумісності)
+    chat_id, message_id, h = done[0]
+    update_offer(
+        offer_id,
+        is_published=1,
+        published_chat_id=chat_id,
+        published_message_id=message_id,
+        published_hash=h,
+    )
+    if offer.source is None:
+        # імпортовані вже враховані в підказках при імпорті
+        suggest_track(offer)
+    return [(c, m) for c, m, _ in done]
+
+
+@router.callback_query(OfferFSM.PREVIEW, F.data == "pub")
+async def cb_publish(call: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     offer_id = data["offer_id"]
     offer = get_offer(offer_id)
@@ -710,34 +2197,27 @@ async def cb_publish(call: types.CallbackQuery, state: FSMContext):
         await call.answer()
         return
 
-    if int(offer["is_published"] or 0) == 1:
+    if offer.is_published:
         await call.message.answer("ℹ️ Уже опубліковано.")
         await call.answer()
         return
 
-    try:
-        photos = json.loads(offer["photos_json"] or "[]")
-    except Exception:
-        photos = []
-
-    if photos:
-        media = [types.InputMediaPhoto(media=p) for p in photos[:10]]
-        await call.bot.send_media_group(chat_id=group_id, media=media)
-
-    msg = await call.bot.send_message(
-        chat_id=group_id,
-        text=offer_text(offer),
-        reply_markup=kb_status_buttons(offer_id),
-    )
+    targets = publish_targets(offer)
+    if not targets:
+        if not list_routes():
+            await call.message.answer(
+                "❗️Не задано коректний GROUP_CHAT_ID / GROUP_ID в Railway (Variables), "
+                "наприклад -1001234567890."
+            )
+        else:
+            await call.message.answer("❗️Жоден маршрут (/routes) не підходить для цієї пропозиції.")
+        await call.answer()
+        return
 
-    update_offer(
-        offer_id,
-        is_published=1,
-        published_chat_id=group_id,
-        published_message_id=msg.message_id,
-    )
+    copies = await publish_offer(call.bot, offer_id, targets)
 
-    await call.message.answer(f"✅ Пропозицію #{int(offer['seq']):04d} опубліковано в групу.")
+    where = "в групу" if len(targets) == 1 else f"в {len(copies)} з {len(targets)} груп"
+    await call.message.answer(f"✅ Пропозицію #{offer.seq:04d} опубліковано {where}.")
     await state.clear()
     await call.answer()
 
@@ -783,7 +2263,10 @@ async def msg_edit_choose(message: types.Message, state: FSMContext):
         return
 
     await state.set_state(OfferFSM.EDIT_VALUE)
-    await message.answer(f"✏️ Впиши нове значення для <b>{esc(name)}</b>:")
+    await message.answer(
+        f"✏️ Впиши нове значення для <b>{esc(name)}</b>:",
+        reply_markup=suggest_markup(key if key in SUGGEST_FIELDS else None),
+    )
 
 
 @router.message(OfferFSM.EDIT_VALUE)
@@ -804,13 +2287,67 @@ async def msg_edit_value(message: types.Message, state: FSMContext):
         if val and not val.startswith("@"):
             val = f"@{val}"
 
+    if key in SUGGEST_FIELDS:
+        val = await _suggested_value(message, state, key)
+        if val is None:
+            return
+        await state.update_data({"suggest_pending": None})
+        if offer.is_published or offer.source is not None:
+            suggest_track(offer, key, val)
+
     update_offer(offer_id, **{key: val})
+    await _finish_field_edit(message, state, offer_id)
+
 
+async def _finish_field_edit(message: types.Message, state: FSMContext, offer_id: int):
+    # після правки одного поля — назад до перегляду; опубліковану картку в групі теж оновлюємо
     offer2 = get_offer(offer_id)
+    await state.update_data({"edit_field_key": None, "edit_field_name": None})
     await state.set_state(OfferFSM.PREVIEW)
 
-    await message.answer("✅ Оновлено. Ось новий вигляд:")
-    await message.answer(offer_text(offer2), reply_markup=kb_preview_actions())
+    await message.answer("✅ Оновлено. Ось новий вигляд:", reply_markup=ReplyKeyboardRemove())
+    # попереджаємо лише коли правка змінила адресу / ціну, а не на кожне поле
+    await warn_duplicates(message, offer2, only_if_changed=True)
+    if offer2.is_published:
+        schedule_card_sync(message.bot, offer_id)
+        await message.answer(offer_text(offer2), reply_markup=kb_published_edit_actions())
+    else:
+        await message.answer(offer_text(offer2), reply_markup=kb_preview_actions())
+
+
+def _editing(data: Dict[str, Any], key: str) -> bool:
+    return data.get("edit_field_key") == key
+
+
+@router.message(Command("edit"))
+async def cmd_edit(message: types.Message, state: FSMContext):
+    if not is_allowed(message.from_user.id):
+        return
+    args = (message.text or "").split()[1:]
+    seq = args[0].lstrip("#") if args else ""
+    if not seq.isdigit():
+        await message.answer("❗️Використання: /edit &lt;номер&gt;, наприклад /edit 120")
+        return
+
+    offer = get_offer_by_seq(int(seq))
+    if not offer:
+        await message.answer("❗️Пропозицію не знайдено.")
+        return
+    if offer.broker_user_id != message.from_user.id and not is_admin(message.from_user.id):
+        await message.answer("⛔️ Редагувати можна лише свої пропозиції.")
+        return
+
+    await state.clear()
+    await state.update_data({"offer_id": offer.id})
+    await state.set_state(OfferFSM.EDIT_CHOOSE)
+    await message.answer(edit_list_text(offer.seq))
+
+
+@router.callback_query(OfferFSM.PREVIEW, F.data == "edit_done")
+async def cb_edit_done(call: types.CallbackQuery, state: FSMContext):
+    await state.clear()
+    await call.message.answer("✅ Готово.")
+    await call.answer()
 
 
 # ---------- STATUS BUTTONS (GROUP) ----------
@@ -843,303 +2380,1107 @@ async def cb_status(call: types.CallbackQuery):
 
     set_status(offer_id, status, username=username, user_id=call.from_user.id)
 
-    offer2 = get_offer(offer_id)
-    try:
-        await call.bot.edit_message_text(
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            text=offer_text(offer2),
-            reply_markup=kb_status_buttons(offer_id),
-        )
-    except Exception:
-        pass
+    # усі копії картки (в кожній групі маршруту), включно з тією, де натиснули, —
+    # у фоні: ліміт групи ~20 редагувань/хв, а відповідь на натискання має бути одразу;
+    # серія натискань на одну картку зливається в одне-два редагування
+    schedule_card_sync(call.bot, offer_id, delay=0)
 
     await call.answer("✅ Оновлено", show_alert=False)
 
 
-# =========================
-# STATS
-# =========================
-def _period_bounds(period: str) -> Tuple[datetime, datetime]:
-    now = datetime.now(tz=APP_TZ)
-    if period == "day":
-        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = start + timedelta(days=1)
-        return start, end
-    if period == "month":
-        start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if start.month == 12:
-            end = start.replace(year=start.year + 1, month=1)
-        else:
-            end = start.replace(month=start.month + 1)
-        return start, end
-    if period == "year":
-        start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        end = start.replace(year=start.year + 1)
-        return start, end
-    raise ValueError("Unknown period")
-
-
-def stats_for_period(period: str) -> Dict[str, Any]:
-    start, end = _period_bounds(period)
-    start_iso = start.isoformat(timespec="seconds")
-    end_iso = end.isoformat(timespec="seconds")
-
-    con = db_conn()
-    cur = con.cursor()
+# ---------- BULK STATUS ----------
+BULK_STATUS_MAX = 5000
+BULK_EDIT_CONCURRENCY = int(os.getenv("BULK_EDIT_CONCURRENCY") or "8")
 
-    cur.execute(
-        """
-        SELECT status, COUNT(*) as cnt
-        FROM status_events
-        WHERE at >= ? AND at < ?
-        GROUP BY status;
-        """,
-        (start_iso, end_iso),
-    )
-    rows = cur.fetchall()
-    total = {k: 0 for k in STATUS_ORDER}
-    for r in rows:
-        st = r["status"]
-        if st in total:
-            total[st] = int(r["cnt"])
 
-    cur.execute(
-        """
-        SELECT username, status, COUNT(*) as cnt
-        FROM status_events
-        WHERE at >= ? AND at < ?
-        GROUP BY username, status
-        ORDER BY username ASC;
-        """,
-        (start_iso, end_iso),
-    )
-    rows2 = cur.fetchall()
-    per_broker: Dict[str, Dict[str, int]] = {}
-    for r in rows2:
-        u = r["username"] or "—"
-        st = r["status"]
-        if st not in STATUS:
+def parse_seq_ranges(spec: str, limit: int = BULK_STATUS_MAX) -> List[int]:
+    """'120-180,195' -> [120..180, 195]; ValueError на кривий ввід."""
+    out = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
             continue
-        per_broker.setdefault(u, {k: 0 for k in STATUS_ORDER})
-        per_broker[u][st] = int(r["cnt"])
-
-    con.close()
-
-    label = {
-        "day": start.strftime("%Y-%m-%d"),
-        "month": start.strftime("%Y-%m"),
-        "year": start.strftime("%Y"),
-    }[period]
+        part = part.lstrip("#")
+        if "-" in part:
+            a, b = part.split("-", 1)
+            lo, hi = int(a.lstrip("#")), int(b.lstrip("#"))
+            if lo > hi:
+                lo, hi = hi, lo
+            # перевіряємо до розгортання: "1-1000000000" не повинен будувати множину
+            if hi - lo + 1 + len(out) > limit:
+                raise ValueError(f"не більше {limit} пропозицій за раз")
+            out.update(range(lo, hi + 1))
+        else:
+            out.add(int(part))
+            if len(out) > limit:
+                raise ValueError(f"не більше {limit} пропозицій за раз")
+    if not out:
+        raise ValueError("порожній список")
+    return sorted(out)
+
+
+async def refresh_group_cards(bot: Bot, offers: List[models.OfferBrief], report: Optional[types.Message] = None):
+    """Оновлює картки в групі через лімітер, кілька редагувань паралельно, з прогресом."""
+    targets = [o for o in offers if o.is_published and o.published_message_id]
+    total = len(targets)
+    done = 0
+    failed = 0
+    reported_at = time.monotonic()
+    sem = asyncio.Semaphore(BULK_EDIT_CONCURRENCY)
+
+    async def one(o: models.OfferBrief):
+        nonlocal done, failed, reported_at
+        async with sem:
+            try:
+                await sync_group_card(bot, o.id)
+                done += 1
+            except Exception:
+                log.warning("bulk status: edit failed for offer %s", o.id, exc_info=True)
+                failed += 1
+            if report is not None and time.monotonic() - reported_at >= 10:
+                reported_at = time.monotonic()
+                try:
+                    await report.edit_text(f"🔄 Оновлюю картки в групі: {done + failed}/{total}")
+                except Exception:
+                    pass
+
+    await asyncio.gather(*(one(o) for o in targets))
+
+    if report is None:
+        return
+    text = f"✅ Картки в групі оновлено: {done}/{total}"
+    if failed:
+        text += f" (помилок: {failed})"
+    try:
+        await report.edit_text(text)
+    except Exception:
+        pass
 
-    return {"label": label, "total": total, "per_broker": per_broker}
 
+@router.message(Command("status"))
+async def cmd_bulk_status(message: types.Message):
+    if not await require_perm(message, "bulk_status"):
+        return
 
-def format_stats() -> str:
-    day = stats_for_period("day")
-    month = stats_for_period("month")
-    year = stats_for_period("year")
-
-    def block(title: str, d: Dict[str, Any]) -> str:
-        t = d["total"]
-        return (
-            f"<b>{title} ({d['label']})</b>\n"
-            f"{STATUS['unknown']}: {t['unknown']}\n"
-            f"{STATUS['active']}: {t['active']}\n"
-            f"{STATUS['reserve']}: {t['reserve']}\n"
-            f"{STATUS['removed']}: {t['removed']}\n"
-            f"{STATUS['closed']}: {t['closed']}\n"
-        )
+    usage = (
+        "❗️Використання: /status &lt;номери&gt; &lt;статус&gt;\n"
+        "Наприклад: /status 120-180,195 removed\n"
+        "Статуси: active, reserve, removed, closed"
+    )
+    args = (message.text or "").split()[1:]
+    if len(args) < 2:
+        await message.answer(usage)
+        return
 
-    def broker_block(title: str, d: Dict[str, Any]) -> str:
-        lines = [f"🧑‍💼 <b>{title} — по маклерах ({d['label']})</b>"]
-        if not d["per_broker"]:
-            lines.append("— немає змін статусів")
-            return "\n".join(lines)
+    status = args[-1].lower()
+    if status not in STATUS or status == "unknown":
+        await message.answer(usage)
+        return
+    try:
+        seqs = parse_seq_ranges(",".join(args[:-1]))
+    except ValueError as e:
+        await message.answer(f"❗️{esc(str(e))}\n\n{usage}")
+        return
 
-        for broker, counts in d["per_broker"].items():
-            lines.append(f"\n<b>{esc(broker)}</b>")
-            lines.append(f"  {STATUS['unknown']}: {counts['unknown']}")
-            lines.append(f"  {STATUS['active']}: {counts['active']}")
-            lines.append(f"  {STATUS['reserve']}: {counts['reserve']}")
-            lines.append(f"  {STATUS['removed']}: {counts['removed']}")
-            lines.append(f"  {STATUS['closed']}: {counts['closed']}")
-        return "\n".join(lines)
+    username = norm_username(message.from_user.username or str(message.from_user.id))
+    res = set_status_many(seqs, status, username=username, user_id=message.from_user.id)
 
-    parts = [
-        "📊 <b>Статистика (зміни статусів)</b>\n",
-        block("День", day),
-        block("Місяць", month),
-        block("Рік", year),
-        "",
-        broker_block("День", day),
-        "",
-        broker_block("Місяць", month),
-        "",
-        broker_block("Рік", year),
+    lines = [
+        f"📊 <b>Масова зміна статусу → {STATUS[status]}</b>",
+        f"Змінено: {len(res['changed'])}",
     ]
-    return "\n".join(parts)
+    if res["unchanged"]:
+        lines.append(f"Вже мали цей статус: {res['unchanged']}")
+    if res["missing"]:
+        miss = ", ".join(f"#{s:04d}" for s in res["missing"][:20])
+        more = "…" if len(res["missing"]) > 20 else ""
+        lines.append(f"Не знайдено: {len(res['missing'])} ({miss}{more})")
+    await message.answer("\n".join(lines))
 
+    if any(o.is_published for o in res["changed"]):
+        report = await message.answer("🔄 Оновлюю картки в групі…")
+        spawn(refresh_group_cards(message.bot, res["changed"], report), "bulk-status-edit")
 
-@router.message(Command("stats"))
-async def cmd_stats(message: types.Message):
-    if not is_allowed(message.from_user.id):
-        return
-    await message.answer(format_stats())
 
+# ---------- BROWSE (/list, /my) ----------
+LIST_PAGE_SIZE = 10
 
-# =========================
-# EXPORT (EXCEL)
-# =========================
-def export_to_excel(filepath: str, period: str = "all") -> None:
-    if Workbook is None:
-        raise RuntimeError("openpyxl не встановлений")
 
-    start_iso = None
-    end_iso = None
-    if period in ("day", "month", "year"):
-        start_dt, end_dt = _period_bounds(period)
-        start_iso = start_dt.isoformat(timespec="seconds")
-        end_iso = end_dt.isoformat(timespec="seconds")
+@db_timed
+def list_offers_page(scope: str, user_id: int, before: Optional[int] = None, after: Optional[int] = None,
+                     limit: int = LIST_PAGE_SIZE) -> Tuple[List[models.OfferBrief], bool, bool]:
+    """
+    Сторінка пропозицій від новіших до старіших. Keyset по seq замість OFFSET:
+    before — seq, старіші за який показати (▶), after — новіші (◀).
+    scope: 'all', статус або 'my'. Повертає (rows, є_новіші, є_старіші).
+    """
+    where = [f"({LISTED_SQL})"]
+    params: List[Any] = []
+    if scope == "my":
+        where.append("broker_user_id = ?")
+        params.append(user_id)
+    elif scope in STATUS:
+        where.append("current_status = ?")
+        params.append(scope)
+    cond = " AND ".join(where)
+    cols = models.OFFER_BRIEF_COLUMNS
 
     con = db_conn()
     cur = con.cursor()
-
-    if start_iso and end_iso:
-        cur.execute(
-            "SELECT * FROM offers WHERE created_at >= ? AND created_at < ? ORDER BY seq ASC;",
-            (start_iso, end_iso),
-        )
-    else:
-        cur.execute("SELECT * FROM offers ORDER BY seq ASC;")
-    offers = cur.fetchall()
-
-    if start_iso and end_iso:
-        cur.execute(
-            """
-            SELECT se.*, o.seq AS offer_seq
-            FROM status_events se
-            LEFT JOIN offers o ON o.id = se.offer_id
-            WHERE se.at >= ? AND se.at < ?
-            ORDER BY se.at ASC;
-            """,
-            (start_iso, end_iso),
-        )
+    if after is not None:
+        cur.execute(f"SELECT {cols} FROM offers WHERE {cond} AND seq > ? ORDER BY seq ASC LIMIT ?;",
+                    (*params, after, limit + 1))
+        rows = [models.OfferBrief.from_row(r) for r in cur.fetchall()]
+        has_newer = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        has_older = None
     else:
-        cur.execute(
-            """
-            SELECT se.*, o.seq AS offer_seq
-            FROM status_events se
-            LEFT JOIN offers o ON o.id = se.offer_id
-            ORDER BY se.at ASC;
-            """
-        )
-    events = cur.fetchall()
+        if before is None:
+            cur.execute(f"SELECT {cols} FROM offers WHERE {cond} ORDER BY seq DESC LIMIT ?;", (*params, limit + 1))
+        else:
+            cur.execute(f"SELECT {cols} FROM offers WHERE {cond} AND seq < ? ORDER BY seq DESC LIMIT ?;",
+                        (*params, before, limit + 1))
+        rows = [models.OfferBrief.from_row(r) for r in cur.fetchall()]
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        has_newer = None
+
+    # протилежний напрямок — одна перевірка EXISTS по тому ж індексу
+    if rows and has_older is None:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM offers WHERE {cond} AND seq < ?) AS x;",
+                    (*params, rows[-1].seq))
+        has_older = bool(cur.fetchone()["x"])
+    if rows and has_newer is None:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM offers WHERE {cond} AND seq > ?) AS x;",
+                    (*params, rows[0].seq))
+        has_newer = bool(cur.fetchone()["x"])
     con.close()
+    return rows, bool(has_newer), bool(has_older)
 
-    wb = Workbook()
 
-    ws = wb.active
-    ws.title = "Offers"
-    ws.append(
-        [
-            "SEQ",
-            "CreatedAt",
-            "Status",
-            "Category",
-            "HousingType",
-            "Street",
-            "City",
-            "District",
-            "Advantages",
-            "Rent",
-            "Deposit",
-            "Commission",
-            "Parking",
-            "MoveInFrom",
-            "ViewingsFrom",
-            "Broker",
-            "BrokerUserId",
-            "PhotosCount",
-            "PublishedChatId",
-            "PublishedMessageId",
-        ]
+def list_page_text(scope: str, rows: List[models.OfferBrief]) -> str:
+    title = {"all": "📋 <b>Пропозиції</b>", "my": "📋 <b>Мої пропозиції</b>"}.get(
+        scope, f"📋 <b>Пропозиції: {STATUS.get(scope, scope)}</b>"
     )
+    if not rows:
+        return f"{title}\n\n— нічого не знайдено"
+    lines = [title, ""]
+    for o in rows:
+        st = STATUS.get(o.current_status, STATUS["unknown"]).split()[0]
+        place = ", ".join(esc(x) for x in (o.street, o.city) if x) or "—"
+        rent = f" — {esc(o.rent)}" if o.rent else ""
+        lines.append(f"{st} <b>#{o.seq:04d}</b> {place}{rent}")
+    return "\n".join(lines)
 
-    for r in offers:
-        try:
-            photos = json.loads(r["photos_json"] or "[]")
-        except Exception:
-            photos = []
-        st = (r["current_status"] or "unknown").strip()
-        ws.append(
-            [
-                r["seq"],
-                r["created_at"],
-                STATUS.get(st, st),
-                r["category"],
-                r["housing_type"],
-                r["street"],
-                r["city"],
-                r["district"],
-                r["advantages"],
-                r["rent"],
-                r["deposit"],
-                r["commission"],
-                r["parking"],
-                r["move_in_from"],
-                r["viewings_from"],
-                r["broker_username"],
-                r["broker_user_id"],
-                len(photos),
-                r["published_chat_id"],
-                r["published_message_id"],
-            ]
-        )
-
-    ws2 = wb.create_sheet("StatusEvents")
-    ws2.append(["At", "OfferSEQ", "Status", "Username", "UserId"])
-    for e in events:
-        st = e["status"]
-        ws2.append(
-            [
-                e["at"],
-                e["offer_seq"],
-                STATUS.get(st, st),
-                e["username"],
-                e["user_id"],
-            ]
-        )
 
-    wb.save(filepath)
+def kb_list_page(scope: str, rows: List[models.OfferBrief], has_newer: bool,
+                 has_older: bool) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if rows and has_newer:
+        buttons.append(InlineKeyboardButton(text="◀", callback_data=f"ls:{scope}:a:{rows[0].seq}"))
+    if rows and has_older:
+        buttons.append(InlineKeyboardButton(text="▶", callback_data=f"ls:{scope}:b:{rows[-1].seq}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
 
-@router.message(Command("export"))
-async def cmd_export(message: types.Message):
+@router.message(Command("list"))
+async def cmd_list(message: types.Message):
     if not is_allowed(message.from_user.id):
         return
-
-    if Workbook is None:
-        await message.answer("❗️Додай openpyxl в requirements.txt (openpyxl==3.1.5) і перезапусти деплой.")
+    args = (message.text or "").split()[1:]
+    scope = args[0].lower() if args else "all"
+    if scope not in STATUS and scope != "all":
+        await message.answer("❗️Використання: /list [unknown|active|reserve|removed|closed]")
         return
+    rows, has_newer, has_older = list_offers_page(scope, message.from_user.id)
+    await message.answer(list_page_text(scope, rows), reply_markup=kb_list_page(scope, rows, has_newer, has_older))
 
-    args = (message.text or "").split(maxsplit=1)
-    period = "all"
-    if len(args) == 2:
-        period = args[1].strip().lower()
 
-    if period not in ("all", "day", "month", "year"):
-        await message.answer("❗️Використання: /export [all|day|month|year]\nНаприклад: /export month")
+@router.message(Command("my"))
+async def cmd_my(message: types.Message):
+    if not is_allowed(message.from_user.id):
         return
+    rows, has_newer, has_older = list_offers_page("my", message.from_user.id)
+    await message.answer(list_page_text("my", rows), reply_markup=kb_list_page("my", rows, has_newer, has_older))
 
-    ensure_dirs()
-    ts = datetime.now(tz=APP_TZ).strftime("%Y-%m-%d_%H-%M")
-    filename = f"orenda_export_{period}_{ts}.xlsx"
-    filepath = os.path.join(DATA_DIR, filename)
 
-    try:
-        export_to_excel(filepath, period=period)
-        doc = FSInputFile(filepath, filename=filename)
+@router.callback_query(F.data.startswith("ls:"))
+async def cb_list_page(call: types.CallbackQuery):
+    parts = call.data.split(":")
+    if len(parts) != 4 or parts[2] not in ("a", "b") or not parts[3].isdigit():
+        await call.answer("Помилка", show_alert=False)
+        return
+    if not is_allowed(call.from_user.id):
+        await call.answer()
+        return
+
+    scope, direction, cursor = parts[1], parts[2], int(parts[3])
+    if direction == "a":
+        rows, has_newer, has_older = list_offers_page(scope, call.from_user.id, after=cursor)
+    else:
+        rows, has_newer, has_older = list_offers_page(scope, call.from_user.id, before=cursor)
+
+    try:
+        await call.message.edit_text(
+            list_page_text(scope, rows),
+            reply_markup=kb_list_page(scope, rows, has_newer, has_older),
+        )
+    except Exception:
+        pass
+    await call.answer()
+
+
+# =========================
+# STALE OFFERS
+# =========================
+STALE_KB_ROWS = 20  # пропозицій в одному повідомленні маклеру
+STALE_RETRY_S = 86400  # маклера, якому не вдалось написати, питаємо знову через добу
+
+
+def _stale_filter() -> Tuple[str, List[str]]:
+    statuses = [s for s in STALE_STATUSES if s in STATUS] or ["active"]
+    return f"current_status IN ({','.join('?' * len(statuses))})", statuses
+
+
+@db_timed
+def find_stale_offers(older_than_ts: int, retry_before_ts: int, limit: int) -> List[models.OfferBrief]:
+    """
+    Пачка пропозицій, статус яких не мінявся з older_than_ts і про які маклера
+    ще не питали. Без маклера (broker_user_id) — не беремо: питати нікого, а
+    знімати без питання не можна. Після невдалої спроби — не раніше
+    retry_before_ts. Обидва запити — діапазони по idx_offers_stale_due
+    (умови "stale_notified_ts IS NULL AND broker_user_id > 0" — дослівно як у ньому).
+    """
+    cond, params = _stale_filter()
+    cols = models.OFFER_BRIEF_COLUMNS
+    base = f"FROM offers WHERE {cond} AND stale_notified_ts IS NULL AND broker_user_id > 0"
+    con = db_conn()
+    cur = con.cursor()
+    cur.execute(
+        f"SELECT {cols} {base} AND stale_failed_ts IS NULL AND status_changed_ts < ? "
+        f"ORDER BY status_changed_ts LIMIT ?;",
+        (*params, older_than_ts, limit),
+    )
+    rows = [models.OfferBrief.from_row(r) for r in cur.fetchall()]
+    # повтори після невдалої спроби; невдалі нещодавно — поза діапазоном
+    cur.execute(
+        f"SELECT {cols} {base} AND stale_failed_ts < ? AND status_changed_ts < ? LIMIT ?;",
+        (*params, retry_before_ts, older_than_ts, limit),
+    )
+    rows += [models.OfferBrief.from_row(r) for r in cur.fetchall()]
+    con.close()
+    rows.sort(key=lambda o: o.status_changed_ts)
+    return rows[:limit]
+
+
+@db_timed
+def mark_stale_offers(notified: List[models.OfferBrief], failed: List[models.OfferBrief]):
+    """
+    Позначає результат запиту: stale_notified_ts — лише тим, кого справді
+    спитали (від нього рахує auto_remove_stale), stale_failed_ts — недоставленим.
+    Пропозиції, статус яких змінився, поки надсилали (маклер уже відповів), не чіпаємо.
+    """
+    ts = now_ts()
+    con = db_conn()
+    cur = con.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE;")
+        cur.executemany(
+            "UPDATE offers SET stale_notified_ts = ?, stale_failed_ts = NULL, version = version + 1 "
+            "WHERE id = ? AND status_changed_ts = ? AND stale_notified_ts IS NULL;",
+            [(ts, o.id, o.status_changed_ts) for o in notified],
+        )
+        cur.executemany(
+            "UPDATE offers SET stale_failed_ts = ?, version = version + 1 WHERE id = ? AND status_changed_ts = ?;",
+            [(ts, o.id, o.status_changed_ts) for o in failed],
+        )
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+@db_timed
+def auto_remove_stale(notified_before_ts: int, limit: int) -> List[models.OfferBrief]:
+    """Знімає пропозиції, на доставлений запит по яких маклер не відповів з notified_before_ts."""
+    cond, params = _stale_filter()
+    con = db_conn()
+    cur = con.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE;")
+        cur.execute(
+            f"SELECT {models.OFFER_BRIEF_COLUMNS} FROM offers WHERE {cond} AND stale_notified_ts < ? LIMIT ?;",
+            (*params, notified_before_ts, limit),
+        )
+        rows = [models.OfferBrief.from_row(r) for r in cur.fetchall()]
+        _apply_status(cur, [o.id for o in rows], "removed", "system", 0, now_ts())
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+    return rows
+
+
+def kb_stale_confirm(rows: List[models.OfferBrief]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text=f"#{o.seq:04d} {STATUS['active']}",
+                                     callback_data=f"stale:{o.id}:active"),
+                InlineKeyboardButton(text=STATUS["removed"], callback_data=f"stale:{o.id}:removed"),
+            ]
+            for o in rows
+        ]
+    )
+
+
+def stale_notice_text(rows: List[models.OfferBrief]) -> str:
+    now = now_ts()
+    lines = ["⏳ <b>Ці пропозиції давно без змін статусу.</b> Вони ще актуальні?", ""]
+    for o in rows:
+        days = max(0, (now - (o.status_changed_ts or now)) // 86400)
+        place = ", ".join(esc(x) for x in (o.street, o.city) if x)
+        lines.append(f"• <b>#{o.seq:04d}</b> {place} — {days} дн.")
+    return "\n".join(lines)
+
+
+async def notify_stale(bot: Bot, rows: List[models.OfferBrief]) -> Tuple[List[models.OfferBrief], List[models.OfferBrief]]:
+    """Надсилає маклерам запити. Повертає (спитані, недоставлені)."""
+    by_broker: Dict[int, List[models.OfferBrief]] = {}
+    for o in rows:
+        by_broker.setdefault(o.broker_user_id, []).append(o)
+
+    notified: List[models.OfferBrief] = []
+    failed: List[models.OfferBrief] = []
+    for uid, items in by_broker.items():
+        for i in range(0, len(items), STALE_KB_ROWS):
+            part = items[i:i + STALE_KB_ROWS]
+            try:
+                await tg_call(uid, lambda: bot.send_message(
+                    uid, stale_notice_text(part), reply_markup=kb_stale_confirm(part),
+                ))
+                notified.extend(part)
+            except Exception:
+                # маклер міг не запускати бота / заблокувати: не вважаємо спитаним
+                # (автозняття його не зачепить), повтор — через STALE_RETRY_S
+                log.warning("stale: cannot notify broker %s", uid, exc_info=True)
+                failed.extend(part)
+    return notified, failed
+
+
+async def sweep_stale(bot: Bot) -> Dict[str, int]:
+    now = now_ts()
+    rows = find_stale_offers(now - current_tenant().stale_after_days * 86400, now - STALE_RETRY_S, STALE_BATCH)
+    notified, failed = await notify_stale(bot, rows) if rows else ([], [])
+    if rows:
+        mark_stale_offers(notified, failed)
+    STALE_OFFERS.inc("flagged", value=len(rows))
+    STALE_OFFERS.inc("notified", value=len(notified))
+    STALE_OFFERS.inc("failed", value=len(failed))
+
+    removed: List[models.OfferBrief] = []
+    if STALE_AUTO_REMOVE_DAYS > 0:
+        removed = auto_remove_stale(now - STALE_AUTO_REMOVE_DAYS * 86400, STALE_BATCH)
+        if removed:
+            STALE_OFFERS.inc("auto_removed", value=len(removed))
+            await refresh_group_cards(bot, removed)
+
+    if rows or removed:
+        log.info("stale sweep: flagged %s, notified %s, failed %s, auto-removed %s",
+                 len(rows), len(notified), len(failed), len(removed))
+    return {"flagged": len(rows), "notified": len(notified), "failed": len(failed), "auto_removed": len(removed)}
+
+
+async def stale_sweeper(bot: Bot):
+    while True:
+        for t in TENANTS.all():
+            if t.stale_after_days <= 0:
+                continue
+            with tenants.use(t):
+                try:
+                    await sweep_stale(bot)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("stale sweep failed for tenant %s", t.id)
+        await asyncio.sleep(STALE_SWEEP_INTERVAL_MIN * 60)
+
+
+@router.callback_query(F.data.startswith("stale:"))
+async def cb_stale(call: types.CallbackQuery):
+    parts = call.data.split(":")
+    if len(parts) != 3 or parts[2] not in ("active", "removed"):
+        await call.answer("Помилка", show_alert=False)
+        return
+
+    offer_id = int(parts[1])
+    status = parts[2]
+    offer = get_offer(offer_id)
+    if not offer:
+        await call.answer("Пропозицію не знайдено", show_alert=False)
+        return
+    if offer.broker_user_id != call.from_user.id and not is_allowed(call.from_user.id):
+        await call.answer()
+        return
+
+    username = norm_username(call.from_user.username or str(call.from_user.id))
+    set_status(offer_id, status, username=username, user_id=call.from_user.id)
+    if offer.is_published:
+        schedule_card_sync(call.bot, offer_id, delay=0)
+
+    # прибираємо з клавіатури рядок цієї пропозиції
+    markup = call.message.reply_markup if call.message else None
+    if markup:
+        rows = [row for row in markup.inline_keyboard
+                if not (row and (row[0].callback_data or "").startswith(f"stale:{offer_id}:"))]
+        try:
+            await call.message.edit_reply_markup(
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=rows) if rows else None,
+            )
+        except Exception:
+            pass
+
+    await call.answer(f"#{offer.seq:04d}: {STATUS[status]}", show_alert=False)
+
+
+# =========================
+# DRAFT GC
+# =========================
+# /new одразу створює рядок в offers (+ подія "unknown"), а MemoryStorage
+# тримає стан майстра, поки маклер не завершить. Кинуті чернетки збирає
+# періодичний прохід: пачками по DRAFT_GC_BATCH, транзакція на пачку,
+# між пачками віддаємо цикл подій.
+_DRAFTS_SQL = (
+    "SELECT id FROM offers WHERE is_published = 0 AND source IS NULL "
+    "AND COALESCE(updated_ts, created_ts) < ? ORDER BY COALESCE(updated_ts, created_ts) LIMIT ?;"
+)
+
+
+@db_timed
+def delete_drafts_batch(cutoff_ts: int, batch: int) -> Tuple[List[int], int]:
+    """Одна пачка чернеток, не змінених з cutoff_ts. Повертає (ids, к-сть видалених подій)."""
+    con = db_conn()
+    cur = con.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE;")
+        cur.execute(_DRAFTS_SQL, (cutoff_ts, batch))
+        ids = [int(r["id"]) for r in cur.fetchall()]
+        if not ids:
+            con.rollback()
+            return [], 0
+        marks = ", ".join("?" * len(ids))
+        _unbump_offers(cur, ids, with_new=True)
+        for offer_id in ids:
+            analytics.forget(cur, offer_id)
+        cur.execute(f"DELETE FROM offer_photos WHERE offer_id IN ({marks});", ids)
+        cur.execute(f"DELETE FROM offer_messages WHERE offer_id IN ({marks});", ids)
+        cur.execute(f"DELETE FROM status_events WHERE offer_id IN ({marks});", ids)
+        events = cur.rowcount
+        cur.execute(f"DELETE FROM offers WHERE id IN ({marks}) AND is_published = 0;", ids)
+        con.commit()
+        return ids, events
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+def expire_fsm(storage, offer_ids: set) -> Tuple[int, int]:
+    """
+    Прибирає з MemoryStorage стани майстра поточної агенції, що вказують на
+    видалені чернетки, і порожні записи (після state.clear() ключ лишається).
+    Повертає (стани, порожні записи).
+    """
+    if not isinstance(storage, MemoryStorage):
+        return 0, 0
+    tenant = current_tenant()
+    expired = empty = 0
+    for key, record in list(storage.storage.items()):
+        if record.state is None and not record.data:
+            del storage.storage[key]
+            empty += 1
+        elif record.data.get("offer_id") in offer_ids and TENANTS.resolve(key.chat_id, key.user_id) is tenant:
+            del storage.storage[key]
+            expired += 1
+    return expired, empty
+
+
+async def collect_drafts(storage, ttl_hours: float = DRAFT_TTL_HOURS) -> Dict[str, int]:
+    cutoff = now_ts() - int(ttl_hours * 3600)
+    deleted: set = set()
+    events = 0
+    while True:
+        ids, n = delete_drafts_batch(cutoff, DRAFT_GC_BATCH)
+        if not ids:
+            break
+        deleted.update(ids)
+        events += n
+        for offer_id in ids:
+            _offer_cache().drop(offer_id)
+        await asyncio.sleep(0)
+
+    expired, empty = expire_fsm(storage, deleted)
+    if deleted:
+        drop_stats_cache()
+    res = {"offers": len(deleted), "events": events, "fsm_states": expired, "fsm_empty": empty}
+    for what, n in res.items():
+        if n:
+            DRAFTS_GC.inc(what, value=n)
+    if deleted or expired:
+        log.info("draft gc %s: %s", current_tenant().id, res)
+    return res
+
+
+async def draft_collector(storage):
+    while True:
+        for t in TENANTS.all():
+            with tenants.use(t):
+                try:
+                    await collect_drafts(storage)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("draft gc failed for tenant %s", t.id)
+        await asyncio.sleep(DRAFT_GC_INTERVAL_MIN * 60)
+
+
+@router.message(Command("gc"))
+async def cmd_gc(message: types.Message, state: FSMContext):
+    """/gc [годин] — зібрати кинуті чернетки зараз (за замовчуванням DRAFT_TTL_HOURS)."""
+    if not await require_perm(message, "admin"):
+        return
+    args = (message.text or "").split()[1:]
+    ttl = DRAFT_TTL_HOURS
+    if args:
+        try:
+            ttl = float(args[0].replace(",", "."))
+        except ValueError:
+            ttl = -1
+        if ttl < 1:
+            await message.answer("❗️Використання: /gc [годин], не менше 1. Наприклад: /gc 24")
+            return
+    elif ttl <= 0:
+        await message.answer("ℹ️ Збирач вимкнено (DRAFT_TTL_HOURS=0). Вкажи вік явно: /gc 48")
+        return
+
+    res = await collect_drafts(state.storage, ttl)
+    await message.answer(
+        f"🧹 Чернетки старші за {ttl:g} год: видалено {res['offers']} "
+        f"(подій: {res['events']}), станів майстра: {res['fsm_states']}, "
+        f"порожніх записів FSM: {res['fsm_empty']}."
+    )
+
+
+# =========================
+# STATS
+# =========================
+def _period_bounds(period: str) -> Tuple[datetime, datetime]:
+    # Межі рахуються в локальному часі APP_TZ. Арифметика datetime з
+    # ZoneInfo — "настінна" (wall clock), тому доба переходу на літній /
+    # зимовий час має 23 / 25 годин, а .timestamp() дає правильний UTC.
+    now = datetime.now(tz=APP_TZ)
+    if period == "day":
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=1)
+        return start, end
+    if period == "month":
+        start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if start.month == 12:
+            end = start.replace(year=start.year + 1, month=1)
+        else:
+            end = start.replace(month=start.month + 1)
+        return start, end
+    if period == "year":
+        start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = start.replace(year=start.year + 1)
+        return start, end
+    raise ValueError("Unknown period")
+
+
+def _period_bounds_ts(period: str) -> Tuple[int, int]:
+    start, end = _period_bounds(period)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+@db_timed
+def stats_for_period(period: str) -> Dict[str, Any]:
+    start, end = _period_bounds(period)
+    rows = daily_stats_between(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+
+    total = {k: 0 for k in STATUS_ORDER}
+    per_broker: Dict[str, Dict[str, int]] = {}
+    for r in rows:
+        st = r["kind"]
+        if st not in STATUS:
+            continue
+        total[st] += int(r["cnt"])
+        u = r["username"] or "—"
+        per_broker.setdefault(u, {k: 0 for k in STATUS_ORDER})
+        per_broker[u][st] = int(r["cnt"])
+
+    label = {
+        "day": start.strftime("%Y-%m-%d"),
+        "month": start.strftime("%Y-%m"),
+        "year": start.strftime("%Y"),
+    }[period]
+
+    return {"label": label, "total": total, "per_broker": per_broker}
+
+
+STATS_PERIODS = {"day": "День", "month": "Місяць", "year": "Рік"}
+_STATS_CACHE: Dict[Tuple[str, str, int], Tuple[float, Dict[str, Any]]] = {}
+
+
+def cached_stats(period: str) -> Dict[str, Any]:
+    """stats_for_period з коротким кешем: повторні /stats і кнопки не ходять у БД."""
+    # початок періоду в ключі — після півночі / 1-го числа запис не підхопиться
+    key = (current_tenant().id, period, _period_bounds_ts(period)[0])
+    now = time.monotonic()
+    hit = _STATS_CACHE.get(key)
+    if hit is not None and hit[0] > now:
+        STATS_CACHE.inc("hit")
+        return hit[1]
+    STATS_CACHE.inc("miss")
+    data = stats_for_period(period)
+    if STATS_CACHE_TTL > 0:
+        for k in [k for k, (exp, _) in _STATS_CACHE.items() if exp <= now]:
+            del _STATS_CACHE[k]
+        _STATS_CACHE[key] = (now + STATS_CACHE_TTL, data)
+    return data
+
+
+def drop_stats_cache():
+    """Після масових змін daily_stats агенції — наступний /stats порахує заново."""
+    tid = current_tenant().id
+    for k in [k for k in _STATS_CACHE if k[0] == tid]:
+        del _STATS_CACHE[k]
+
+
+def _status_counts_line(counts: Dict[str, int]) -> str:
+    return "  ".join(f"{STATUS[k].split()[0]} {counts[k]}" for k in STATUS_ORDER)
+
+
+def format_stats_summary() -> str:
+    periods = {p: cached_stats(p) for p in STATS_PERIODS}
+    lines = [
+        "📊 <b>Статистика (зміни статусів)</b>",
+        "",
+        "<b>" + " / ".join(f"{title} ({periods[p]['label']})" for p, title in STATS_PERIODS.items()) + "</b>",
+    ]
+    for st in STATUS_ORDER:
+        lines.append(f"{STATUS[st]}: " + " / ".join(str(periods[p]["total"][st]) for p in STATS_PERIODS))
+    lines += [
+        "",
+        f"🧑‍💼 Маклерів за рік: {len(periods['year']['per_broker'])}",
+        "По маклерах — кнопки нижче, один маклер — /stats @username",
+    ]
+    return "\n".join(lines)
+
+
+def kb_stats() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=f"🧑‍💼 {title}", callback_data=f"stats:{p}")
+        for p, title in STATS_PERIODS.items()
+    ]])
+
+
+def format_stats_brokers(period: str) -> str:
+    d = cached_stats(period)
+    lines = [
+        f"🧑‍💼 <b>{STATS_PERIODS[period]} — по маклерах ({d['label']})</b>",
+        " · ".join(STATUS[k] for k in STATUS_ORDER),
+        "",
+    ]
+    if not d["per_broker"]:
+        lines.append("— немає змін статусів")
+    for broker, counts in d["per_broker"].items():
+        lines.append(f"<b>{esc(broker)}</b>: {_status_counts_line(counts)}")
+    return "\n".join(lines)
+
+
+def format_stats_broker(username: str) -> str:
+    lines = [f"🧑‍💼 <b>{esc(username)}</b>"]
+    for p, title in STATS_PERIODS.items():
+        d = cached_stats(p)
+        counts = d["per_broker"].get(username)
+        lines += ["", f"<b>{title} ({d['label']})</b>"]
+        if not counts:
+            lines.append("— немає змін статусів")
+            continue
+        lines += [f"{STATUS[k]}: {counts[k]}" for k in STATUS_ORDER]
+    return "\n".join(lines)
+
+
+async def answer_long(message: types.Message, text: str, **kwargs):
+    """Відповідь, що може не влізти в одне повідомлення; клавіатура — під останнім."""
+    chunks = split_html(text)
+    for i, chunk in enumerate(chunks):
+        await message.answer(chunk, **(kwargs if i == len(chunks) - 1 else {}))
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    if not is_allowed(message.from_user.id):
+        return
+    args = (message.text or "").split()[1:]
+    if args:
+        await answer_long(message, format_stats_broker(norm_username(args[0])))
+        return
+    await message.answer(format_stats_summary(), reply_markup=kb_stats())
+
+
+@router.callback_query(F.data.startswith("stats:"))
+async def cb_stats(call: types.CallbackQuery):
+    period = call.data.split(":", 1)[1]
+    if period not in STATS_PERIODS:
+        await call.answer("Помилка", show_alert=False)
+        return
+    if not is_allowed(call.from_user.id):
+        await call.answer()
+        return
+    await call.answer()
+    await answer_long(call.message, format_stats_brokers(period))
+
+
+@router.message(Command("stats_rebuild"))
+async def cmd_stats_rebuild(message: types.Message):
+    """Перерахувати daily_stats з status_events / offers (після ручних правок БД)."""
+    if not is_admin(message.from_user.id):
+        return
+    t0 = time.perf_counter()
+    n = await asyncio.to_thread(rebuild_daily_stats)
+    drop_stats_cache()
+    engine = "NumPy" if columnar.available() else "SQL"
+    await message.answer(f"✅ daily_stats перераховано: {n} рядків за {time.perf_counter() - t0:.1f} с ({engine}).")
+
+
+# =========================
+# ANALYTICS
+# =========================
+ANALYTICS_PERIODS = {"day": "День", "month": "Місяць", "year": "Рік", "all": "Весь час"}
+
+
+def _analytics_bounds(period: str) -> Tuple[int, int]:
+    if period == "all":
+        return 0, 1 << 62
+    return _period_bounds_ts(period)
+
+
+@db_timed
+def refresh_analytics() -> int:
+    """Доганяє offer_analytics живої БД пачками (див. analytics.refresh); викликати в потоці."""
+    con = db_conn()
+    try:
+        return analytics.refresh(con)
+    finally:
+        con.close()
+
+
+@db_timed
+def analytics_report(period: str) -> List[Dict[str, Any]]:
+    """Доганяє offer_analytics і рахує звіт; звичайно — в потоці (asyncio.to_thread)."""
+    refresh_analytics()
+    start_ts, end_ts = _analytics_bounds(period)
+    con = db_conn()
+    try:
+        return analytics.report(con, start_ts, end_ts)
+    finally:
+        con.close()
+
+
+def _pct(x: Optional[float]) -> str:
+    return "—" if x is None else f"{x * 100:.0f}%"
+
+
+def format_analytics(period: str, rows: List[Dict[str, Any]]) -> str:
+    fd = analytics.fmt_duration
+    t = rows[0]
+    lines = [
+        f"📈 <b>Аналітика: {ANALYTICS_PERIODS[period].lower()}</b>",
+        "",
+        f"Нових в роботі: {t['started']}, з них у резерві: {t['reserved']}, "
+        f"угод: {t['closed']} ({_pct(t['close_rate'])}), знято: {t['removed']}",
+        f"До угоди (закриті в періоді: {t['deals']}): медіана {fd(t['median_s'])}, p90 {fd(t['p90_s'])}",
+        f"Середньо в «{STATUS['active']}»: {fd(t['avg_active_s'])}",
+        "",
+        "🧑‍💼 <b>По маклерах</b> — в роботі → угоди (конверсія), медіана / p90 до угоди",
+    ]
+    if len(rows) == 1:
+        lines.append("— немає даних")
+    for d in rows[1:]:
+        lines.append(
+            f"<b>{esc(d['broker'] or '—')}</b>: {d['started']} → {d['closed']} ({_pct(d['close_rate'])}), "
+            f"{fd(d['median_s'])} / {fd(d['p90_s'])}"
+        )
+    return "\n".join(lines)
+
+
+@router.message(Command("analytics"))
+async def cmd_analytics(message: types.Message):
+    if not await require_perm(message, "analytics"):
+        return
+    args = (message.text or "").split()[1:]
+    period = args[0].lower() if args else "month"
+    if period not in ANALYTICS_PERIODS:
+        await message.answer("❗️Використання: /analytics [day|month|year|all]")
+        return
+    # перший прогін на великій історії — секунди; цикл подій не блокуємо
+    rows = await asyncio.to_thread(analytics_report, period)
+    await answer_long(message, format_analytics(period, rows))
+
+
+# =========================
+# DAILY DIGEST
+# =========================
+def build_digest(day: str) -> str:
+    """Підсумок доби day (YYYY-MM-DD) з daily_stats — кілька рядків по первинному ключу."""
+    nxt = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    per_broker: Dict[str, Dict[str, int]] = {}
+    for r in daily_stats_between(day, nxt):
+        per_broker.setdefault(r["username"] or "—", {})[r["kind"]] = int(r["cnt"])
+
+    def total(kind: str) -> int:
+        return sum(c.get(kind, 0) for c in per_broker.values())
+
+    changes = sum(v for c in per_broker.values() for k, v in c.items() if k in STATUS)
+    lines = [
+        f"☀️ <b>Підсумок за {day}</b>",
+        "",
+        f"🆕 Нових пропозицій: {total('new')}",
+        f"🔄 Змін статусів: {changes}",
+        f"{STATUS['closed']}: {total('closed')}",
+    ]
+    if per_broker:
+        lines += ["", "🧑‍💼 <b>По маклерах</b>"]
+        for broker, counts in sorted(per_broker.items()):
+            parts = []
+            if counts.get("new"):
+                parts.append(f"🆕 {counts['new']}")
+            for st in STATUS_ORDER:
+                if counts.get(st):
+                    parts.append(f"{STATUS[st].split()[0]} {counts[st]}")
+            lines.append(f"<b>{esc(broker)}</b>: " + " · ".join(parts))
+    else:
+        lines += ["", "— за добу змін не було"]
+    return "\n".join(lines)
+
+
+def _digest_clock(value: str) -> Optional[Tuple[int, int]]:
+    # "25:00" / "9:75" розбираються як числа, але впали б у datetime.replace()
+    try:
+        hh, mm = (int(x) for x in value.split(":"))
+    except ValueError:
+        return None
+    if not (0 <= hh < 24 and 0 <= mm < 60):
+        return None
+    return hh, mm
+
+
+async def send_digest(bot: Bot, chat_id: int, day: str):
+    # з багатьма маклерами дайджест довший за одне повідомлення
+    for chunk in split_html(build_digest(day)):
+        await tg_call(chat_id, lambda: bot.send_message(chat_id, chunk))
+
+
+async def digest_scheduler(bot: Bot):
+    """
+    Раз на добу о digest_time агенції (APP_TZ) шле в її групу підсумок за
+    вчора. Дата останньої відправки — в meta, тож рестарт після digest_time
+    дошле пропущений дайджест, але не продублює вже надісланий.
+    Запускається окремою задачею на кожну агенцію (в її контексті).
+    """
+    t = current_tenant()
+    clock = _digest_clock(t.digest_time)
+    if clock is None:
+        log.warning("digest: bad digest time %r for tenant %s, expected HH:MM", t.digest_time, t.id)
+        return
+
+    while True:
+        now = datetime.now(tz=APP_TZ)
+        target = now.replace(hour=clock[0], minute=clock[1], second=0, microsecond=0)
+        wait = target.timestamp() - now.timestamp()
+        if wait <= 0:
+            today = target.strftime("%Y-%m-%d")
+            group_id = resolve_group_id()
+            if group_id is not None and meta_get("digest_last_sent") != today:
+                yesterday = (target - timedelta(days=1)).strftime("%Y-%m-%d")
+                try:
+                    await send_digest(bot, group_id, yesterday)
+                    meta_set("digest_last_sent", today)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("digest: send failed, retrying in 5 min")
+                    await asyncio.sleep(300)
+                    continue
+            wait = (target + timedelta(days=1)).timestamp() - now.timestamp()
+        # не спимо довше години: переживаємо зміну часу / перехід на літній час
+        await asyncio.sleep(min(wait, 3600))
+
+
+@router.message(Command("digest"))
+async def cmd_digest(message: types.Message):
+    if not is_allowed(message.from_user.id):
+        return
+    args = (message.text or "").split()[1:]
+    now = datetime.now(tz=APP_TZ)
+    day = now.strftime("%Y-%m-%d") if args[:1] == ["today"] else (now - timedelta(days=1)).strftime("%Y-%m-%d")
+    await answer_long(message, build_digest(day))
+
+
+# =========================
+# EXPORT (EXCEL)
+# =========================
+@db_timed
+def export_to_excel(filepath: str, period: str = "all") -> None:
+    if Workbook is None:
+        raise RuntimeError("openpyxl не встановлений")
+
+    start_ts = None
+    end_ts = None
+    if period in ("day", "month", "year"):
+        start_ts, end_ts = _period_bounds_ts(period)
+
+    # усі аркуші — з однієї копії БД: пропозиції, події й аналітика узгоджені
+    # між собою, а довге читання не заважає живій БД
+    # offer_analytics доганяємо в живій БД (копія одноразова), тоді знімаємо копію
+    refresh_analytics()
+    with db_snapshot() as con:
+        _write_export(filepath, con, period, start_ts, end_ts)
+    SNAPSHOTS.inc("export", "ok")
+
+
+def _write_export(filepath: str, con: sqlite3.Connection, period: str,
+                  start_ts: Optional[int], end_ts: Optional[int]):
+    cur = con.cursor()
+
+    if start_ts is not None:
+        cur.execute(
+            "SELECT * FROM offers WHERE created_ts >= ? AND created_ts < ? ORDER BY seq ASC;",
+            (start_ts, end_ts),
+        )
+    else:
+        cur.execute("SELECT * FROM offers ORDER BY seq ASC;")
+    offers = [Offer.from_row(r) for r in cur.fetchall()]
+
+    wb = Workbook()
+
+    ws = wb.active
+    ws.title = "Offers"
+    ws.append(
+        [
+            "SEQ",
+            "CreatedAt",
+            "Status",
+            "Category",
+            "HousingType",
+            "Street",
+            "City",
+            "District",
+            "Advantages",
+            "Rent",
+            "Deposit",
+            "Commission",
+            "Parking",
+            "MoveInFrom",
+            "ViewingsFrom",
+            "Broker",
+            "BrokerUserId",
+            "PhotosCount",
+            "PublishedChatId",
+            "PublishedMessageId",
+        ]
+    )
+
+    for o in offers:
+        ws.append(
+            [
+                o.seq,
+                ts_to_iso(o.created_ts) or o.created_at,
+                STATUS.get(o.current_status, o.current_status),
+                o.category,
+                o.housing_type,
+                o.street,
+                o.city,
+                o.district,
+                o.advantages,
+                o.rent,
+                o.deposit,
+                o.commission,
+                o.parking,
+                o.move_in_from,
+                o.viewings_from,
+                o.broker_username,
+                o.broker_user_id,
+                len(o.photos),
+                o.published_chat_id,
+                o.published_message_id,
+            ]
+        )
+
+    ws2 = wb.create_sheet("StatusEvents")
+    ws2.append(["At", "OfferSEQ", "Status", "Username", "UserId"])
+    for e in iter_status_events(start_ts, end_ts, con=con):
+        ws2.append(
+            [
+                ts_to_iso(e.at_ts) or e.at,
+                e.offer_seq,
+                STATUS.get(e.status, e.status),
+                e.username,
+                e.user_id,
+            ]
+        )
+
+    ws3 = wb.create_sheet("Analytics")
+    ws3.append([
+        "Broker", "Started", "Reserved", "Closed", "Removed", "CloseRate",
+        "Deals", "MedianDaysToClose", "P90DaysToClose", "AvgDaysActive",
+    ])
+
+    def days(sec: Optional[float]) -> Optional[float]:
+        return None if sec is None else round(sec / 86400, 2)
+
+    for d in analytics.report(con, *_analytics_bounds(period)):
+        ws3.append([
+            d["broker"] if d["broker"] is not None else "TOTAL",
+            d["started"], d["reserved"], d["closed"], d["removed"],
+            None if d["close_rate"] is None else round(d["close_rate"], 4),
+            d["deals"], days(d["median_s"]), days(d["p90_s"]), days(d["avg_active_s"]),
+        ])
+
+    wb.save(filepath)
+
+
+@router.message(Command("export"))
+async def cmd_export(message: types.Message):
+    if not await require_perm(message, "export"):
+        return
+
+    if Workbook is None:
+        await message.answer("❗️Додай openpyxl в requirements.txt (openpyxl==3.1.5) і перезапусти деплой.")
+        return
+
+    args = (message.text or "").split(maxsplit=1)
+    period = "all"
+    if len(args) == 2:
+        period = args[1].strip().lower()
+
+    if period not in ("all", "day", "month", "year"):
+        await message.answer("❗️Використання: /export [all|day|month|year]\nНаприклад: /export month")
+        return
+
+    ensure_dirs()
+    ts = datetime.now(tz=APP_TZ).strftime("%Y-%m-%d_%H-%M")
+    filename = f"orenda_export_{period}_{ts}.xlsx"
+    filepath = os.path.join(DATA_DIR, filename)
+
+    try:
+        await asyncio.to_thread(export_to_excel, filepath, period)
+        doc = FSInputFile(filepath, filename=filename)
         await message.answer_document(doc, caption=f"📄 Excel експорт: <b>{period}</b>")
     finally:
         try:
@@ -1149,23 +3490,905 @@ async def cmd_export(message: types.Message):
 
 
 # =========================
-# MAIN
+# IMPORT (XLSX / CSV)
 # =========================
-async def main():
-    if not BOT_TOKEN:
-        raise RuntimeError("BOT_TOKEN не заданий")
+class ImportFSM(StatesGroup):
+    WAIT_FILE = State()
+
+
+# заголовок з export_to_excel (без регістру / пробілів / "_") -> колонка offers
+IMPORT_COLUMNS = {
+    "createdat": "created_at",
+    "status": "current_status",
+    "category": "category",
+    "housingtype": "housing_type",
+    "street": "street",
+    "city": "city",
+    "district": "district",
+    "advantages": "advantages",
+    "rent": "rent",
+    "deposit": "deposit",
+    "commission": "commission",
+    "parking": "parking",
+    "moveinfrom": "move_in_from",
+    "viewingsfrom": "viewings_from",
+    "broker": "broker_username",
+    "brokeruserid": "broker_user_id",
+}
+IMPORT_TEXT_FIELDS = [
+    "category", "housing_type", "street", "city", "district", "advantages",
+    "rent", "deposit", "commission", "parking", "move_in_from", "viewings_from",
+]
+STATUS_BY_LABEL = {v: k for k, v in STATUS.items()}
+
+
+def _import_key(header: Any) -> str:
+    return "".join(ch for ch in str(header or "").lower() if ch.isalnum())
+
+
+def iter_import_rows(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(номер рядка у файлі, {колонка offers: значення}) — потоково, без читання файлу цілком."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(f, dialect)
+            header = [IMPORT_COLUMNS.get(_import_key(h)) for h in next(reader, [])]
+            for line_no, values in enumerate(reader, start=2):
+                yield line_no, {k: v for k, v in zip(header, values) if k}
+        return
+
+    if load_workbook is None:
+        raise RuntimeError("openpyxl не встановлений")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb["Offers"] if "Offers" in wb.sheetnames else wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = [IMPORT_COLUMNS.get(_import_key(h)) for h in next(rows, ())]
+        for line_no, values in enumerate(rows, start=2):
+            yield line_no, {k: v for k, v in zip(header, values) if k}
+    finally:
+        wb.close()
+
+
+def _parse_import_ts(value: Any, default: int) -> int:
+    if value in (None, ""):
+        return default
+    if isinstance(value, datetime):
+        dt = value if value.tzinfo else value.replace(tzinfo=APP_TZ)
+        return int(dt.timestamp())
+    try:
+        dt = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"невірна дата: {value}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=APP_TZ)
+    return int(dt.timestamp())
+
+
+def normalize_import_row(raw: Dict[str, Any], importer_username: str, importer_id: int,
+                         now: int) -> Optional[Dict[str, Any]]:
+    """Валідований рядок для INSERT; None — порожній рядок; ValueError — помилка."""
+    vals = {k: ("" if v is None else str(v).strip()) for k, v in raw.items()}
+    if not any(vals.values()):
+        return None
+    if not vals.get("street") and not vals.get("city"):
+        raise ValueError("немає ні вулиці, ні міста")
+
+    st_raw = vals.get("current_status", "")
+    if not st_raw:
+        status = "active"
+    elif st_raw.lower() in STATUS:
+        status = st_raw.lower()
+    elif st_raw in STATUS_BY_LABEL:
+        status = STATUS_BY_LABEL[st_raw]
+    else:
+        raise ValueError(f"невідомий статус: {st_raw}")
+
+    broker = norm_username(vals.get("broker_username", "")) or importer_username
+    broker_id_raw = vals.get("broker_user_id", "")
+    if broker_id_raw:
+        try:
+            broker_id = int(float(broker_id_raw))
+        except ValueError:
+            raise ValueError(f"невірний BrokerUserId: {broker_id_raw}")
+    else:
+        broker_id = importer_id if broker == importer_username else None
+
+    row = {k: vals.get(k, "") for k in IMPORT_TEXT_FIELDS}
+    row["broker_username"] = broker
+    row["broker_user_id"] = broker_id
+    row["current_status"] = status
+    row["created_ts"] = _parse_import_ts(raw.get("created_at"), now)
+    row["fingerprint"] = dedup.fingerprint(row["street"], row["city"], row["district"], row["housing_type"], row["rent"])
+    row["fuzzy_key"] = dedup.fuzzy_key(row["street"], row["city"], row["rent"])
+    return row
+
+
+def _insert_import_batch(con: sqlite3.Connection, batch: List[Dict[str, Any]],
+                         importer_username: str, importer_id: int) -> List[int]:
+    # одна транзакція на пачку: seq видаємо блоком, події статусів — executemany
+    cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE;")
+    try:
+        cur.execute("SELECT COALESCE(MAX(seq), 0) AS m FROM offers;")
+        base = int(cur.fetchone()["m"])
+        cur.executemany(
+            """
+            INSERT INTO offers (
+                seq, created_at, created_ts, category, housing_type, street, city, district, advantages,
+                rent, deposit, commission, parking, move_in_from, viewings_from,
+                broker_username, broker_user_id, photos_json, current_status, is_published, source,
+                status_changed_ts, fingerprint, fuzzy_key
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '[]', ?, 0, 'import', ?, ?, ?);
+            """,
+            [
+                (
+                    base + i, ts_to_iso(r["created_ts"]), r["created_ts"],
+                    *(r[k] for k in IMPORT_TEXT_FIELDS),
+                    r["broker_username"], r["broker_user_id"], r["current_status"], r["created_ts"],
+                    r["fingerprint"], r["fuzzy_key"],
+                )
+                for i, r in enumerate(batch, start=1)
+            ],
+        )
+        cur.execute(
+            "SELECT id FROM offers WHERE seq > ? AND seq <= ? ORDER BY seq;",
+            (base, base + len(batch)),
+        )
+        ids = [int(r["id"]) for r in cur.fetchall()]
+        cur.executemany(
+            "INSERT INTO status_events (offer_id, at, at_ts, status, username, user_id) VALUES (?, ?, ?, ?, ?, ?);",
+            [
+                (oid, ts_to_iso(r["created_ts"]), r["created_ts"], r["current_status"], importer_username, importer_id)
+                for oid, r in zip(ids, batch)
+            ],
+        )
+        _bump_daily(cur, [(r["created_ts"], r["broker_username"], "new", 1) for r in batch])
+        _bump_daily(cur, [(r["created_ts"], importer_username, r["current_status"], 1) for r in batch])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return ids
+
+
+@db_timed
+def import_offers(path: str, importer_username: str, importer_id: int, chunk: int = IMPORT_CHUNK,
+                  on_progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Потоковий імпорт: рядки валідуються і вставляються пачками по chunk
+    (одна транзакція на пачку). Повертає ids, к-сть рядків і помилки.
+    """
+    now = now_ts()
+    con = db_conn()
+    ids: List[int] = []
+    errors: List[Tuple[int, str]] = []
+    rows = 0
+    batch: List[Dict[str, Any]] = []
+    try:
+        for line_no, raw in iter_import_rows(path):
+            rows += 1
+            try:
+                row = normalize_import_row(raw, importer_username, importer_id, now)
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+                continue
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= chunk:
+                ids.extend(_insert_import_batch(con, batch, importer_username, importer_id))
+                batch = []
+                if on_progress:
+                    on_progress(rows)
+        if batch:
+            ids.extend(_insert_import_batch(con, batch, importer_username, importer_id))
+        if on_progress:
+            on_progress(rows)
+    finally:
+        con.close()
+    return {"ids": ids, "rows": rows, "errors": errors}
+
+
+class PublishJob:
+    """Прогрес фонової публікації (звіт редагується в report-повідомленні)."""
+
+    def __init__(self, total: int, chat_id: int, message_id: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.reported_at = 0.0
+
+    def text(self) -> str:
+        head = "✅ Публікацію завершено" if self.done + self.failed >= self.total else "📣 Публікую в групу"
+        line = f"{head}: {self.done}/{self.total}"
+        if self.failed:
+            line += f" (помилок: {self.failed})"
+        return line
+
+
+_PUBLISH_QUEUE: Optional[asyncio.Queue] = None
+
+
+async def _report_publish_job(bot: Bot, job: PublishJob, force: bool = False):
+    now = time.monotonic()
+    if not force and now - job.reported_at < 10:
+        return
+    job.reported_at = now
+    try:
+        await tg_call(job.chat_id, lambda: bot.edit_message_text(
+            chat_id=job.chat_id, message_id=job.message_id, text=job.text()))
+    except Exception:
+        pass
+
+
+async def _publish_worker(bot: Bot, queue: asyncio.Queue):
+    # одна черга на процес: публікації з різних імпортів не змагаються за ліміт групи;
+    # агенція — в кожному елементі черги, воркер спільний
+    while True:
+        tenant, offer_id, job = await queue.get()
+        try:
+            with tenants.use(tenant):
+                await publish_offer(bot, offer_id)
+            job.done += 1
+        except Exception:
+            log.exception("publish failed: offer_id=%s", offer_id)
+            job.failed += 1
+        finally:
+            queue.task_done()
+        await _report_publish_job(bot, job, force=job.done + job.failed >= job.total)
+
+
+def enqueue_publish(bot: Bot, offer_ids: List[int], job: PublishJob):
+    global _PUBLISH_QUEUE
+    if _PUBLISH_QUEUE is None:
+        _PUBLISH_QUEUE = asyncio.Queue()
+        spawn(_publish_worker(bot, _PUBLISH_QUEUE), "publish-worker")
+    for oid in offer_ids:
+        _PUBLISH_QUEUE.put_nowait((current_tenant(), oid, job))
+
+
+def format_import_result(res: Dict[str, Any]) -> str:
+    lines = [
+        "📥 <b>Імпорт завершено</b>",
+        f"Рядків у файлі: {res['rows']}",
+        f"Додано пропозицій: {len(res['ids'])}",
+    ]
+    errors = res["errors"]
+    if errors:
+        lines.append(f"Пропущено з помилками: {len(errors)}")
+        for line_no, err in errors[:10]:
+            lines.append(f"• рядок {line_no}: {esc(err)}")
+        if len(errors) > 10:
+            lines.append("…")
+    return "\n".join(lines)
+
+
+@router.message(Command("import"))
+async def cmd_import(message: types.Message, state: FSMContext):
+    if not await require_perm(message, "import"):
+        return
+
+    args = (message.text or "").split()[1:]
+    publish = bool(args) and args[0].lower() == "publish"
+    if args and not publish:
+        await message.answer("❗️Використання: /import [publish]")
+        return
+
+    await state.set_state(ImportFSM.WAIT_FILE)
+    await state.set_data({"import_publish": publish})
+    await message.answer(
+        "📥 Надішли файл <b>.xlsx</b> або <b>.csv</b> з колонками як у /export "
+        "(Category, HousingType, Street, City, District, …, Broker, Status).\n"
+        + ("Після імпорту пропозиції буде опубліковано в групу." if publish else "Пропозиції не публікуються.")
+        + "\nСкасувати: /cancel"
+    )
+
+
+@router.message(ImportFSM.WAIT_FILE, F.document)
+async def msg_import_file(message: types.Message, state: FSMContext):
+    doc = message.document
+    name = (doc.file_name or "").lower()
+    ext = os.path.splitext(name)[1]
+    if ext not in (".xlsx", ".csv"):
+        await message.answer("❗️Потрібен файл .xlsx або .csv.")
+        return
+    if ext == ".xlsx" and load_workbook is None:
+        await message.answer("❗️Додай openpyxl в requirements.txt (openpyxl==3.1.5) і перезапусти деплой.")
+        return
+
+    data = await state.get_data()
+    publish = bool(data.get("import_publish"))
+    await state.clear()
+
+    if publish and resolve_group_id() is None and not list_routes():
+        await message.answer("❗️Не задано коректний GROUP_CHAT_ID або маршрути (/routes) — імпорт без публікації.")
+        publish = False
+
+    username = norm_username(message.from_user.username or str(message.from_user.id))
+    ensure_dirs()
+    path = os.path.join(DATA_DIR, f"import_{message.from_user.id}_{now_ts()}{ext}")
+
+    progress_msg = await message.answer("⏳ Імпорт: завантажую файл…")
+    try:
+        await message.bot.download(doc, destination=path)
+
+        # парсинг + вставка в окремому потоці: цикл подій не блокується
+        progress = {"rows": 0}
+        task = asyncio.ensure_future(asyncio.to_thread(
+            import_offers, path, username, message.from_user.id,
+            on_progress=lambda n: progress.__setitem__("rows", n),
+        ))
+        shown = -1
+        while not task.done():
+            await asyncio.wait({task}, timeout=2)
+            if not task.done() and progress["rows"] != shown:
+                shown = progress["rows"]
+                try:
+                    await progress_msg.edit_text(f"⏳ Імпорт: оброблено {shown} рядків…")
+                except Exception:
+                    pass
+        res = task.result()
+    except Exception as e:
+        log.exception("import failed")
+        await message.answer(f"❗️Імпорт не вдався: {esc(str(e))}")
+        return
+    finally:
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+
+    await message.answer(format_import_result(res))
+    if res["ids"]:
+        # пачку рядків простіше перечитати одним GROUP BY, ніж додавати по одному
+        _SUGGEST[current_tenant().id] = await asyncio.to_thread(load_suggest_indexes)
+
+    if publish and res["ids"]:
+        report = await message.answer(f"📣 Публікую в групу: 0/{len(res['ids'])}")
+        job = PublishJob(len(res["ids"]), report.chat.id, report.message_id)
+        enqueue_publish(message.bot, res["ids"], job)
+
+
+@router.message(ImportFSM.WAIT_FILE)
+async def msg_import_other(message: types.Message, state: FSMContext):
+    t = (message.text or "").strip().lower()
+    if t in ("/cancel", "скасувати", "cancel"):
+        await state.clear()
+        await message.answer("❌ Імпорт скасовано.")
+        return
+    await message.answer("📎 Надішли файл .xlsx або .csv (або /cancel).")
+
 
-    init_db()
+# =========================
+# BACKUPS
+# =========================
+@db_timed
+def backup_db() -> str:
+    """Стиснута копія БД агенції в BACKUP_DIR з ротацією; викликати в потоці."""
+    t = current_tenant()
+    return snapshot.backup(
+        t.db_path, BACKUP_DIR, t.id, keep=BACKUP_KEEP,
+        pages=SNAPSHOT_PAGES, pause=SNAPSHOT_PAUSE_MS / 1000,
+    )
+
+
+async def run_backup() -> str:
+    try:
+        path = await asyncio.to_thread(backup_db)
+    except Exception:
+        SNAPSHOTS.inc("backup", "error")
+        raise
+    SNAPSHOTS.inc("backup", "ok")
+    meta_set("backup_last_ts", str(now_ts()))
+    log.info("backup: %s", path)
+    return path
+
+
+async def backup_scheduler():
+    """
+    Раз на BACKUP_INTERVAL_HOURS — резервна копія БД агенції. Час останньої
+    копії — в meta, тож рестарт не робить зайву копію і не пропускає чергову.
+    Запускається окремою задачею на кожну агенцію (в її контексті).
+    """
+    interval = int(BACKUP_INTERVAL_HOURS * 3600)
+    while True:
+        wait = int(meta_get("backup_last_ts") or 0) + interval - now_ts()
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+        try:
+            await run_backup()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("backup: failed, retrying in 5 min")
+            await asyncio.sleep(300)
+
+
+@router.message(Command("backup"))
+async def cmd_backup(message: types.Message):
+    if not await require_perm(message, "admin"):
+        return
+    progress = await message.answer("⏳ Роблю резервну копію…")
+    try:
+        path = await run_backup()
+    except Exception as e:
+        log.exception("manual backup failed")
+        await progress.edit_text(f"❗️Резервна копія не вдалась: {esc(str(e))}")
+        return
+    kept = snapshot.list_backups(BACKUP_DIR, current_tenant().id)
+    size_mb = os.path.getsize(path) / 1e6
+    await progress.edit_text(
+        f"💾 Резервна копія: <code>{esc(os.path.basename(path))}</code> ({size_mb:.1f} МБ)\n"
+        f"Зберігається останніх: {len(kept)} з {BACKUP_KEEP}"
+    )
+
+
+# =========================
+# ADMIN: USERS
+# =========================
+def format_users() -> str:
+    rows = list_users()
+    t = current_tenant()
+    lines = ["👥 <b>Користувачі</b>", ""]
+    if not rows:
+        lines.append("— у базі нікого; доступ за ALLOWED_USER_IDS / ADMIN_USER_IDS")
+    for r in rows:
+        name = f" {esc(r['username'])}" if r["username"] else ""
+        lines.append(f"• <code>{r['user_id']}</code>{name} — {ROLE_LABELS.get(r['role'], r['role'])}")
+    if t.admin_user_ids:
+        lines += ["", "Адміни з ENV: " + ", ".join(f"<code>{u}</code>" for u in sorted(t.admin_user_ids))]
+    lines += ["", "Ролі: " + "; ".join(f"{k} — {', '.join(sorted(v))}" for k, v in ROLES.items())]
+    return "\n".join(lines)
+
+
+@router.message(Command("users"))
+async def cmd_users(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return
+    await message.answer(format_users())
+
+
+@router.message(Command("user_set"))
+async def cmd_user_set(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return
+    args = (message.text or "").split()[1:]
+    if len(args) < 2 or not args[0].isdigit() or args[1].lower() not in ROLES:
+        await message.answer(
+            "❗️Використання: /user_set &lt;user_id&gt; &lt;broker|manager|admin&gt; [@username]"
+        )
+        return
+
+    uid, role = int(args[0]), args[1].lower()
+    username = norm_username(args[2]) if len(args) > 2 else ""
+    if not list_users() and uid != message.from_user.id and message.from_user.id not in current_tenant().admin_user_ids:
+        # перший запис закриває відкритий / ENV-режим — не відрізаємо себе
+        set_user_role(message.from_user.id, "admin",
+                      norm_username(message.from_user.username or ""), message.from_user.id)
+    set_user_role(uid, role, username, message.from_user.id)
+    invalidate_roles()
+    TENANTS.bind_user(uid, current_tenant())
+    await message.answer(f"✅ <code>{uid}</code> — {ROLE_LABELS[role]}.\n\n{format_users()}")
+
+
+@router.message(Command("user_del"))
+async def cmd_user_del(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return
+    args = (message.text or "").split()[1:]
+    if not args or not args[0].isdigit():
+        await message.answer("❗️Використання: /user_del &lt;user_id&gt;")
+        return
+    uid = int(args[0])
+    if uid == message.from_user.id:
+        await message.answer("❗️Не можна видалити себе.")
+        return
+    if not delete_user(uid):
+        await message.answer("❗️Користувача не знайдено.")
+        return
+    invalidate_roles()
+    TENANTS.unbind_user(uid, current_tenant())
+    await message.answer(f"🗑 <code>{uid}</code> видалено.\n\n{format_users()}")
+
+
+# =========================
+# ADMIN: ROUTES
+# =========================
+ROUTE_FIELDS = {"city": "city", "category": "category", "type": "housing_type"}
+ROUTE_USAGE = (
+    "❗️Використання:\n"
+    "/route_add &lt;chat_id&gt; [city=…] [category=…] [type=…]\n"
+    "Наприклад: /route_add -1001234567890 city=Bratislava category=Оренда\n"
+    "Значення з пробілами — в лапках: city=\"Banská Bystrica\""
+)
+
+
+def format_routes() -> str:
+    routes = list_routes()
+    if not routes:
+        group_id = resolve_group_id()
+        default = f"<code>{group_id}</code>" if group_id is not None else "не задано"
+        return f"🧭 Маршрутів немає — все публікується в GROUP_CHAT_ID ({default})."
+    lines = ["🧭 <b>Маршрути публікації</b>", ""]
+    for r in routes:
+        rule = ", ".join(
+            f"{name}={esc(r[col])}" for name, col in ROUTE_FIELDS.items() if r[col] is not None
+        ) or "усі"
+        lines.append(f"<b>{r['id']}.</b> {rule} → <code>{r['chat_id']}</code>")
+    return "\n".join(lines)
+
+
+@router.message(Command("routes"))
+async def cmd_routes(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return
+    await message.answer(format_routes())
+
+
+@router.message(Command("route_add"))
+async def cmd_route_add(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return
+    try:
+        args = shlex.split(message.text or "")[1:]
+    except ValueError:
+        args = []
+    if not args or not args[0].lstrip("-").isdigit():
+        await message.answer(ROUTE_USAGE)
+        return
+
+    rule: Dict[str, Optional[str]] = {col: None for col in ROUTE_FIELDS.values()}
+    for arg in args[1:]:
+        key, _, value = arg.partition("=")
+        if key.lower() not in ROUTE_FIELDS or not value.strip():
+            await message.answer(ROUTE_USAGE)
+            return
+        rule[ROUTE_FIELDS[key.lower()]] = value.strip()
+
+    route_id = add_route(int(args[0]), **rule)
+    TENANTS.bind_chat(int(args[0]), current_tenant())
+    await message.answer(f"✅ Маршрут {route_id} додано.\n\n{format_routes()}")
+
+
+@router.message(Command("route_del"))
+async def cmd_route_del(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return
+    args = (message.text or "").split()[1:]
+    if not args or not args[0].isdigit():
+        await message.answer("❗️Використання: /route_del &lt;номер маршруту&gt;")
+        return
+    if not delete_route(int(args[0])):
+        await message.answer("❗️Маршрут не знайдено.")
+        return
+    await message.answer(f"🗑 Маршрут {args[0]} видалено.\n\n{format_routes()}")
+
+
+# =========================
+# ADMIN: METRICS
+# =========================
+def _fmt_ms(sec: float) -> str:
+    return f"{sec * 1000:.1f}"
+
+
+def format_admin_metrics(top: int = 10) -> str:
+    def block(title: str, hist: metrics.Histogram, label: str) -> list:
+        rows = sorted(hist.summary(), key=lambda r: r["p95"], reverse=True)[:top]
+        lines = [f"<b>{title}</b> (p50 / p95 / max, мс; к-сть)"]
+        if not rows:
+            lines.append("— немає даних")
+        for r in rows:
+            lines.append(
+                f"• {esc(r['labels'][label])}: {_fmt_ms(r['p50'])} / {_fmt_ms(r['p95'])} / "
+                f"{_fmt_ms(r['max'])}; {r['count']}"
+            )
+        return lines
+
+    parts = ["📈 <b>Метрики процесу</b>", ""]
+    parts.append(
+        f"🗄 З'єднань з БД: {len(DB_POOL)}/{DB_POOL.max_open} "
+        f"(відкрито {DB_POOL.opened}, закрито {DB_POOL.evicted}; агенцій {len(TENANTS.tenants)})"
+    )
+    oc = _offer_cache()
+    parts.append(f"🧩 Кеш пропозицій: {len(oc)}/{oc.size} (влучань {oc.hits}, промахів {oc.misses})")
+    parts.append("")
+    parts += block("Хендлери", HANDLER_SECONDS, "handler")
+    parts.append("")
+    parts += block("БД", DB_SECONDS, "call")
+    parts.append("")
+    parts += block("Bot API", API_SECONDS, "method")
+
+    errors = [(k, v) for k, v in HANDLER_ERRORS.items()] + [(k, v) for k, v in API_ERRORS.items()]
+    if errors:
+        parts += ["", "<b>Помилки</b>"]
+        for k, v in errors:
+            parts.append(f"• {esc(':'.join(k))}: {int(v)}")
+
+    transitions = sorted(FSM_TRANSITIONS.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    if transitions:
+        parts += ["", "<b>FSM переходи</b>"]
+        for (src, dst), v in transitions:
+            parts.append(f"• {esc(src)} → {esc(dst)}: {int(v)}")
+    return "\n".join(parts)
+
+
+@router.message(Command("admin_metrics"))
+async def cmd_admin_metrics(message: types.Message):
+    if not await require_perm(message, "admin_metrics"):
+        return
+    await message.answer(format_admin_metrics())
+
+
+def format_profile_status() -> str:
+    p = PROFILER
+    lines = [
+        f"🔬 <b>Профайлер:</b> {'увімкнено' if p.enabled else 'вимкнено'}",
+        f"rate: {p.rate:g}; slow_ms: {p.slow_ms}",
+        f"Файли: <code>{esc(p.out_dir)}</code>",
+        "",
+        "ℹ️ Профіль — вибірка, лише апдейти, що оброблялись самі: пропущено "
+        f"паралельних {p.skipped}, відкинуто перетнутих {p.discarded}. Фонові задачі "
+        "(синхронізація карток, публікація) можуть потрапити в профіль хендлера.",
+    ]
+    counts = p.counts()
+    if counts:
+        lines.append("")
+        for name, n in sorted(counts.items(), key=lambda kv: kv[1], reverse=True):
+            lines.append(f"• {esc(name)}: {n}")
+    return "\n".join(lines)
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message):
+    if not await require_perm(message, "admin_metrics"):
+        return
+
+    # /profile on [rate] [slow_ms] | /profile off | /profile
+    args = (message.text or "").split()[1:]
+    if args and args[0].lower() in ("on", "off"):
+        rate = None
+        slow_ms = None
+        try:
+            if len(args) > 1:
+                rate = float(args[1])
+            if len(args) > 2:
+                slow_ms = int(args[2])
+        except ValueError:
+            await message.answer("❗️Використання: /profile on [rate 0..1] [slow_ms] | /profile off")
+            return
+        PROFILER.configure(args[0].lower() == "on", rate=rate, slow_ms=slow_ms)
+    elif args:
+        await message.answer("❗️Використання: /profile on [rate 0..1] [slow_ms] | /profile off")
+        return
+
+    await message.answer(format_profile_status())
+
+
+# =========================
+# MIDDLEWARES
+# =========================
+def _state_label(state: Optional[str]) -> str:
+    return state or "none"
+
+
+def _update_type(event) -> str:
+    if isinstance(event, types.CallbackQuery):
+        prefix = (event.data or "").split(":", 1)[0]
+        return f"callback_query:{prefix}"
+    if isinstance(event, types.Message):
+        return f"message:{event.content_type}"
+    return type(event).__name__
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner-middleware: латентність кожного хендлера + переходи FSM."""
+
+    async def __call__(self, handler, event, data):
+        h = data.get("handler")
+        name = getattr(getattr(h, "callback", None), "__name__", "unknown")
+        state: Optional[FSMContext] = data.get("state")
+        before = data.get("raw_state")
+
+        t0 = time.perf_counter()
+        try:
+            with loopwatch.track(handler=name, update_type=_update_type(event), state=before):
+                return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, name)
+            if state is not None:
+                after = await state.get_state()
+                if after != before:
+                    FSM_TRANSITIONS.inc(_state_label(before), _state_label(after))
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Inner-middleware: cProfile для вибраних апдейтів (див. PROFILER)."""
+
+    def __init__(self, profiler: profiling.UpdateProfiler):
+        self.profiler = profiler
+
+    async def __call__(self, handler, event, data):
+        # begin()/end() — для кожного апдейту: профайлер рахує, скільки їх у хендлерах
+        token = self.profiler.begin()
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            h = data.get("handler")
+            name = getattr(getattr(h, "callback", None), "__name__", "unknown")
+            self.profiler.end(token, name, time.perf_counter() - t0)
+
+
+class RecordingMiddleware(BaseMiddleware):
+    """Outer-middleware на update: пише кожен апдейт у лог до обробки."""
 
+    def __init__(self, rec: recorder.UpdateRecorder):
+        self.rec = rec
+
+    async def __call__(self, handler, event, data):
+        try:
+            self.rec.record(event.model_dump(mode="json", exclude_none=True, by_alias=True))
+        except Exception:
+            log.exception("update recording failed")
+        return await handler(event, data)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на update: визначає агенцію за чатом (група) або
+    користувачем і виставляє її в contextvar на час обробки. Апдейти, що
+    не належать жодній агенції, далі не йдуть.
+    """
+
+    def __init__(self, registry: tenants.TenantRegistry):
+        self.registry = registry
+
+    async def __call__(self, handler, event, data):
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        t = self.registry.resolve(chat.id if chat else None, user.id if user else None)
+        if t is None:
+            log.debug("update %s: no tenant for chat=%s user=%s", event.update_id,
+                      chat.id if chat else None, user.id if user else None)
+            return None
+        with tenants.use(t):
+            return await handler(event, data)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Session-middleware: час кожного вихідного виклику Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - t0, name)
+
+
+def build_bot(session=None) -> Bot:
+    if session is None and TELEGRAM_API_BASE:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-
-    dp = Dispatcher(storage=MemoryStorage())
+    bot.session.middleware(ApiTimingMiddleware())
+    return bot
+
+
+def build_dispatcher(storage=None, update_recorder: Optional[recorder.UpdateRecorder] = None) -> Dispatcher:
+    dp = Dispatcher(storage=storage or MemoryStorage())
+    dp.update.outer_middleware(TenantMiddleware(TENANTS))
+    if update_recorder is not None:
+        dp.update.outer_middleware(RecordingMiddleware(update_recorder))
+    timing = HandlerTimingMiddleware()
+    profiler = ProfilingMiddleware(PROFILER)
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(timing)
+        observer.middleware(profiler)
     dp.include_router(router)
+    return dp
 
-    await dp.start_polling(bot)
+
+# =========================
+# MAIN
+# =========================
+async def db_pool_janitor():
+    while True:
+        await asyncio.sleep(60)
+        closed = DB_POOL.sweep()
+        if closed:
+            log.debug("db pool: closed %s idle connections", closed)
+
+
+async def main():
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL, logging.INFO),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN не заданий")
+
+    for t in TENANTS.all():
+        with tenants.use(t):
+            init_db()
+            # групи маршрутів і користувачі з БД теж визначають агенцію
+            for r in list_routes():
+                TENANTS.bind_chat(int(r["chat_id"]), t)
+            for r in list_users():
+                TENANTS.bind_user(int(r["user_id"]), t)
+            _SUGGEST[t.id] = load_suggest_indexes()
+    log.info("tenants: %s", ", ".join(TENANTS.tenants))
+
+    update_recorder = None
+    if RECORD_UPDATES:
+        update_recorder = recorder.UpdateRecorder(RECORD_PATH, RECORD_SALT, scrub_text=RECORD_SCRUB_TEXT)
+        if TENANTS.single:
+            update_recorder.snapshot_start_db(DB_PATH)
+        log.info("recording updates to %s", RECORD_PATH)
+
+    bot = build_bot()
+    dp = build_dispatcher(update_recorder=update_recorder)
+
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+        log.info("metrics: http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+    background = []
+    if LOOP_WATCHDOG:
+        watchdog = loopwatch.LoopWatchdog(
+            loopwatch.make_diag_logger(DIAG_LOG_PATH),
+            threshold=LOOP_LAG_THRESHOLD_MS / 1000,
+            interval=LOOP_LAG_INTERVAL_MS / 1000,
+            on_lag=LOOP_LAG_SECONDS.observe,
+            on_stall=lambda info: LOOP_STALLS.inc(info.get("handler") or "unknown"),
+        )
+        background.append(asyncio.create_task(watchdog.run(), name="loopwatch"))
+    if any(t.stale_after_days > 0 for t in TENANTS.all()):
+        background.append(asyncio.create_task(stale_sweeper(bot), name="stale-sweeper"))
+    for t in TENANTS.all():
+        if t.digest_time:
+            with tenants.use(t):
+                background.append(asyncio.create_task(digest_scheduler(bot), name=f"digest-{t.id}"))
+    if DRAFT_TTL_HOURS > 0:
+        background.append(asyncio.create_task(draft_collector(dp.storage), name="draft-gc"))
+    if BACKUP_INTERVAL_HOURS > 0:
+        for t in TENANTS.all():
+            with tenants.use(t):
+                background.append(asyncio.create_task(backup_scheduler(), name=f"backup-{t.id}"))
+    background.append(asyncio.create_task(db_pool_janitor(), name="db-pool"))
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in background:
+            task.cancel()
+        DB_POOL.close_all()
+        PROFILER.flush()
+        if update_recorder is not None:
+            update_recorder.flush()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
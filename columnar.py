@@ -0,0 +1,118 @@
+# columnar.py
+# Колонковий шлях для агрегатів за рік і більше: status_events / offers
+# вантажаться одним проходом курсора в NumPy-масиви (epoch-секунди, коди
+# статусу і маклера), далі групування — np.unique по складеному ключу без
+# Python-циклу по рядках. NumPy опційний: без нього available() == False,
+# і бот рахує тим самим SQL, що й раніше.
+#
+#   cols = load_status_events(con)
+#   rows = daily_counts(cols, local_day)   # [(day, username, kind, cnt)]
+
+import sqlite3
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def available() -> bool:
+    return np is not None
+
+
+class EventColumns:
+    """Події як паралельні масиви; kind / user — індекси в kinds / users."""
+
+    __slots__ = ("ts", "kind", "user", "kinds", "users")
+
+    def __init__(self, ts, kind, user, kinds: List[str], users: List[str]):
+        self.ts = ts
+        self.kind = kind
+        self.user = user
+        self.kinds = kinds
+        self.users = users
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+def _load(con: sqlite3.Connection, sql: str, params: Sequence = ()) -> EventColumns:
+    # рядки — кортежі (ts, kind, username); коди рядкам видаємо словниками
+    # прямо в генераторі для np.fromiter, без проміжних списків
+    kinds: Dict[str, int] = {}
+    users: Dict[str, int] = {}
+    cur = con.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    arr = np.fromiter(
+        ((ts, kinds.setdefault(k, len(kinds)), users.setdefault(u, len(users))) for ts, k, u in cur),
+        dtype=[("ts", "i8"), ("kind", "i2"), ("user", "i4")],
+    )
+    return EventColumns(arr["ts"], arr["kind"], arr["user"], list(kinds), list(users))
+
+
+def load_status_events(con: sqlite3.Connection, start_ts: Optional[int] = None,
+                       end_ts: Optional[int] = None) -> EventColumns:
+    where, params = "", []
+    if start_ts is not None:
+        where, params = " AND at_ts >= ? AND at_ts < ?", [start_ts, end_ts]
+    return _load(
+        con,
+        "SELECT at_ts, status, COALESCE(username, '') FROM status_events WHERE at_ts IS NOT NULL" + where + ";",
+        params,
+    )
+
+
+def load_created_offers(con: sqlite3.Connection, start_ts: Optional[int] = None,
+                        end_ts: Optional[int] = None) -> EventColumns:
+    """Створення пропозицій як події kind='new' (як у daily_stats)."""
+    where, params = "", []
+    if start_ts is not None:
+        where, params = " AND created_ts >= ? AND created_ts < ?", [start_ts, end_ts]
+    return _load(
+        con,
+        "SELECT created_ts, 'new', COALESCE(broker_username, '') FROM offers WHERE created_ts IS NOT NULL" + where + ";",
+        params,
+    )
+
+
+def concat(a: EventColumns, b: EventColumns) -> EventColumns:
+    """Склеює два набори, перекодовуючи kind / user другого в словники першого."""
+    kpos = {k: i for i, k in enumerate(a.kinds)}
+    upos = {u: i for i, u in enumerate(a.users)}
+    kmap = np.array([kpos.setdefault(k, len(kpos)) for k in b.kinds] or [0], dtype=np.int16)
+    umap = np.array([upos.setdefault(u, len(upos)) for u in b.users] or [0], dtype=np.int32)
+    return EventColumns(
+        np.concatenate([a.ts, b.ts]),
+        np.concatenate([a.kind, kmap[b.kind]]),
+        np.concatenate([a.user, umap[b.user]]),
+        list(kpos), list(upos),
+    )
+
+
+def _day_codes(ts, day_of: Callable[[int], str]) -> Tuple[List[str], "np.ndarray"]:
+    # локальна доба через 15-хв кошики (зсуви зон кратні 15 хв): day_of
+    # викликається раз на кошик, а не на подію
+    buckets, inv = np.unique(ts // 900, return_inverse=True)
+    bucket_days = [day_of(int(b) * 900) for b in buckets]
+    days, day_inv = np.unique(np.array(bucket_days, dtype=object), return_inverse=True)
+    return list(days), day_inv[inv]
+
+
+def daily_counts(cols: EventColumns, day_of: Callable[[int], str]) -> List[Tuple[str, str, str, int]]:
+    """(day, username, kind, cnt) — те саме, що GROUP BY по добі, маклеру і виду."""
+    if not len(cols):
+        return []
+    days, day = _day_codes(cols.ts, day_of)
+    nk, nu = max(len(cols.kinds), 1), max(len(cols.users), 1)
+    key = (day.astype(np.int64) * nu + cols.user) * nk + cols.kind
+    keys, counts = np.unique(key, return_counts=True)
+    kind = keys % nk
+    user = (keys // nk) % nu
+    dcode = keys // (nk * nu)
+    return [
+        (days[d], cols.users[u], cols.kinds[k], int(c))
+        for d, u, k, c in zip(dcode.tolist(), user.tolist(), kind.tolist(), counts.tolist())
+    ]
+
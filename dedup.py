@@ -0,0 +1,95 @@
+# dedup.py
+# Відбиток пропозиції для пошуку дублів: нормалізовані вулиця / місто /
+# район / тип житла + сума оренди. Нормалізація прибирає регістр,
+# діакритику, пунктуацію і службові слова ("вул.", "ulica"), тож
+# "вул. Обходна 5" і "Obchodná 5" для точного відбитка різні (інша
+# абетка), а для нечіткого — однакові: fuzzy_key транслітерує кирилицю
+# і лишає від вулиці лише "кістяк" приголосних і цифр.
+#
+# Обидва ключі — короткі хеші, що лежать в індексованих колонках offers,
+# тож перевірка — пошук по індексу, а не перебір пропозицій.
+
+import re
+import hashlib
+import unicodedata
+from typing import Optional
+
+# службові слова адреси, що не розрізняють квартири
+_STOP_WORDS = {
+    "вул", "вулиця", "пров", "провулок", "просп", "проспект", "пл", "площа",
+    "ул", "улица",
+    "ul", "ulica", "nam", "namestie", "trieda", "street", "st", "str", "strasse", "road", "rd", "ave",
+}
+
+# після normalize() діакритики вже немає (й -> и, ї -> і)
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "e", "ж": "z",
+    "з": "z", "и": "i", "і": "i", "к": "k", "л": "l", "м": "m", "н": "n",
+    "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "ch", "ц": "c",
+    "ч": "c", "ш": "s", "щ": "s", "ь": "", "ю": "u", "я": "a", "ы": "y", "э": "e", "ъ": "",
+})
+
+# версія ключів: при зміні нормалізації бот перераховує збережені відбитки
+VERSION = 2
+
+_NON_WORD = re.compile(r"[^\w]+")
+# групи тисяч — рівно по три цифри: через пробіл ("1 200", "12 500"; оренда
+# до 99 999, тож "800 900" — два числа), через крапку чи кому ("1.200", "1,200")
+_NUMBER = re.compile(
+    r"(\d{1,2}(?:[ \u00a0]\d{3})+(?!\d)|\d{1,3}(?:[.,]\d{3})+(?!\d)|\d+)(?:[.,]\d+)?"
+)
+
+
+def normalize(value: Optional[str]) -> str:
+    """Регістр, діакритика, пунктуація і службові слова геть; пробіли — одинарні."""
+    # á -> a, ž -> z (й -> и теж, але однаково з обох боків порівняння)
+    text = unicodedata.normalize("NFKD", (value or "").casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    words = [w for w in _NON_WORD.sub(" ", text).split() if w not in _STOP_WORDS]
+    return " ".join(words)
+
+
+def parse_rent(value: Optional[str]) -> Optional[int]:
+    """Перше число в рядку оренди: "1 200 €/міс", "1,200 €" -> 1200; без числа — None."""
+    m = _NUMBER.search(value or "")
+    if not m:
+        return None
+    # роздільники тисяч — частина числа, копійки відкидаємо
+    return int(re.sub(r"[ .,\u00a0]", "", m.group(1)))
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprint(street: str, city: str, district: str, housing_type: str, rent: str) -> Optional[str]:
+    """Точний відбиток; None, якщо немає вулиці, міста чи суми — тоді не порівнюємо."""
+    s, c, amount = normalize(street), normalize(city), parse_rent(rent)
+    if not s or not c or amount is None:
+        return None
+    return _digest(s, c, normalize(district), normalize(housing_type), str(amount))
+
+
+def latin(text: str) -> str:
+    """Кирилиця -> латиниця (для вже нормалізованого тексту): "братислава" -> "bratislava"."""
+    return text.translate(_TRANSLIT)
+
+
+def _skeleton(text: str) -> str:
+    # латиниця без голосних і подвоєнь літер: "obchodna 5" / "обходна 5" -> "bchdn5";
+    # цифри лишаються всі — "11" і "1" різні будинки
+    out = []
+    for ch in latin(text).replace(" ", ""):
+        if ch in "aeiouy":
+            continue
+        if not out or out[-1] != ch or ch.isdigit():
+            out.append(ch)
+    return "".join(out)
+
+
+def fuzzy_key(street: str, city: str, rent: str) -> Optional[str]:
+    """Нечіткий ключ: кістяк вулиці + місто (транслітом) + сума; район і тип не враховуються."""
+    s, c, amount = normalize(street), normalize(city), parse_rent(rent)
+    if not s or not c or amount is None:
+        return None
+    return _digest(_skeleton(s), _skeleton(c), str(amount))
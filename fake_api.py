@@ -0,0 +1,356 @@
+# fake_api.py
+# Локальна заглушка api.telegram.org на aiohttp для навантажувальних тестів:
+# бот ходить сюди через справжній AiohttpSession (TELEGRAM_API_BASE), а
+# сервер вміє відповідати 429 retry_after, затримками і помилками.
+#
+#   python fake_api.py --port 8081 --rate-429 0.05 --latency-ms 40
+#   TELEGRAM_API_BASE=http://127.0.0.1:8081 python bot.py
+#
+# Керування (JSON):
+#   POST /_control/updates  — додати апдейт(и) у чергу getUpdates (або в webhook)
+#   POST /_control/config   — змінити параметри фейлів на льоту
+#   GET  /_control/stats    — лічильники викликів і надіслані повідомлення
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web, ClientSession
+
+BOT_USER = {"id": 123456789, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FaultConfig:
+    def __init__(self, rate_429: float = 0.0, retry_after: int = 1, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, fail_rate: float = 0.0, chat_limit_per_min: int = 0,
+                 global_limit_per_sec: int = 0):
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        # емуляція реальних лімітів Telegram: ~20 повідомлень/хв у групу, ~30/с загалом
+        self.chat_limit_per_min = chat_limit_per_min
+        self.global_limit_per_sec = global_limit_per_sec
+
+    def update(self, data: Dict[str, Any]):
+        for k, v in data.items():
+            if hasattr(self, k):
+                setattr(self, k, type(getattr(self, k))(v))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class FakeTelegram:
+    SEND_METHODS = {"sendmessage", "sendmediagroup", "senddocument", "sendphoto",
+                    "editmessagetext", "editmessagemedia", "editmessagereplymarkup"}
+
+    def __init__(self, faults: FaultConfig, seed: Optional[int] = None):
+        self.faults = faults
+        self.rnd = random.Random(seed)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.sent: List[Dict[str, Any]] = []
+        self.updates: deque = deque()
+        self._update_id = 0
+        self._new_update = asyncio.Event()
+        self._message_ids: Dict[int, int] = defaultdict(lambda: 1000)
+        # повідомлення, що зараз є в чаті (надіслані й не видалені)
+        self.messages: Dict[int, set] = defaultdict(set)
+        self._chat_hits: Dict[int, deque] = defaultdict(deque)
+        self._global_hits: deque = deque()
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._http: Optional[ClientSession] = None
+
+    # ---------- helpers ----------
+    @staticmethod
+    def ok(result: Any, status: int = 200) -> web.Response:
+        return web.json_response({"ok": True, "result": result}, status=status)
+
+    @staticmethod
+    def error(code: int, description: str, retry_after: Optional[int] = None) -> web.Response:
+        body: Dict[str, Any] = {"ok": False, "error_code": code, "description": description}
+        if retry_after is not None:
+            body["parameters"] = {"retry_after": retry_after}
+        return web.json_response(body, status=code)
+
+    @staticmethod
+    def _json_field(params: Dict[str, Any], key: str, default=None):
+        raw = params.get(key)
+        if raw is None:
+            return default
+        if isinstance(raw, str):
+            try:
+                return json.loads(raw)
+            except ValueError:
+                return raw
+        return raw
+
+    def _message(self, chat_id: int, **extra) -> Dict[str, Any]:
+        self._message_ids[chat_id] += 1
+        msg = {
+            "message_id": self._message_ids[chat_id],
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "from": BOT_USER,
+        }
+        msg.update(extra)
+        return msg
+
+    def _store(self, chat_id: int, *message_ids: int):
+        self.messages[chat_id].update(message_ids)
+
+    def _rate_limited(self, chat_id: Optional[int]) -> Optional[int]:
+        """retry_after (сек), якщо запит перевищує емульовані ліміти."""
+        now = time.monotonic()
+        f = self.faults
+        if f.global_limit_per_sec:
+            q = self._global_hits
+            while q and now - q[0] > 1.0:
+                q.popleft()
+            if len(q) >= f.global_limit_per_sec:
+                return 1
+            q.append(now)
+        if f.chat_limit_per_min and chat_id is not None and chat_id < 0:
+            q = self._chat_hits[chat_id]
+            while q and now - q[0] > 60.0:
+                q.popleft()
+            if len(q) >= f.chat_limit_per_min:
+                return max(1, int(60 - (now - q[0])) + 1)
+            q.append(now)
+        return None
+
+    # ---------- bot api ----------
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        key = method.lower()
+        self.calls[method] += 1
+        params: Dict[str, Any] = dict(await request.post())
+        if not params and request.content_type == "application/json":
+            params = await request.json()
+
+        f = self.faults
+        if f.latency_ms or f.jitter_ms:
+            await asyncio.sleep((f.latency_ms + self.rnd.uniform(0, f.jitter_ms)) / 1000)
+
+        if key != "getupdates":
+            if f.fail_rate and self.rnd.random() < f.fail_rate:
+                self.errors[method] += 1
+                return self.error(500, "Internal Server Error: injected failure")
+            if f.rate_429 and self.rnd.random() < f.rate_429:
+                self.errors[method] += 1
+                return self.error(429, f"Too Many Requests: retry after {f.retry_after}", f.retry_after)
+            if key in self.SEND_METHODS:
+                chat_id = params.get("chat_id")
+                retry = self._rate_limited(int(chat_id) if chat_id not in (None, "") else None)
+                if retry is not None:
+                    self.errors[method] += 1
+                    return self.error(429, f"Too Many Requests: retry after {retry}", retry)
+
+        fn = getattr(self, f"m_{key}", None)
+        if fn is None:
+            return self.error(404, "Not Found: method not found")
+        return await fn(params)
+
+    async def m_getme(self, params):
+        return self.ok(BOT_USER)
+
+    async def m_sendmessage(self, params):
+        chat_id = int(params["chat_id"])
+        msg = self._message(chat_id, text=params.get("text", ""))
+        self._store(chat_id, msg["message_id"])
+        self.sent.append({"method": "sendMessage", "chat_id": chat_id, "message_id": msg["message_id"]})
+        return self.ok(msg)
+
+    async def m_sendmediagroup(self, params):
+        chat_id = int(params["chat_id"])
+        media = self._json_field(params, "media", [])
+        if not 2 <= len(media) <= 10:
+            return self.error(400, "Bad Request: wrong number of media in the group")
+        group_id = str(self.rnd.getrandbits(60))
+        out = []
+        for m in media:
+            photo = [{"file_id": m.get("media"), "file_unique_id": f"u{m.get('media')}", "width": 1280, "height": 853}]
+            out.append(self._message(chat_id, media_group_id=group_id, photo=photo))
+        self._store(chat_id, *(m["message_id"] for m in out))
+        self.sent.append({"method": "sendMediaGroup", "chat_id": chat_id, "message_ids": [m["message_id"] for m in out]})
+        return self.ok(out)
+
+    async def m_senddocument(self, params):
+        chat_id = int(params["chat_id"])
+        doc = params.get("document")
+        name = getattr(doc, "filename", None) or str(doc)
+        size = len(doc.file.read()) if hasattr(doc, "file") else 0
+        msg = self._message(chat_id, document={"file_id": f"doc_{name}", "file_unique_id": f"udoc_{name}",
+                                               "file_name": name, "file_size": size})
+        self._store(chat_id, msg["message_id"])
+        self.sent.append({"method": "sendDocument", "chat_id": chat_id, "message_id": msg["message_id"], "size": size})
+        return self.ok(msg)
+
+    async def m_sendphoto(self, params):
+        chat_id = int(params["chat_id"])
+        msg = self._message(chat_id, photo=[{"file_id": str(params.get("photo")), "file_unique_id": "u",
+                                             "width": 1280, "height": 853}])
+        self._store(chat_id, msg["message_id"])
+        return self.ok(msg)
+
+    async def m_editmessagetext(self, params):
+        chat_id = int(params["chat_id"])
+        msg = self._message(chat_id, text=params.get("text", ""))
+        msg["message_id"] = int(params["message_id"])
+        self.sent.append({"method": "editMessageText", "chat_id": chat_id, "message_id": msg["message_id"]})
+        return self.ok(msg)
+
+    async def m_editmessagemedia(self, params):
+        chat_id = int(params["chat_id"])
+        msg = self._message(chat_id)
+        msg["message_id"] = int(params["message_id"])
+        return self.ok(msg)
+
+    async def m_editmessagereplymarkup(self, params):
+        return await self.m_editmessagemedia(params)
+
+    async def m_answercallbackquery(self, params):
+        return self.ok(True)
+
+    async def m_deletemessage(self, params):
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"])
+        # повідомлень користувачів (апдейтів) у сховищі немає — не вважаємо це помилкою
+        self.messages[chat_id].discard(message_id)
+        self.sent.append({"method": "deleteMessage", "chat_id": chat_id, "message_id": message_id})
+        return self.ok(True)
+
+    async def m_deletemessages(self, params):
+        # як у Bot API: 1..100 id, відсутні повідомлення мовчки пропускаються
+        chat_id = int(params["chat_id"])
+        ids = [int(m) for m in self._json_field(params, "message_ids", [])]
+        if not 1 <= len(ids) <= 100:
+            return self.error(400, "Bad Request: too many messages to delete" if ids else
+                              "Bad Request: message identifiers are not specified")
+        self.messages[chat_id].difference_update(ids)
+        self.sent.append({"method": "deleteMessages", "chat_id": chat_id, "message_ids": ids})
+        return self.ok(True)
+
+    async def m_getfile(self, params):
+        fid = params.get("file_id", "")
+        return self.ok({"file_id": fid, "file_unique_id": f"u{fid}", "file_size": 0, "file_path": f"files/{fid}"})
+
+    async def m_setwebhook(self, params):
+        self.webhook_url = params.get("url") or None
+        self.webhook_secret = params.get("secret_token") or None
+        return self.ok(True)
+
+    async def m_deletewebhook(self, params):
+        self.webhook_url = None
+        return self.ok(True)
+
+    async def m_getwebhookinfo(self, params):
+        return self.ok({"url": self.webhook_url or "", "has_custom_certificate": False,
+                        "pending_update_count": len(self.updates)})
+
+    async def m_getupdates(self, params):
+        if self.webhook_url:
+            return self.error(409, "Conflict: can't use getUpdates method while webhook is active")
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+        return self.ok(list(self.updates)[:limit])
+
+    # ---------- control ----------
+    async def c_updates(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        items = data if isinstance(data, list) else [data]
+        for u in items:
+            self._update_id += 1
+            u = dict(u)
+            u["update_id"] = self._update_id
+            if self.webhook_url:
+                await self._deliver_webhook(u)
+            else:
+                self.updates.append(u)
+        self._new_update.set()
+        return web.json_response({"queued": len(items), "last_update_id": self._update_id})
+
+    async def _deliver_webhook(self, update: Dict[str, Any]):
+        if self._http is None:
+            self._http = ClientSession()
+        headers = {}
+        if self.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook_secret
+        try:
+            async with self._http.post(self.webhook_url, json=update, headers=headers) as resp:
+                await resp.read()
+        except Exception as e:
+            self.errors["webhook"] += 1
+            print(f"webhook delivery failed: {e!r}")
+
+    async def c_config(self, request: web.Request) -> web.Response:
+        self.faults.update(await request.json())
+        return web.json_response(self.faults.as_dict())
+
+    async def c_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": dict(self.calls),
+            "errors": dict(self.errors),
+            "sent": self.sent[-int(request.query.get("last", "100")):],
+            "pending_updates": len(self.updates),
+            "webhook_url": self.webhook_url,
+            "faults": self.faults.as_dict(),
+        })
+
+    async def close(self, app: web.Application):
+        if self._http is not None:
+            await self._http.close()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        app.router.add_post("/_control/updates", self.c_updates)
+        app.router.add_post("/_control/config", self.c_config)
+        app.router.add_get("/_control/stats", self.c_stats)
+        app.on_cleanup.append(self.close)
+        return app
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local Telegram Bot API stand-in")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="fraction of calls answered with 429")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    ap.add_argument("--chat-limit-per-min", type=int, default=0, help="emulate group flood limit (0=off)")
+    ap.add_argument("--global-limit-per-sec", type=int, default=0, help="emulate global flood limit (0=off)")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args(argv)
+
+    faults = FaultConfig(
+        rate_429=args.rate_429, retry_after=args.retry_after, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, fail_rate=args.fail_rate,
+        chat_limit_per_min=args.chat_limit_per_min, global_limit_per_sec=args.global_limit_per_sec,
+    )
+    web.run_app(FakeTelegram(faults, seed=args.seed).make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
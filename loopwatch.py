@@ -0,0 +1,143 @@
+# loopwatch.py
+# Сторож event loop: міряє лаг циклу і, коли цикл заблоковано довше за
+# поріг, з окремого потоку знімає стек хендлера, що зараз виконується
+# (sqlite3 / openpyxl синхронно всередині корутин), і пише це в
+# ротований діагностичний лог.
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import contextlib
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Optional
+
+# asyncio.Task -> {"handler", "update_type", "state", "started"}
+_INFLIGHT: Dict[asyncio.Task, Dict[str, Any]] = {}
+
+
+@contextlib.contextmanager
+def track(**info):
+    """Позначає поточну задачу як "виконує хендлер" на час блоку."""
+    task = asyncio.current_task()
+    if task is None:
+        yield
+        return
+    info["started"] = time.monotonic()
+    _INFLIGHT[task] = info
+    try:
+        yield
+    finally:
+        _INFLIGHT.pop(task, None)
+
+
+def make_diag_logger(path: str, max_bytes: int = 5 * 1024 * 1024, backups: int = 5) -> logging.Logger:
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    logger = logging.getLogger("bot.diagnostics")
+    if not any(isinstance(h, RotatingFileHandler) for h in logger.handlers):
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+class LoopWatchdog:
+    """
+    Дві половини:
+    - корутина run(): кожні interval секунд спить і міряє, наскільки пізно
+      прокинулась (це і є лаг), оновлює heartbeat;
+    - потік-сторож: якщо heartbeat не оновлювався довше за threshold, цикл
+      зараз заблокований — знімаємо стек потоку циклу і поточну задачу.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        threshold: float = 0.25,
+        interval: float = 0.1,
+        on_lag: Optional[Callable[[float], None]] = None,
+        on_stall: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.logger = logger
+        self.threshold = threshold
+        self.interval = interval
+        self.on_lag = on_lag
+        self.on_stall = on_stall
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stall: Optional[Dict[str, Any]] = None
+        self._stall_seq = 0
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._thread = threading.Thread(target=self._watch, name="loopwatch", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                t0 = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self._heartbeat = now
+                lag = max(0.0, now - t0 - self.interval)
+                if self.on_lag is not None:
+                    self.on_lag(lag)
+                stall = self._stall
+                if stall is not None:
+                    self._stall = None
+                    self.logger.warning(
+                        "stall #%s resolved: loop lag %.0f ms, handler=%s",
+                        stall["id"], lag * 1000, stall.get("handler"),
+                    )
+                elif lag > self.threshold:
+                    # блок був коротший за період потоку-сторожа — стека немає, але лаг фіксуємо
+                    self.logger.warning("loop lag %.0f ms (no stack captured)", lag * 1000)
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        period = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(period):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            if blocked_for > self.threshold and self._stall is None:
+                self._capture(blocked_for)
+
+    def _capture(self, blocked_for: float):
+        self._stall_seq += 1
+        info: Dict[str, Any] = {"id": self._stall_seq, "blocked_ms": round(blocked_for * 1000)}
+
+        task = None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            pass
+        meta = _INFLIGHT.get(task) if task is not None else None
+        if meta:
+            info["handler"] = meta.get("handler")
+            info["update_type"] = meta.get("update_type")
+            info["state"] = meta.get("state")
+            info["handler_ms"] = round((time.monotonic() - meta["started"]) * 1000)
+        elif task is not None:
+            info["task"] = task.get_name()
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+
+        self._stall = info
+        self.logger.warning(
+            "stall #%s: loop blocked %s ms; handler=%s update=%s state=%s handler_running=%s ms\n%s",
+            info["id"], info["blocked_ms"], info.get("handler"), info.get("update_type"),
+            info.get("state"), info.get("handler_ms"), stack,
+        )
+        if self.on_stall is not None:
+            self.on_stall(info)
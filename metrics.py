@@ -0,0 +1,220 @@
+# metrics.py
+# Легкий реєстр метрик у форматі Prometheus (text exposition 0.0.4)
+# без зовнішніх залежностей: лічильники, гістограми, декоратор таймінгу
+# і локальний HTTP-ендпоінт /metrics (aiohttp вже є залежністю aiogram).
+
+import time
+import asyncio
+import functools
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY: List["_Metric"] = []
+_LOCK = threading.Lock()
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{n}="{v}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        with _LOCK:
+            _REGISTRY.append(self)
+
+    def _key(self, labels: Tuple) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {labels}")
+        return tuple(str(x) for x in labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, value: float = 1.0):
+        key = self._key(labels)
+        with _LOCK:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with _LOCK:
+            return sorted(self._values.items())
+
+    def render(self) -> List[str]:
+        out = super().render()
+        for key, v in self.items():
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_num(v)}")
+        return out
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        key = self._key(labels)
+        with _LOCK:
+            self._values[key] = float(value)
+
+
+class _HistState:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self, n: int):
+        self.counts = [0] * n
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._states: Dict[Tuple[str, ...], _HistState] = {}
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with _LOCK:
+            st = self._states.get(key)
+            if st is None:
+                st = self._states[key] = _HistState(len(self.buckets))
+            st.counts[idx] += 1
+            st.total += value
+            st.count += 1
+            if value > st.max:
+                st.max = value
+
+    def summary(self) -> List[Dict]:
+        """count / sum / avg / p50 / p95 / max по кожному набору міток (p* — оцінка по бакетах)."""
+        out = []
+        with _LOCK:
+            items = [(k, list(st.counts), st.total, st.count, st.max) for k, st in self._states.items()]
+        for key, counts, total, count, mx in items:
+            out.append(
+                {
+                    "labels": dict(zip(self.labelnames, key)),
+                    "count": count,
+                    "sum": total,
+                    "avg": total / count if count else 0.0,
+                    "p50": self._quantile(counts, count, 0.50, mx),
+                    "p95": self._quantile(counts, count, 0.95, mx),
+                    "max": mx,
+                }
+            )
+        return out
+
+    def _quantile(self, counts: List[int], count: int, q: float, mx: float) -> float:
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                upper = self.buckets[i]
+                return min(upper, mx) if upper != float("inf") else mx
+        return mx
+
+    def render(self) -> List[str]:
+        out = super().render()
+        with _LOCK:
+            items = sorted((k, list(st.counts), st.total, st.count) for k, st in self._states.items())
+        for key, counts, total, count in items:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                le = 'le="%s"' % _fmt_num(b)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {acc}")
+            labels = _fmt_labels(self.labelnames, key)
+            out.append(f"{self.name}_sum{labels} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{labels} {count}")
+        return out
+
+
+def render() -> str:
+    with _LOCK:
+        metrics = list(_REGISTRY)
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+def timed(hist: Histogram, *labels):
+    """Декоратор: час виконання sync/async функції -> hist (мітки фіксовані)."""
+
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    hist.observe(time.perf_counter() - t0, *labels)
+
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - t0, *labels)
+
+        return wrapper
+
+    return deco
+
+
+async def start_http_server(host: str, port: int, path: str = "/metrics"):
+    """Піднімає HTTP-ендпоінт з метриками. Повертає aiohttp AppRunner (для cleanup())."""
+    from aiohttp import web
+
+    async def handle(request: "web.Request") -> "web.Response":
+        return web.Response(
+            body=render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
+
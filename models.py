@@ -0,0 +1,188 @@
+# models.py
+# Типізовані записи замість sqlite3.Row / dict: компактні (slots) і
+# незмінні (frozen), тож один екземпляр можна безпечно тримати в кеші і
+# віддавати кільком хендлерам. Фото декодуються з photos_json один раз —
+# при побудові з рядка. offers.version росте з кожним UPDATE рядка:
+# OfferCache звіряє її дешевим SELECT version замість повного читання.
+
+import json
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+def _decode_photos(raw: Optional[str]) -> Tuple[str, ...]:
+    try:
+        value = json.loads(raw or "[]")
+    except ValueError:
+        return ()
+    return tuple(str(x) for x in value) if isinstance(value, list) else ()
+
+
+def _int_or_none(value) -> Optional[int]:
+    return int(value) if value is not None else None
+
+
+@dataclass(slots=True, frozen=True)
+class Offer:
+    id: int
+    seq: int
+    created_at: str
+    created_ts: Optional[int]
+    category: str
+    housing_type: str
+    street: str
+    city: str
+    district: str
+    advantages: str
+    rent: str
+    deposit: str
+    commission: str
+    parking: str
+    move_in_from: str
+    viewings_from: str
+    broker_username: str
+    broker_user_id: Optional[int]
+    photos: Tuple[str, ...]
+    current_status: str
+    is_published: bool
+    published_chat_id: Optional[int]
+    published_message_id: Optional[int]
+    published_hash: Optional[str]
+    source: Optional[str]
+    status_changed_ts: Optional[int]
+    stale_notified_ts: Optional[int]
+    version: int
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Offer":
+        return cls(
+            id=int(row["id"]),
+            seq=int(row["seq"]),
+            created_at=row["created_at"] or "",
+            created_ts=_int_or_none(row["created_ts"]),
+            category=row["category"] or "",
+            housing_type=row["housing_type"] or "",
+            street=row["street"] or "",
+            city=row["city"] or "",
+            district=row["district"] or "",
+            advantages=row["advantages"] or "",
+            rent=row["rent"] or "",
+            deposit=row["deposit"] or "",
+            commission=row["commission"] or "",
+            parking=row["parking"] or "",
+            move_in_from=row["move_in_from"] or "",
+            viewings_from=row["viewings_from"] or "",
+            broker_username=row["broker_username"] or "",
+            broker_user_id=_int_or_none(row["broker_user_id"]),
+            photos=_decode_photos(row["photos_json"]),
+            current_status=(row["current_status"] or "unknown").strip(),
+            is_published=bool(row["is_published"]),
+            published_chat_id=_int_or_none(row["published_chat_id"]),
+            published_message_id=_int_or_none(row["published_message_id"]),
+            published_hash=row["published_hash"],
+            source=row["source"],
+            status_changed_ts=_int_or_none(row["status_changed_ts"]),
+            stale_notified_ts=_int_or_none(row["stale_notified_ts"]),
+            version=int(row["version"] or 0),
+        )
+
+
+# колонки OfferBrief — для SELECT у запитах, що повертають OfferBrief
+OFFER_BRIEF_COLUMNS = (
+    "id, seq, current_status, street, city, district, rent, broker_user_id, broker_username, "
+    "status_changed_ts, is_published, published_chat_id, published_message_id"
+)
+
+
+@dataclass(slots=True, frozen=True)
+class OfferBrief:
+    """
+    Вузька проєкція offers для списків (/list, /my), масової зміни статусу і
+    запитів про застарілі: без фото й описових полів, які там не потрібні.
+    """
+    id: int
+    seq: int
+    current_status: str
+    street: str
+    city: str
+    district: str
+    rent: str
+    broker_user_id: Optional[int]
+    broker_username: str
+    status_changed_ts: Optional[int]
+    is_published: bool
+    published_chat_id: Optional[int]
+    published_message_id: Optional[int]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "OfferBrief":
+        return cls(
+            id=int(row["id"]),
+            seq=int(row["seq"]),
+            current_status=(row["current_status"] or "unknown").strip(),
+            street=row["street"] or "",
+            city=row["city"] or "",
+            district=row["district"] or "",
+            rent=row["rent"] or "",
+            broker_user_id=_int_or_none(row["broker_user_id"]),
+            broker_username=row["broker_username"] or "",
+            status_changed_ts=_int_or_none(row["status_changed_ts"]),
+            is_published=bool(row["is_published"]),
+            published_chat_id=_int_or_none(row["published_chat_id"]),
+            published_message_id=_int_or_none(row["published_message_id"]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class StatusEvent:
+    id: int
+    offer_id: Optional[int]
+    offer_seq: Optional[int]
+    at: str
+    at_ts: Optional[int]
+    status: str
+    username: Optional[str]
+    user_id: Optional[int]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "StatusEvent":
+        return cls(
+            id=int(row["id"]),
+            offer_id=_int_or_none(row["offer_id"]),
+            offer_seq=_int_or_none(row["offer_seq"]),
+            at=row["at"] or "",
+            at_ts=_int_or_none(row["at_ts"]),
+            status=row["status"] or "",
+            username=row["username"],
+            user_id=_int_or_none(row["user_id"]),
+        )
+
+
+class OfferCache:
+    """LRU Offer по id; запис дійсний, поки в БД та сама offers.version."""
+
+    def __init__(self, size: int = 512):
+        self.size = size
+        self._items: "OrderedDict[int, Offer]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, offer_id: int) -> Optional[Offer]:
+        offer = self._items.get(offer_id)
+        if offer is not None:
+            self._items.move_to_end(offer_id)
+        return offer
+
+    def put(self, offer: Offer):
+        self._items[offer.id] = offer
+        self._items.move_to_end(offer.id)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def drop(self, offer_id: int):
+        self._items.pop(offer_id, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
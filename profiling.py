@@ -0,0 +1,122 @@
+# profiling.py
+# Вибірковий cProfile для хендлерів у проді: частка апдейтів (rate) або
+# всі апдейти, повільніші за slow_ms. Профілі агрегуються по імені
+# хендлера і скидаються у <dir>/<handler>.pstats (snakeviz / pstats).
+#
+# cProfile міряє весь потік, а не задачу: поки хендлер чекає на await,
+# виконується код інших апдейтів. Тому профілюємо лише апдейт, що
+# обробляється сам, а профіль, під час якого почався інший апдейт,
+# відкидаємо. Фонові задачі (синхронізація карток, черга публікацій)
+# усе одно можуть потрапити в профіль — це видно в /profile.
+
+import os
+import time
+import random
+import pstats
+import cProfile
+import logging
+import threading
+from typing import Dict, Optional
+
+log = logging.getLogger("bot.profiling")
+
+
+class UpdateProfiler:
+    def __init__(self, out_dir: str, rate: float = 0.01, slow_ms: int = 0, enabled: bool = False,
+                 flush_every: float = 30.0):
+        self.out_dir = out_dir
+        self.rate = rate
+        self.slow_ms = slow_ms
+        self.enabled = enabled
+        self.flush_every = flush_every
+        self._active = False
+        # апдейтів зараз у хендлерах; чи почався інший апдейт під час профілю
+        self._inflight = 0
+        self._mixed = False
+        self.skipped = 0
+        self.discarded = 0
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._counts: Dict[str, int] = {}
+        self._dirty: set = set()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, rate: Optional[float] = None, slow_ms: Optional[int] = None):
+        if rate is not None:
+            self.rate = max(0.0, min(1.0, rate))
+        if slow_ms is not None:
+            self.slow_ms = max(0, slow_ms)
+        self.enabled = enabled
+        if not enabled:
+            self.flush()
+
+    def begin(self) -> Optional[tuple]:
+        """
+        Викликається для кожного апдейту (парний end() — теж для кожного).
+        Повертає (profile, sampled) або None, якщо цей апдейт не профілюємо:
+        профіль знімаємо лише тоді, коли інших апдейтів у хендлерах немає.
+        """
+        self._inflight += 1
+        if self._active:
+            self._mixed = True
+        if not self.enabled:
+            return None
+        sampled = random.random() < self.rate
+        if not sampled and not self.slow_ms:
+            return None
+        if self._inflight > 1:
+            self.skipped += 1
+            return None
+        prof = cProfile.Profile()
+        self._active = True
+        try:
+            prof.enable()
+        except ValueError:
+            # інший профайлер уже активний у цьому потоці
+            self._active = False
+            return None
+        return prof, sampled
+
+    def end(self, token: Optional[tuple], handler: str, duration: float):
+        self._inflight -= 1
+        if token is None:
+            return
+        prof, sampled = token
+        prof.disable()
+        self._active = False
+        mixed, self._mixed = self._mixed, False
+        if mixed:
+            # у профілі і код апдейту, що почався паралельно
+            self.discarded += 1
+            return
+        if not sampled and duration * 1000 < self.slow_ms:
+            return
+        with self._lock:
+            st = self._stats.get(handler)
+            if st is None:
+                self._stats[handler] = pstats.Stats(prof)
+            else:
+                st.add(prof)
+            self._counts[handler] = self._counts.get(handler, 0) + 1
+            self._dirty.add(handler)
+        if time.monotonic() - self._last_flush >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+            if not dirty:
+                return
+            os.makedirs(self.out_dir, exist_ok=True)
+            for name in dirty:
+                path = os.path.join(self.out_dir, f"{name}.pstats")
+                try:
+                    self._stats[name].dump_stats(path)
+                except OSError:
+                    log.exception("profile dump failed: %s", path)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
@@ -0,0 +1,77 @@
+# ratelimit.py
+# Обмежувач вихідних викликів Bot API під ліміти Telegram:
+# ~30 повідомлень/с загалом, ~20/хв в одну групу, ~1/с в один приватний чат.
+# Через нього йдуть публікації і масові операції, щоб не ловити 429.
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate            # токенів за секунду
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0    # після 429 retry_after
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class TelegramLimiter:
+    def __init__(self, global_per_sec: float = 25, group_per_min: float = 18, private_per_sec: float = 1,
+                 max_chats: int = 1024):
+        self.global_bucket = TokenBucket(global_per_sec, global_per_sec)
+        self.group_per_min = group_per_min
+        self.private_per_sec = private_per_sec
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if chat_id < 0:
+                # групи: невеликий burst, далі рівномірно group_per_min
+                b = TokenBucket(self.group_per_min / 60, min(self.group_per_min, 3))
+            else:
+                b = TokenBucket(self.private_per_sec, 3)
+            self._chats[chat_id] = b
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return b
+
+    async def acquire(self, chat_id: Optional[int] = None):
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def penalize(self, chat_id: Optional[int], retry_after: float):
+        """Після 429: не ходимо в цей чат (і загалом, якщо чат невідомий) retry_after секунд."""
+        if chat_id is not None:
+            self._chat_bucket(chat_id).block(retry_after)
+        else:
+            self.global_bucket.block(retry_after)
+
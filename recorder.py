@@ -0,0 +1,192 @@
+# recorder.py
+# Запис вхідних апдейтів у стиснутий append-only лог (gzip, JSON lines) з
+# псевдонімізацією персональних даних — для відтворення інцидентів і
+# бенчмарків на реальному профілі трафіку (див. replay.py).
+#
+# Формат: кожен flush дописує окремий gzip-member, тож файл читається
+# звичайним gzip.open() як один потік, а обірваний хвіст (kill -9)
+# губить лише останню пачку.
+#
+# Стартова копія БД (<log>.start.db) псевдонімізується тим самим salt:
+# id і імена в ній збігаються з тими, що в лозі, тож перевірки власника
+# і ролей на replay йдуть тим самим шляхом, що й у проді.
+
+import os
+import gzip
+import hmac
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Any, Dict, Iterator, List
+
+log = logging.getLogger("bot.recorder")
+
+# ключі, значення яких замінюємо псевдонімом
+_NAME_KEYS = {"first_name", "last_name", "username"}
+# ключі, які просто викидаємо
+_DROP_KEYS = {"phone_number", "email", "bio", "contact", "location", "venue"}
+# об'єкти, у яких "id" — це ідентифікатор людини
+_PERSON_KEYS = {"from", "from_user", "user", "sender_chat", "chat", "forward_from"}
+
+# колонки стартової БД з даними людей — псевдонімізуються тим самим salt,
+# що й лог, тож власник пропозиції і ролі на replay збігаються з апдейтами
+_DB_ID_COLUMNS = {
+    "offers": ("broker_user_id",),
+    "status_events": ("user_id",),
+    "users": ("user_id", "added_by"),
+}
+_DB_NAME_COLUMNS = {
+    "offers": ("broker_username",),
+    "status_events": ("username",),
+    "users": ("username",),
+    "daily_stats": ("username",),
+}
+# вільний текст пропозицій (при scrub_text) і похідні від адреси ключі
+_DB_TEXT_COLUMNS = {
+    "offers": ("street", "city", "district", "advantages", "rent", "deposit", "commission",
+               "parking", "move_in_from", "viewings_from"),
+}
+_DB_DERIVED_COLUMNS = {
+    "offers": ("fingerprint", "fuzzy_key"),
+}
+
+
+def _pseudo_id(salt: bytes, value: int) -> int:
+    # стабільний (для одного salt) і необоротний; групи (<0) лишаємо як є
+    if value < 0:
+        return value
+    digest = hmac.new(salt, str(value).encode(), hashlib.sha256).hexdigest()
+    return 10_000_000 + int(digest[:12], 16) % 9_000_000_000
+
+
+def _pseudo_name(salt: bytes, value: str) -> str:
+    return "u" + hmac.new(salt, value.encode(), hashlib.sha256).hexdigest()[:10]
+
+
+def _pseudo_handle(salt: bytes, value: Any) -> Any:
+    # у БД ім'я зберігається як "@username", а без username — як id текстом;
+    # id мапимо як id, щоб збігся з псевдонімом from.id у лозі
+    if not isinstance(value, str) or not value:
+        return value
+    at = value.startswith("@")
+    name = value[1:] if at else value
+    name = str(_pseudo_id(salt, int(name))) if name.isdigit() else _pseudo_name(salt, name)
+    return "@" + name if at else name
+
+
+def scrub_db(con: sqlite3.Connection, salt: bytes, scrub_text: bool = False):
+    """Псевдонімізує дані людей у копії БД на місці (і текст пропозицій при scrub_text)."""
+    con.create_function("pseudo_id", 1, lambda v: _pseudo_id(salt, v) if isinstance(v, int) else v,
+                        deterministic=True)
+    con.create_function("pseudo_handle", 1, lambda v: _pseudo_handle(salt, v), deterministic=True)
+    con.create_function("pseudo_text", 1, lambda v: "x" * len(v) if isinstance(v, str) else v,
+                        deterministic=True)
+    plan = [(_DB_ID_COLUMNS, "pseudo_id({c})"), (_DB_NAME_COLUMNS, "pseudo_handle({c})")]
+    if scrub_text:
+        plan += [(_DB_TEXT_COLUMNS, "pseudo_text({c})"), (_DB_DERIVED_COLUMNS, "NULL")]
+    with con:
+        for columns, expr in plan:
+            for table, cols in columns.items():
+                present = {r[1] for r in con.execute(f"PRAGMA table_info({table});")}
+                sets = [f"{c} = {expr.format(c=c)}" for c in cols if c in present]
+                if sets:
+                    con.execute(f"UPDATE {table} SET {', '.join(sets)};")
+    # старі значення лишаються у вільних сторінках, поки файл не перебудовано
+    con.execute("VACUUM;")
+
+
+def scrub(obj: Any, salt: bytes, scrub_text: bool = False, parent: str = "") -> Any:
+    if isinstance(obj, dict):
+        out: Dict[str, Any] = {}
+        for k, v in obj.items():
+            if k in _DROP_KEYS:
+                continue
+            if k in _NAME_KEYS and isinstance(v, str):
+                out[k] = _pseudo_name(salt, v)
+            elif k == "id" and parent in _PERSON_KEYS and isinstance(v, int):
+                out[k] = _pseudo_id(salt, v)
+            elif k in ("text", "caption") and scrub_text and isinstance(v, str) and not v.startswith("/"):
+                # довжину лишаємо — вона впливає на розмір рендеру
+                out[k] = "x" * len(v)
+            else:
+                out[k] = scrub(v, salt, scrub_text, k)
+        return out
+    if isinstance(obj, list):
+        return [scrub(v, salt, scrub_text, parent) for v in obj]
+    return obj
+
+
+class UpdateRecorder:
+    def __init__(self, path: str, salt: str, scrub_text: bool = False,
+                 flush_every: int = 50, flush_interval: float = 5.0):
+        self.path = path
+        self.salt = salt.encode()
+        self.scrub_text = scrub_text
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buf: List[str] = []
+        self._last_flush = time.monotonic()
+        self.recorded = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @property
+    def start_db_path(self) -> str:
+        return self.path + ".start.db"
+
+    def snapshot_start_db(self, db_path: str):
+        """Псевдонімізована копія БД на момент початку запису — стартова точка для replay.py."""
+        if os.path.exists(self.start_db_path) or not os.path.exists(db_path):
+            return
+        # до кінця псевдонімізації копія лежить під тимчасовим іменем: сирі дані
+        # не опиняються поруч із логом навіть при падінні посередині
+        part = self.start_db_path + ".part"
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(part)
+        try:
+            src.backup(dst)
+            # копія успадковує WAL; поруч із логом лишаємо один самодостатній файл
+            dst.execute("PRAGMA journal_mode=DELETE;")
+            scrub_db(dst, self.salt, self.scrub_text)
+        except Exception:
+            dst.close()
+            os.remove(part)
+            raise
+        finally:
+            dst.close()
+            src.close()
+        os.replace(part, self.start_db_path)
+
+    def record(self, update: Dict[str, Any]):
+        rec = {"t": round(time.time(), 3), "u": scrub(update, self.salt, self.scrub_text)}
+        self._buf.append(json.dumps(rec, ensure_ascii=False, separators=(",", ":")))
+        self.recorded += 1
+        if len(self._buf) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buf:
+            return
+        data = ("\n".join(self._buf) + "\n").encode("utf-8")
+        self._buf.clear()
+        try:
+            with open(self.path, "ab") as f:
+                f.write(gzip.compress(data))
+        except OSError:
+            log.exception("update log write failed: %s", self.path)
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            # обірваний останній member
+            return
@@ -0,0 +1,182 @@
+# replay.py
+# Детермінований програвач логу апдейтів (recorder.py): свіжий Dispatcher
+# з bot.py, копія стартової БД, фейкова Telegram-сесія. Апдейти подаються
+# по одному в порядку запису — з оригінальними паузами (--speed 1),
+# прискорено (--speed 10) або без пауз (--speed 0, за замовчуванням).
+#
+#   python replay.py data/updates.log.gz
+#   python replay.py data/updates.log.gz --speed 5 --save-db /tmp/after.db
+#   python replay.py data/updates.log.gz --expect /tmp/before.db   # порівняти фінальний стан
+#
+# Після прогону друкує таймінги хендлерів і, з --expect, розбіжності
+# фінального стану БД (без полів, що залежать від часу / message_id).
+# Стартова БД і лог псевдонімізовані, а --expect зазвичай — справжня БД:
+# з --salt (або RECORD_SALT) її копія псевдонімізується тим самим salt і
+# порівнюється повністю, без salt колонки з даними людей пропускаються.
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import bench
+import recorder
+
+# колонки, що легітимно відрізняються між прогонами
+VOLATILE_COLUMNS = {
+    "created_at", "created_ts", "at", "at_ts", "published_message_id",
+    "status_changed_ts", "stale_notified_ts", "updated_ts",
+    # хеш рендеру картки — з ім'ям брокера, у псевдонімізованій БД інший
+    "published_hash",
+}
+# колонки, які recorder псевдонімізує; без salt їх не порівняти зі справжньою БД
+PERSON_COLUMNS = {"username", "user_id", "broker_username", "broker_user_id"}
+STATE_TABLES = {
+    "offers": "seq",
+    "status_events": "id",
+}
+
+
+def db_state(db_path: str, skip: frozenset = frozenset()) -> Dict[str, List[Tuple]]:
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    out: Dict[str, List[Tuple]] = {}
+    try:
+        for table, order in STATE_TABLES.items():
+            cols = [r["name"] for r in con.execute(f"PRAGMA table_info({table});")]
+            keep = [c for c in cols if c not in VOLATILE_COLUMNS and c not in skip]
+            if not keep:
+                continue
+            rows = con.execute(f"SELECT {', '.join(keep)} FROM {table} ORDER BY {order};").fetchall()
+            out[table] = [tuple(keep)] + [tuple(r) for r in rows]
+    finally:
+        con.close()
+    return out
+
+
+def diff_state(a: Dict[str, List[Tuple]], b: Dict[str, List[Tuple]], limit: int = 5) -> List[str]:
+    lines = []
+    for table in sorted(set(a) | set(b)):
+        ra, rb = a.get(table, []), b.get(table, [])
+        if not ra or not rb:
+            lines.append(f"{table}: present only in one database")
+            continue
+        if ra[0] != rb[0]:
+            lines.append(f"{table}: columns differ {ra[0]} vs {rb[0]}")
+            continue
+        cols = ra[0]
+        rows_a, rows_b = ra[1:], rb[1:]
+        if len(rows_a) != len(rows_b):
+            lines.append(f"{table}: {len(rows_a)} rows vs {len(rows_b)} expected")
+        shown = 0
+        for i, (x, y) in enumerate(zip(rows_a, rows_b)):
+            if x != y:
+                changed = {c: (vx, vy) for c, vx, vy in zip(cols, x, y) if vx != vy}
+                lines.append(f"{table}[{i}]: {changed}")
+                shown += 1
+                if shown >= limit:
+                    lines.append(f"{table}: … more differences")
+                    break
+    return lines
+
+
+async def replay(log_path: str, work_dir: str, start_db: Optional[str], speed: float) -> Dict[str, Any]:
+    db_path = os.path.join(work_dir, "database.db")
+    if start_db and os.path.exists(start_db):
+        shutil.copyfile(start_db, db_path)
+
+    h = bench.Harness(work_dir)
+    first_t: Optional[float] = None
+    wall0 = time.perf_counter()
+    for rec in recorder.read_log(log_path):
+        if speed > 0:
+            if first_t is None:
+                first_t = rec["t"]
+            due = (rec["t"] - first_t) / speed
+            delay = due - (time.perf_counter() - wall0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await h.feed(rec["u"])
+    wall = time.perf_counter() - wall0
+    # фінальний стан — лише після фонових задач, інакше він залежить від планувальника
+    await h.drain()
+    await h.bot.session.close()
+
+    return {
+        "updates": len(h.latencies),
+        "errors": h.errors,
+        "wall_s": wall,
+        "handlers": h.bot_mod.HANDLER_SECONDS.summary(),
+        "db": h.bot_mod.DB_SECONDS.summary(),
+        "db_path": db_path,
+    }
+
+
+def scrubbed_copy(db_path: str, dst_path: str, salt: str, scrub_text: bool) -> str:
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+        recorder.scrub_db(dst, salt.encode(), scrub_text)
+    finally:
+        dst.close()
+        src.close()
+    return dst_path
+
+
+def _print_timings(title: str, rows: List[Dict[str, Any]], label: str):
+    print(f"\n{title}")
+    print(f"  {'name':<28} {'count':>7} {'avg_ms':>9} {'p95_ms':>9} {'max_ms':>9}")
+    for r in sorted(rows, key=lambda r: r["sum"], reverse=True):
+        print(f"  {r['labels'][label]:<28} {r['count']:>7} {r['avg'] * 1000:>9.2f} "
+              f"{r['p95'] * 1000:>9.2f} {r['max'] * 1000:>9.2f}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Replay a recorded update log against a fresh Dispatcher")
+    ap.add_argument("log", help="updates.log.gz written by RECORD_UPDATES=1")
+    ap.add_argument("--db", help="starting database (default: <log>.start.db if present, else empty)")
+    ap.add_argument("--speed", type=float, default=0.0, help="0 = no pauses, 1 = original pace, N = N× faster")
+    ap.add_argument("--expect", help="database to compare the final state against")
+    ap.add_argument("--save-db", help="copy the final replayed database here")
+    ap.add_argument("--salt", default=os.getenv("RECORD_SALT"),
+                    help="RECORD_SALT of the recording: pseudonymize --expect the same way (default: $RECORD_SALT)")
+    ap.add_argument("--scrub-text", action="store_true", help="the recording was made with RECORD_SCRUB_TEXT=1")
+    args = ap.parse_args(argv)
+
+    start_db = args.db or (args.log + ".start.db")
+    with tempfile.TemporaryDirectory(prefix="replay_") as work_dir:
+        res = asyncio.run(replay(args.log, work_dir, start_db, args.speed))
+
+        print(f"replayed {res['updates']} updates in {res['wall_s']:.2f}s "
+              f"({res['updates'] / res['wall_s'] if res['wall_s'] else 0:.1f} upd/s), errors: {res['errors']}")
+        _print_timings("handlers", res["handlers"], "handler")
+        _print_timings("db calls", res["db"], "call")
+
+        if args.save_db:
+            shutil.copyfile(res["db_path"], args.save_db)
+
+        if args.expect:
+            if args.salt:
+                expect = scrubbed_copy(args.expect, os.path.join(work_dir, "expect.db"), args.salt, args.scrub_text)
+                skip = frozenset()
+            else:
+                expect, skip = args.expect, frozenset(PERSON_COLUMNS)
+                print("\nno --salt: person columns are not compared")
+            diffs = diff_state(db_state(res["db_path"], skip), db_state(expect, skip))
+            if diffs:
+                print("\n!!! FINAL STATE DIVERGES !!!")
+                for line in diffs:
+                    print("  " + line)
+                return 1
+            print("\nfinal state matches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
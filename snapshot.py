@@ -0,0 +1,131 @@
+# snapshot.py
+# Узгоджені копії БД "на момент часу" через SQLite backup API — для
+# експорту і резервних копій. Копія робиться окремим з'єднанням (не з
+# пулу бота) кроками по pages сторінок; між кроками потік засинає на
+# pause, тож записувач не чекає на весь файл. Якщо джерело змінилось
+# під час копіювання, SQLite починає заново; після max_restarts рестартів
+# копіюємо одним кроком (у WAL читач записувачу не заважає).
+#
+# Функції синхронні — з бота викликаються через asyncio.to_thread.
+#
+#   with snapshot.opened(db_path, tmp_dir) as con:   # читання з копії
+#       con.execute("SELECT ...")
+#   snapshot.backup(db_path, backup_dir, "oranda", keep=7)   # -> .db.gz
+
+import os
+import re
+import gzip
+import time
+import shutil
+import sqlite3
+import tempfile
+import contextlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+
+class _Restarted(Exception):
+    pass
+
+
+def copy(src_path: str, dst_path: str, pages: int = 256, pause: float = 0.005,
+         max_restarts: int = 3) -> Dict[str, Any]:
+    """Копіює БД src_path у dst_path. Повертає статистику: pages, steps, restarts, one_step."""
+    stats = {"pages": 0, "steps": 0, "restarts": 0, "one_step": False}
+    last = {"remaining": None}
+
+    def progress(status: int, remaining: int, total: int):
+        stats["steps"] += 1
+        stats["pages"] = total
+        # remaining зріс — SQLite почав заново (джерело змінилось)
+        if last["remaining"] is not None and remaining > last["remaining"]:
+            stats["restarts"] += 1
+            if stats["restarts"] > max_restarts:
+                raise _Restarted()
+        last["remaining"] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    src = sqlite3.connect(src_path)
+    try:
+        dst = sqlite3.connect(dst_path)
+        try:
+            try:
+                src.backup(dst, pages=pages, progress=progress)
+            except _Restarted:
+                stats["one_step"] = True
+                src.backup(dst, pages=-1)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return stats
+
+
+def _temp_db(folder: str, prefix: str) -> str:
+    os.makedirs(folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".db", dir=folder)
+    os.close(fd)
+    return path
+
+
+def _remove_db(path: str):
+    for p in (path, path + "-journal", path + "-wal", path + "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(p)
+
+
+@contextlib.contextmanager
+def opened(src_path: str, tmp_dir: str, **kwargs) -> Iterator[sqlite3.Connection]:
+    """Тимчасова копія БД, відкрита для читання; файл видаляється на виході."""
+    path = _temp_db(tmp_dir, ".snapshot-")
+    try:
+        copy(src_path, path, **kwargs)
+        con = sqlite3.connect(path)
+        con.row_factory = sqlite3.Row
+        try:
+            yield con
+        finally:
+            con.close()
+    finally:
+        _remove_db(path)
+
+
+def backup(src_path: str, dest_dir: str, prefix: str, keep: int = 7, **kwargs) -> str:
+    """Стиснута копія <prefix>-YYYYmmdd-HHMMSS.db.gz у dest_dir; старші за keep останніх — видаляються."""
+    path = os.path.join(dest_dir, f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db.gz")
+    tmp = _temp_db(dest_dir, ".backup-")
+    try:
+        copy(src_path, tmp, **kwargs)
+        # копія успадковує WAL; у .db.gz кладемо один самодостатній файл
+        con = sqlite3.connect(tmp)
+        con.execute("PRAGMA journal_mode=DELETE;")
+        con.close()
+        with open(tmp, "rb") as f, gzip.open(path + ".part", "wb", compresslevel=6) as gz:
+            shutil.copyfileobj(f, gz, 1 << 20)
+        os.replace(path + ".part", path)
+    finally:
+        _remove_db(tmp)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path + ".part")
+    rotate(dest_dir, prefix, keep)
+    return path
+
+
+def list_backups(dest_dir: str, prefix: str) -> List[str]:
+    """Резервні копії агенції, від старих до нових (ім'я містить час)."""
+    try:
+        names = os.listdir(dest_dir)
+    except FileNotFoundError:
+        return []
+    pattern = re.compile(re.escape(prefix) + r"-\d{8}-\d{6}\.db\.gz")
+    return sorted(os.path.join(dest_dir, n) for n in names if pattern.fullmatch(n))
+
+
+def rotate(dest_dir: str, prefix: str, keep: int) -> List[str]:
+    """Лишає keep найновіших копій, решту видаляє. Повертає видалені шляхи."""
+    old = list_backups(dest_dir, prefix)[:-keep] if keep > 0 else []
+    for p in old:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(p)
+    return old
@@ -0,0 +1,81 @@
+# suggest.py
+# Підказки для вільних полів майстра (вулиця / місто / район): значення з
+# наявних пропозицій і їх частоти в пам'яті. Ключ — нормалізоване і
+# транслітероване значення (dedup.normalize + dedup.latin), тож
+# "Bratislava", "bratislava" і "Братислава" — один ключ, а показується
+# найчастіший варіант написання. Ключі відсортовані: пошук за префіксом —
+# bisect, додавання — insort; БД не читається ні на вставці, ні на пошуку.
+#
+#   idx = PrefixIndex()
+#   idx.add("Bratislava"); idx.add("Братислава")
+#   idx.complete("бра")   # ["Bratislava"]
+
+import bisect
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import dedup
+
+
+def key(value: Optional[str]) -> str:
+    return dedup.latin(dedup.normalize(value))
+
+
+class PrefixIndex:
+    __slots__ = ("_keys", "_variants", "_totals")
+
+    def __init__(self):
+        self._keys: List[str] = []
+        # ключ -> написання -> к-сть; ключ -> сума
+        self._variants: Dict[str, Counter] = {}
+        self._totals: Dict[str, int] = {}
+
+    def add(self, value: Optional[str], n: int = 1):
+        value = (value or "").strip()
+        k = key(value)
+        if not k or n <= 0:
+            return
+        if k not in self._variants:
+            bisect.insort(self._keys, k)
+            self._variants[k] = Counter()
+            self._totals[k] = 0
+        self._variants[k][value] += n
+        self._totals[k] += n
+
+    def remove(self, value: Optional[str]):
+        value = (value or "").strip()
+        k = key(value)
+        variants = self._variants.get(k)
+        if not variants or variants[value] <= 0:
+            return
+        variants[value] -= 1
+        if variants[value] == 0:
+            del variants[value]
+        self._totals[k] -= 1
+        if self._totals[k] == 0:
+            del self._variants[k], self._totals[k]
+            self._keys.pop(bisect.bisect_left(self._keys, k))
+
+    def _display(self, k: str) -> str:
+        return self._variants[k].most_common(1)[0][0]
+
+    def canonical(self, value: Optional[str]) -> Optional[str]:
+        """Найчастіше написання того самого значення; None — значення нове."""
+        k = key(value)
+        return self._display(k) if k in self._variants else None
+
+    def _prefixed(self, prefix: str) -> Iterable[Tuple[int, str]]:
+        i = bisect.bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix):
+            k = self._keys[i]
+            yield self._totals[k], k
+            i += 1
+
+    def complete(self, prefix: Optional[str], limit: int = 6) -> List[str]:
+        """Найчастіші значення, що починаються з prefix; порожній prefix — просто найчастіші."""
+        top = heapq.nsmallest(limit, self._prefixed(key(prefix)), key=lambda t: (-t[0], t[1]))
+        return [self._display(k) for _, k in top]
+
+    def __len__(self) -> int:
+        return len(self._keys)
@@ -0,0 +1,236 @@
+# tenants.py
+# Кілька агенцій в одному процесі бота: у кожної свій SQLite-файл, група,
+# списки дозволених / адмінів і власні налаштування. Поточна агенція —
+# у contextvar (виставляє middleware за чатом або користувачем апдейту,
+# фонові задачі — явно через use()). З'єднання з БД тримаються в
+# обмеженому LRU-пулі з закриттям за простоєм.
+#
+# tenants.json:
+#   {"tenants": [
+#     {"id": "oranda", "group_chat_id": -1001234567890,
+#      "allowed_user_ids": [1, 2], "admin_user_ids": [1],
+#      "chat_ids": [-1009876543210], "digest_time": "09:00", "stale_after_days": 30}
+#   ]}
+# db_path за замовчуванням — <DATA_DIR>/<id>.db.
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+log = logging.getLogger("bot.tenants")
+
+
+class Tenant:
+    def __init__(self, tenant_id: str, db_path: str, group_chat_id: Optional[int] = None,
+                 allowed_user_ids: Iterable[int] = (), admin_user_ids: Iterable[int] = (),
+                 chat_ids: Iterable[int] = (), digest_time: str = "", stale_after_days: int = 0):
+        self.id = tenant_id
+        self.db_path = db_path
+        self.group_chat_id = group_chat_id
+        self.allowed_user_ids = set(allowed_user_ids)
+        self.admin_user_ids = set(admin_user_ids)
+        # інші чати агенції (групи маршрутів), крім group_chat_id
+        self.chat_ids = set(chat_ids)
+        self.digest_time = digest_time
+        self.stale_after_days = stale_after_days
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.id!r})"
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_tenants(path: str, data_dir: str, defaults: Dict[str, Any]) -> List[Tenant]:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    out = []
+    for item in raw.get("tenants", []):
+        tid = str(item["id"])
+        out.append(Tenant(
+            tid,
+            db_path=item.get("db_path") or os.path.join(data_dir, f"{tid}.db"),
+            group_chat_id=_int_or_none(item.get("group_chat_id")),
+            allowed_user_ids=[int(x) for x in item.get("allowed_user_ids", [])],
+            admin_user_ids=[int(x) for x in item.get("admin_user_ids", [])],
+            chat_ids=[int(x) for x in item.get("chat_ids", [])],
+            digest_time=str(item.get("digest_time", defaults.get("digest_time", ""))),
+            stale_after_days=int(item.get("stale_after_days", defaults.get("stale_after_days", 0))),
+        ))
+    if not out:
+        raise ValueError(f"{path}: no tenants")
+    return out
+
+
+CURRENT: contextvars.ContextVar[Optional[Tenant]] = contextvars.ContextVar("tenant", default=None)
+
+
+class TenantRegistry:
+    def __init__(self, tenants: List[Tenant], single: bool = False):
+        self.tenants = {t.id: t for t in tenants}
+        # single — режим без tenants.json: єдина агенція завжди поточна
+        self.single = single
+        self._by_chat: Dict[int, Tenant] = {}
+        self._by_user: Dict[int, Tenant] = {}
+        for t in tenants:
+            if t.group_chat_id is not None:
+                self._by_chat.setdefault(t.group_chat_id, t)
+            for chat_id in t.chat_ids:
+                self._by_chat.setdefault(chat_id, t)
+            for uid in t.admin_user_ids | t.allowed_user_ids:
+                self._by_user.setdefault(uid, t)
+
+    def all(self) -> List[Tenant]:
+        return list(self.tenants.values())
+
+    def bind_chat(self, chat_id: int, tenant: Tenant):
+        self._by_chat.setdefault(chat_id, tenant)
+
+    def bind_user(self, user_id: int, tenant: Tenant):
+        self._by_user.setdefault(user_id, tenant)
+
+    def unbind_user(self, user_id: int, tenant: Tenant):
+        if self._by_user.get(user_id) is tenant and user_id not in (tenant.allowed_user_ids | tenant.admin_user_ids):
+            del self._by_user[user_id]
+
+    def resolve(self, chat_id: Optional[int], user_id: Optional[int]) -> Optional[Tenant]:
+        """Група агенції важливіша за користувача (маклер може бути в кількох)."""
+        if self.single:
+            return next(iter(self.tenants.values()))
+        if chat_id is not None and chat_id in self._by_chat:
+            return self._by_chat[chat_id]
+        if user_id is not None:
+            return self._by_user.get(user_id)
+        return None
+
+    def current(self) -> Optional[Tenant]:
+        t = CURRENT.get()
+        if t is None and self.single:
+            return next(iter(self.tenants.values()))
+        return t
+
+
+@contextlib.contextmanager
+def use(tenant: Optional[Tenant]) -> Iterator[Optional[Tenant]]:
+    token = CURRENT.set(tenant)
+    try:
+        yield tenant
+    finally:
+        CURRENT.reset(token)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    close() повертає з'єднання в пул. Одне з'єднання на файл ділять вкладені
+    хелпери, тож кожен get() рахується, і недозавершена транзакція
+    відкочується лише на close() зовнішнього — інакше close() вкладеного
+    хелпера мовчки відкотив би незакомічені записи того, хто його викликав.
+    """
+
+    refs = 0
+
+    def close(self):
+        if self.refs > 0:
+            self.refs -= 1
+        if self.refs == 0 and self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """
+    LRU з'єднань по шляху до БД, не більше max_open; sweep() закриває ті,
+    що простоюють довше idle_seconds. Пул обслуговує лише потік, що його
+    створив (цикл подій): там між db_conn() і close() немає await, тож одне
+    з'єднання на файл безпечне; вкладені get()/close() рахуються (refs), а
+    scope() знімає get() хелпера, що впав до close(). Інші потоки (to_thread) отримують звичайне
+    з'єднання і закривають його самі.
+    """
+
+    def __init__(self, max_open: int = 32, idle_seconds: float = 300.0):
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self.owner = threading.get_ident()
+        self._open: "OrderedDict[str, PooledConnection]" = OrderedDict()
+        self._used: Dict[str, float] = {}
+        self.opened = 0
+        self.evicted = 0
+
+    def get(self, path: str) -> sqlite3.Connection:
+        if threading.get_ident() != self.owner:
+            con = sqlite3.connect(path)
+            con.row_factory = sqlite3.Row
+            return con
+
+        con = self._open.get(path)
+        if con is None:
+            con = sqlite3.connect(path, factory=PooledConnection)
+            con.row_factory = sqlite3.Row
+            self._open[path] = con
+            self.opened += 1
+            # з'єднання, взяті зовнішніми хелперами (refs > 0), не витісняємо
+            idle = [p for p, c in self._open.items() if c.refs == 0 and p != path]
+            for old_path in idle[:max(0, len(self._open) - self.max_open)]:
+                old = self._open.pop(old_path)
+                self._used.pop(old_path, None)
+                old.really_close()
+                self.evicted += 1
+        else:
+            self._open.move_to_end(path)
+        self._used[path] = time.monotonic()
+        con.refs += 1
+        return con
+
+    @contextlib.contextmanager
+    def scope(self) -> Iterator[None]:
+        """
+        Межа хелпера БД: якщо він впав, не дійшовши до close(), його get()
+        знімаються, а транзакція зовнішнього рівня відкочується як на close().
+        """
+        if threading.get_ident() != self.owner:
+            yield
+            return
+        refs = {path: con.refs for path, con in self._open.items()}
+        try:
+            yield
+        except BaseException:
+            for path, con in list(self._open.items()):
+                entered = refs.get(path, 0)
+                if con.refs > entered:
+                    con.refs = entered + 1
+                    con.close()
+            raise
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        idle = [p for p, t in self._used.items()
+                if now - t > self.idle_seconds and self._open[p].refs == 0]
+        for p in idle:
+            con = self._open.pop(p, None)
+            self._used.pop(p, None)
+            if con is not None:
+                con.really_close()
+                self.evicted += 1
+        return len(idle)
+
+    def close_all(self):
+        for con in self._open.values():
+            con.really_close()
+        self._open.clear()
+        self._used.clear()
+
+    def __len__(self) -> int:
+        return len(self._open)